@@ -9,13 +9,75 @@ import fnmatch
 import logging
 import markdown
 import mimetypes
+import mmap
+import multiprocessing
 import os
 import re
 import textwrap
 
-from multiqc.utils import report, config, util_functions
+from multiqc.utils import report, config, util_functions, parse_cache
 logger = logging.getLogger(__name__)
 
+class LogFileLines(object):
+    """
+    Lines of an open text file, without line endings (as with str.splitlines()).
+    Returned by find_log_files(stream='lines'). Lines are read as they are
+    iterated over, and each new loop starts again from the beginning of the
+    file - so parsers can make more than one pass without holding the whole
+    file in memory. Only loop over the lines once at a time.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.started = False
+
+    def __iter__(self):
+        if self.started:
+            self.fh.seek(0)
+        self.started = True
+        for l in self.fh:
+            yield l.rstrip('\n')
+
+    def read(self):
+        """ Return the whole file contents, for formats that can't be parsed line by line """
+        if self.started:
+            self.fh.seek(0)
+        self.started = True
+        return self.fh.read()
+
+def log_file_chunks(fh, chunk_size=None):
+    """ Yield the contents of an open file in chunks of config.log_stream_chunk_size """
+    if chunk_size is None:
+        chunk_size = config.log_stream_chunk_size
+    while True:
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def parse_in_workers(parse_fn, files, workers):
+    """
+    Call parse_fn for each file dict in a pool of worker processes, returning
+    the results in the same order. parse_fn must be picklable (a module-level
+    function, or a functools.partial of one). Falls back to parsing in this
+    process if worker processes can't be started here.
+    """
+    if len(files) > 1 and not multiprocessing.current_process().daemon:
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except ValueError:
+            logger.debug("Can't fork worker processes on this platform, parsing files one at a time")
+        else:
+            workers = min(workers, len(files))
+            logger.debug("Parsing {} files using {} worker processes".format(len(files), workers))
+            pool = ctx.Pool(workers)
+            try:
+                return pool.map(parse_fn, files, chunksize=max(1, len(files) // (workers * 4)))
+            finally:
+                pool.close()
+                pool.join()
+    return [parse_fn(f) for f in files]
+
 class BaseMultiqcModule(object):
 
     def __init__(self, name='base', anchor='base', target=None, href=None, info=None, comment=None, extra=None,
@@ -62,17 +124,24 @@ class BaseMultiqcModule(object):
 
         self.sections = list()
 
-    def find_log_files(self, sp_key, filecontents=True, filehandles=False):
+    def find_log_files(self, sp_key, filecontents=True, filehandles=False, stream=None):
         """
         Return matches log files of interest.
         :param sp_key: Search pattern key specified in config
         :param filehandles: Set to true to return a file handle instead of slurped file contents
+        :param stream: Read the file as it is parsed instead of slurping the contents:
+                       'lines' - a LogFileLines iterator of lines without line endings
+                       'chunks' - a generator of strings of config.log_stream_chunk_size characters
+                       'mmap' - a read-only mmap.mmap of the file bytes
         :return: Yields a dict with filename (fn), root directory (root), cleaned sample name
-                 generated from the filename (s_name) and either the file contents or file handle
-                 for the current matched file (f).
+                 generated from the filename (s_name) and either the file contents, file handle
+                 or stream for the current matched file (f).
                  As yield is used, the results can be iterated over without loading all files at once
         """
 
+        if stream not in (None, 'lines', 'chunks', 'mmap'):
+            raise ValueError("Unrecognised find_log_files() stream type: {}".format(stream))
+
         # Pick up path filters if specified.
         # Allows modules to be called multiple times with different sets of files
         path_filters = getattr(self, 'mod_cust_config', {}).get('path_filters')
@@ -116,24 +185,10 @@ class BaseMultiqcModule(object):
 
             # Make a sample name from the filename
             f['s_name'] = self.clean_s_name(f['fn'], f['root'])
-            if filehandles or filecontents:
+            if filehandles or filecontents or stream:
                 try:
-                    # Custom content module can now handle image files
-                    (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
-                    if ftype is not None and ftype.startswith('image'):
-                        with io.open (os.path.join(f['root'],f['fn']), "rb") as fh:
-                            # always return file handles
-                            f['f'] = fh
-                            yield f
-                    else:
-                        # Everything else - should be all text files
-                        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
-                            if filehandles:
-                                f['f'] = fh
-                                yield f
-                            elif filecontents:
-                                f['f'] = fh.read()
-                                yield f
+                    for f['f'] in self._open_log_file(f, filehandles, stream):
+                        yield f
                 except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
                     if config.report_readerrors:
                         logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f['fn'], e))
@@ -141,6 +196,120 @@ class BaseMultiqcModule(object):
             else:
                 yield f
 
+    def _open_log_file(self, f, filehandles=False, stream=None):
+        """
+        Open a file found by find_log_files() and yield what should be given
+        to the module as f['f'], closing the file once the module is done with it
+        """
+        fpath = os.path.join(f['root'], f['fn'])
+        # Custom content module can now handle image files
+        (ftype, encoding) = mimetypes.guess_type(fpath)
+        if ftype is not None and ftype.startswith('image'):
+            with io.open (fpath, "rb") as fh:
+                # always return file handles
+                yield fh
+        elif stream == 'mmap':
+            with io.open (fpath, "rb") as fh:
+                # Empty files can't be memory-mapped
+                if os.fstat(fh.fileno()).st_size == 0:
+                    yield b''
+                else:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        yield mm
+                    finally:
+                        mm.close()
+        else:
+            # Everything else - should be all text files
+            with io.open (fpath, "r", encoding='utf-8') as fh:
+                if stream == 'lines':
+                    yield LogFileLines(fh)
+                elif stream == 'chunks':
+                    yield log_file_chunks(fh)
+                elif filehandles:
+                    yield fh
+                else:
+                    yield fh.read()
+
+    def find_parsed_log_files(self, sp_key, parse_fn, filecontents=True, filehandles=False, stream=None, parallel=False):
+        """
+        Return matched log files of interest, parsed by a module function.
+        With --incremental, files that haven't changed since the previous run aren't
+        read or parsed again - the parsed data saved in that run is returned instead.
+        :param sp_key: Search pattern key specified in config
+        :param parse_fn: Function that takes the file dict from find_log_files() and returns
+                         the parsed data. This should only depend on the file, not on
+                         anything else in the module, and must be JSON serialisable.
+                         Results of None are not saved.
+        :param filecontents: Set to false to not read the file before calling parse_fn
+        :param filehandles: Set to true to pass a file handle instead of slurped file contents
+        :param stream: Pass a stream of the file contents instead, see find_log_files()
+        :param parallel: Parse files in config.parse_workers worker processes. Only used with
+                         filecontents=False, so parse_fn must open the file itself. It must
+                         also be picklable - a module-level function, not a module method.
+                         All files are parsed before the first one is yielded.
+        :return: Yields the same dicts as find_log_files(), with parsed data in 'parsed'
+        """
+        if parallel and config.parse_workers > 1 and not (filecontents or filehandles or stream):
+            for f in self._find_parsed_log_files_in_workers(sp_key, parse_fn):
+                yield f
+            return
+
+        if not config.incremental:
+            for f in self.find_log_files(sp_key, filecontents, filehandles, stream):
+                f['parsed'] = parse_fn(f)
+                yield f
+            return
+
+        fp = parse_cache.fingerprint(self.anchor, sp_key, getattr(self, 'mod_cust_config', None))
+        for f in self.find_log_files(sp_key, filecontents=False):
+            parsed = parse_cache.get_parsed(fp, f)
+            if parsed is not None:
+                f['parsed'] = parsed
+                yield f
+                continue
+            if filehandles or filecontents or stream:
+                # Only errors opening the file are skipped, like find_log_files() -
+                # errors from parse_fn are raised whether or not this is an incremental run
+                opened = self._open_log_file(f, filehandles, stream)
+                try:
+                    f['f'] = next(opened)
+                except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+                    if config.report_readerrors:
+                        logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f['fn'], e))
+                    continue
+                try:
+                    f['parsed'] = parse_fn(f)
+                finally:
+                    opened.close()
+            else:
+                f['parsed'] = parse_fn(f)
+            if f['parsed'] is not None:
+                parse_cache.add_parsed(fp, f, f['parsed'])
+            yield f
+
+    def _find_parsed_log_files_in_workers(self, sp_key, parse_fn):
+        """ find_parsed_log_files(), parsing all files up front in a pool of worker processes """
+        fp = None
+        if config.incremental:
+            fp = parse_cache.fingerprint(self.anchor, sp_key, getattr(self, 'mod_cust_config', None))
+        found_files = list()
+        unparsed_files = list()
+        for f in self.find_log_files(sp_key, filecontents=False):
+            f['parsed'] = parse_cache.get_parsed(fp, f) if fp is not None else None
+            if f['parsed'] is None:
+                unparsed_files.append(f)
+            found_files.append(f)
+
+        for f, parsed in zip(unparsed_files, parse_in_workers(parse_fn, unparsed_files, config.parse_workers)):
+            f['parsed'] = parsed
+            if fp is not None and parsed is not None:
+                parse_cache.add_parsed(fp, f, parsed)
+
+        for f in found_files:
+            report.last_found_file = os.path.join(f['root'], f['fn'])
+            yield f
+
     def add_section(self, name=None, anchor=None, description='', comment='', helptext='', plot='', content='', autoformat=True, autoformat_type='markdown'):
         """ Add a section to the module report output """
 
@@ -363,7 +532,7 @@ class BaseMultiqcModule(object):
         # Generate a unique filename if the file already exists (running module multiple times)
         i = 1
         base_fn = fn
-        while fn in report.saved_raw_data:
+        while report.get_state().saved_raw_data_exists(fn):
             fn = '{}_{}'.format(base_fn, i)
             i += 1
 
@@ -86,12 +86,19 @@ def custom_module_classes():
     bm = BaseMultiqcModule()
     for k in search_patterns:
         num_sp_found_files = 0
-        for f in bm.find_log_files(k):
+        for f in bm.find_log_files(k, stream='lines'):
             num_sp_found_files += 1
             # Handle any exception without messing up for remaining custom content files
             try:
                 f_extension = os.path.splitext(f['fn'])[1]
 
+                # YAML, JSON and HTML files can't be streamed, so have to be read all at once
+                if f_extension in ['.yaml', '.yml', '.json', '.html']:
+                    if f.get('filesize', 0) > config.log_filesize_limit:
+                        log.warning("Skipping '{}' as it is larger than log_filesize_limit".format(f['fn']))
+                        continue
+                    f['f'] = f['f'].read()
+
                 # YAML and JSON files are the easiest
                 parsed_data = None
                 if f_extension == '.yaml' or f_extension == '.yml':
@@ -407,7 +414,7 @@ class MultiqcModule(BaseMultiqcModule):
 def _find_file_header(f):
     # Collect commented out header lines
     hlines = []
-    for l in f['f'].splitlines():
+    for l in f['f']:
         if l.startswith('#'):
             hlines.append(l[1:])
     if len(hlines) == 0:
@@ -451,7 +458,7 @@ def _guess_file_format(f):
     commas = []
     spaces = []
     j = 0
-    for l in f['f'].splitlines():
+    for l in f['f']:
         if not l.startswith('#'):
             j += 1
             tabs.append(len(l.split("\t")))
@@ -491,19 +498,20 @@ def _parse_txt(f, conf):
         sep = ","
     if conf['file_format'] == 'tsv':
         sep = "\t"
-    lines = f['f'].splitlines()
     d = []
 
     # Check for special case - HTML
     if conf.get('plot_type') == 'html':
-        for l in lines:
+        for l in f['f']:
             if l and not l.startswith('#'):
                 d.append(l)
         return ("\n".join(d), conf)
 
     # Not HTML, need to parse data
     ncols = None
-    for l in lines:
+    num_lines = 0
+    for l in f['f']:
+        num_lines += 1
         if l and not l.startswith('#'):
             sections = l.split(sep)
             d.append(sections)
@@ -539,7 +547,7 @@ def _parse_txt(f, conf):
         return (data, conf)
 
     # Heatmap: Number of headers == number of lines
-    if conf.get('plot_type') is None and first_row_str == len(lines) and all_numeric:
+    if conf.get('plot_type') is None and first_row_str == num_lines and all_numeric:
         conf['plot_type'] = 'heatmap'
     if conf.get('plot_type') == 'heatmap':
         conf['xcats'] = d[0][1:]
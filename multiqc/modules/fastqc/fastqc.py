@@ -12,6 +12,7 @@
 
 from __future__ import print_function
 from collections import OrderedDict
+import functools
 import io
 import json
 import logging
@@ -21,12 +22,128 @@ import zipfile
 
 from multiqc import config
 from multiqc.plots import linegraph, bargraph, heatmap
-from multiqc.modules.base_module import BaseMultiqcModule
+from multiqc.modules.base_module import BaseMultiqcModule, LogFileLines
 from multiqc.utils import report
 
 # Initialise the logger
 log = logging.getLogger(__name__)
 
+def fastqc_zip_s_name(f):
+    """ Sample name for a FastQC zip file, from the filename """
+    s_name = f['fn']
+    if s_name.endswith('_fastqc.zip'):
+        s_name = s_name[:-11]
+    return s_name
+
+def parse_fastqc_zip(f, skip_s_names=()):
+    """ Parse the fastqc_data.txt file inside a FastQC zip file, streaming it
+    line by line instead of decompressing it into one string """
+    # Don't bother if we already have this report - parsing zip files is slow..
+    if fastqc_zip_s_name(f) in skip_s_names:
+        return None
+    try:
+        fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
+    except Exception as e:
+        log.warning("Couldn't read '{}' - Bad zip file".format(f['fn']))
+        log.debug("Bad zip file error:\n{}".format(e))
+        return None
+    # FastQC zip files should have just one directory inside, containing report
+    d_name = fqc_zip.namelist()[0]
+    try:
+        with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
+            return parse_fastqc_report(LogFileLines(io.TextIOWrapper(fh, encoding='utf8')))
+    except KeyError:
+        log.warning("Error - can't find fastqc_raw_data.txt in {}".format(f))
+    return None
+
+def parse_fastqc_report(file_lines):
+    """ Takes the lines of a fastq_data.txt file and parses out required
+    statistics and data. Returns a dict with the section data, statuses,
+    original filename and the order of duplication keys. Doesn't touch
+    the module, so that results can be reused with --incremental and
+    files can be parsed in worker processes. """
+
+    parsed = { 'statuses': dict(), 'filename': None, 'dup_keys': list() }
+
+    # Parse the report
+    section = None
+    s_headers = None
+    for l in file_lines:
+        # Make the sample name from the input filename if we find it
+        if parsed['filename'] is None:
+            fn_search = re.search(r"Filename\s+(.+)", l)
+            if fn_search:
+                parsed['filename'] = fn_search.group(1)
+
+        if l == '>>END_MODULE':
+            section = None
+            s_headers = None
+        elif l.startswith('>>'):
+            (section, status) = l[2:].split("\t", 1)
+            section = section.lower().replace(' ', '_')
+            parsed['statuses'][section] = status
+        elif section is not None:
+            if l.startswith('#'):
+                s_headers = l[1:].split("\t")
+                # Special case: Total Deduplicated Percentage header line
+                if s_headers[0] == 'Total Deduplicated Percentage':
+                    parsed['basic_statistics'].append({
+                        'measure': 'total_deduplicated_percentage',
+                        'value': float(s_headers[1])
+                    })
+                else:
+                    # Special case: Rename dedup header in old versions of FastQC (v10)
+                    if s_headers[1] == 'Relative count':
+                        s_headers[1] = 'Percentage of total'
+                    s_headers = [s.lower().replace(' ', '_') for s in s_headers]
+                    parsed[section] = list()
+
+            elif s_headers is not None:
+                s = l.split("\t")
+                row = dict()
+                for (i, v) in enumerate(s):
+                    v.replace('NaN','0')
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        pass
+                    row[s_headers[i]] = v
+                parsed[section].append(row)
+                # Special case - need to remember order of duplication keys
+                if section == 'sequence_duplication_levels':
+                    try:
+                        parsed['dup_keys'].append(float(s[0]))
+                    except ValueError:
+                        parsed['dup_keys'].append(s[0])
+
+    # Tidy up the Basic Stats
+    parsed['basic_statistics'] = {d['measure']: d['value'] for d in parsed['basic_statistics']}
+
+    # Calculate the average sequence length (Basic Statistics gives a range)
+    length_bp = 0
+    total_count = 0
+    for d in parsed.get('sequence_length_distribution', {}):
+        length_bp += d['count'] * avg_bp_from_range(d['length'])
+        total_count += d['count']
+    if total_count > 0:
+        parsed['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+
+    return parsed
+
+def avg_bp_from_range(bp):
+    """ Helper function - FastQC often gives base pair ranges (eg. 10-15)
+    which are not helpful when plotting. This returns the average from such
+    ranges as an int, which is helpful. If not a range, just returns the int """
+
+    try:
+        if '-' in bp:
+            maxlen = float(bp.split("-",1)[1])
+            minlen = float(bp.split("-",1)[0])
+            bp = ((maxlen - minlen)/2) + minlen
+    except TypeError:
+        pass
+    return(int(bp))
+
 class MultiqcModule(BaseMultiqcModule):
 
     def __init__(self):
@@ -40,33 +157,21 @@ class MultiqcModule(BaseMultiqcModule):
         self.fastqc_data = dict()
 
         # Find and parse unzipped FastQC reports
-        for f in self.find_log_files('fastqc/data'):
+        for f in self.find_parsed_log_files('fastqc/data', self.parse_fastqc_data_file, stream='lines'):
             s_name = self.clean_s_name(os.path.basename(f['root']), os.path.dirname(f['root']))
-            self.parse_fastqc_report(f['f'], s_name, f)
+            self.add_fastqc_report(f['parsed'], s_name, f)
 
         # Find and parse zipped FastQC reports
-        for f in self.find_log_files('fastqc/zip', filecontents=False):
-            s_name = f['fn']
-            if s_name.endswith('_fastqc.zip'):
-                s_name = s_name[:-11]
-            # Skip if we already have this report - parsing zip files is slow..
+        # Zip files can be parsed in parallel, skipping any samples already found above
+        parse_zip_fn = functools.partial(parse_fastqc_zip, skip_s_names=frozenset(self.fastqc_data.keys()))
+        for f in self.find_parsed_log_files('fastqc/zip', parse_zip_fn, filecontents=False, parallel=True):
+            s_name = fastqc_zip_s_name(f)
+            # Skip if we already have this report
             if s_name in self.fastqc_data.keys():
                 log.debug("Skipping '{}' as already parsed '{}'".format(f['fn'], s_name))
                 continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
-            except Exception as e:
-                log.warning("Couldn't read '{}' - Bad zip file".format(f['fn']))
-                log.debug("Bad zip file error:\n{}".format(e))
-                continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
-                    r_data = fh.read().decode('utf8')
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
-                log.warning("Error - can't find fastqc_raw_data.txt in {}".format(f))
+            if f['parsed'] is not None:
+                self.add_fastqc_report(f['parsed'], s_name, f)
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -118,78 +223,23 @@ class MultiqcModule(BaseMultiqcModule):
         self.adapter_content_plot()
         self.status_heatmap()
 
-    def parse_fastqc_report(self, file_contents, s_name=None, f=None):
-        """ Takes contents from a fastq_data.txt file and parses out required
-        statistics and data. Returns a dict with keys 'stats' and 'data'.
-        Data is for plotting graphs, stats are for top table. """
+    def parse_fastqc_data_file(self, f):
+        """ Parse an unzipped fastqc_data.txt file """
+        return parse_fastqc_report(f['f'])
 
-        # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = self.clean_s_name(fn_search.group(1) , f['root'])
+    def add_fastqc_report(self, parsed, s_name, f):
+        """ Add the parsed data from one FastQC report to the module """
+
+        # Make the sample name from the input filename if we found it
+        if parsed['filename'] is not None:
+            s_name = self.clean_s_name(parsed['filename'], f['root'])
 
         if s_name in self.fastqc_data.keys():
             log.debug("Duplicate sample name found! Overwriting: {}".format(s_name))
         self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = { 'statuses': dict() }
-
-        # Parse the report
-        section = None
-        s_headers = None
-        self.dup_keys = []
-        for l in file_contents.splitlines():
-            if l == '>>END_MODULE':
-                section = None
-                s_headers = None
-            elif l.startswith('>>'):
-                (section, status) = l[2:].split("\t", 1)
-                section = section.lower().replace(' ', '_')
-                self.fastqc_data[s_name]['statuses'][section] = status
-            elif section is not None:
-                if l.startswith('#'):
-                    s_headers = l[1:].split("\t")
-                    # Special case: Total Deduplicated Percentage header line
-                    if s_headers[0] == 'Total Deduplicated Percentage':
-                        self.fastqc_data[s_name]['basic_statistics'].append({
-                            'measure': 'total_deduplicated_percentage',
-                            'value': float(s_headers[1])
-                        })
-                    else:
-                        # Special case: Rename dedup header in old versions of FastQC (v10)
-                        if s_headers[1] == 'Relative count':
-                            s_headers[1] = 'Percentage of total'
-                        s_headers = [s.lower().replace(' ', '_') for s in s_headers]
-                        self.fastqc_data[s_name][section] = list()
-
-                elif s_headers is not None:
-                    s = l.split("\t")
-                    row = dict()
-                    for (i, v) in enumerate(s):
-                        v.replace('NaN','0')
-                        try:
-                            v = float(v)
-                        except ValueError:
-                            pass
-                        row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
-                    # Special case - need to remember order of duplication keys
-                    if section == 'sequence_duplication_levels':
-                        try:
-                            self.dup_keys.append(float(s[0]))
-                        except ValueError:
-                            self.dup_keys.append(s[0])
-
-        # Tidy up the Basic Stats
-        self.fastqc_data[s_name]['basic_statistics'] = {d['measure']: d['value'] for d in self.fastqc_data[s_name]['basic_statistics']}
-
-        # Calculate the average sequence length (Basic Statistics gives a range)
-        length_bp = 0
-        total_count = 0
-        for d in self.fastqc_data[s_name].get('sequence_length_distribution', {}):
-            length_bp += d['count'] * self.avg_bp_from_range(d['length'])
-            total_count += d['count']
-        if total_count > 0:
-            self.fastqc_data[s_name]['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+        self.dup_keys = parsed.pop('dup_keys')
+        parsed.pop('filename')
+        self.fastqc_data[s_name] = parsed
 
     def fastqc_general_stats(self):
         """ Add some single-number stats to the basic statistics
@@ -1041,18 +1091,8 @@ class MultiqcModule(BaseMultiqcModule):
 
 
     def avg_bp_from_range(self, bp):
-        """ Helper function - FastQC often gives base pair ranges (eg. 10-15)
-        which are not helpful when plotting. This returns the average from such
-        ranges as an int, which is helpful. If not a range, just returns the int """
-
-        try:
-            if '-' in bp:
-                maxlen = float(bp.split("-",1)[1])
-                minlen = float(bp.split("-",1)[0])
-                bp = ((maxlen - minlen)/2) + minlen
-        except TypeError:
-            pass
-        return(int(bp))
+        """ Helper function - see avg_bp_from_range() """
+        return avg_bp_from_range(bp)
 
     def get_status_cols(self, section):
         """ Helper function - returns a list of colours according to the FastQC
@@ -3,7 +3,9 @@
 from __future__ import print_function
 
 from collections import defaultdict, OrderedDict
+import itertools
 import logging
+import numpy as np
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
@@ -149,53 +151,90 @@ class MultiqcModule(BaseMultiqcModule):
         cov_data = defaultdict(OrderedDict)  # absoulte (non-cumulative) coverage
         xmax = 0
         perchrom_avg_data = defaultdict(OrderedDict)  # per chromosome average coverage
+        self.dist_arrays = dict()  # coverage and cumulative coverage arrays for the general stats
 
         for scope in ('region', 'global'):
-            for f in self.find_log_files('mosdepth/' + scope + '_dist'):
+            for f in self.find_log_files('mosdepth/' + scope + '_dist', filehandles=True):
                 s_name = self.clean_s_name(f['fn'], f['root']).replace('.mosdepth.' + scope + '.dist', '')
                 if s_name in dist_data:  # both region and global might exist, prioritizing region
                     continue
 
-                for line in f['f'].split("\n"):
-                    if "\t" not in line:
-                        continue
-                    contig, cutoff_reads, bases_fraction = line.split("\t")
-                    if contig == "total":  # for global coverage distribution
-                        cumcov = 100.0 * float(bases_fraction)
-                        x = int(cutoff_reads)
-                        dist_data[s_name][x] = cumcov
-                        # converting cumulative coverage into absoulte coverage:
-                        """
-                        *example*              x:  cumcov:  abscov:
-                        3x                     3x  0      =               0
-                        2x     -               2x  0.10   = 0.10 - 0    = 0.10
-                        1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
-                        genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
-                        """
-                        if x + 1 not in dist_data[s_name]:
-                            cov_data[s_name][x] = cumcov
-                        else:
-                            cov_data[s_name][x] = cumcov - dist_data[s_name][x + 1]
-                        if cumcov > 1:  # require >1% to prevent long flat tail
-                            xmax = max(xmax, x)
-                    else:  # for per-contig plot
-                        avg = perchrom_avg_data[s_name].get(contig, 0) + float(bases_fraction)
-                        perchrom_avg_data[s_name][contig] = avg
-
-                if s_name in dist_data:
-                    self.add_data_source(f, s_name=s_name, section='genome_results')
+                x, cumcov, contig_sums = self.parse_dist_file(f)
+                if len(contig_sums) > 0:
+                    perchrom_avg_data[s_name] = contig_sums
+                if len(x) == 0:
+                    continue
+
+                # converting cumulative coverage into absoulte coverage:
+                """
+                *example*              x:  cumcov:  abscov:
+                3x                     3x  0      =               0
+                2x     -               2x  0.10   = 0.10 - 0    = 0.10
+                1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
+                genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
+                """
+                xs, last_cumcov = last_per_coverage(x, cumcov)
+                next_idx = np.minimum(np.searchsorted(xs, x + 1), len(xs) - 1)
+                abscov = np.where(xs[next_idx] == x + 1, cumcov - last_cumcov[next_idx], cumcov)
+
+                dist_data[s_name] = OrderedDict(zip(x.tolist(), cumcov.tolist()))
+                cov_data[s_name] = OrderedDict(zip(x.tolist(), abscov.tolist()))
+                self.dist_arrays[s_name] = (x, cumcov)
+                above = x[cumcov > 1]  # require >1% to prevent long flat tail
+                if len(above) > 0:
+                    xmax = max(xmax, int(above.max()))
+                self.add_data_source(f, s_name=s_name, section='genome_results')
 
         return dist_data, cov_data, xmax, perchrom_avg_data
 
+    def parse_dist_file(self, f):
+        """
+        Read a mosdepth dist file into arrays, a block of lines at a time.
+        :return: Coverage and % of bases with at least that coverage from the
+                 'total' rows, in file order, and a dict with the sum of the
+                 fractions for each contig
+        """
+        total_x = list()
+        total_frac = list()
+        contig_sums = OrderedDict()
+        while True:
+            # Read a chunk of the file, up to the end of a line
+            block = f['f'].read(config.log_stream_chunk_size)
+            if len(block) == 0:
+                break
+            block += f['f'].readline()
+            # Contig names can't have whitespace, so split the whole block at once
+            fields = block.split()
+            if len(fields) != 3 * (block.count("\n") + (not block.endswith("\n"))):
+                fields = [ v for l in block.splitlines() for v in l.split() if len(l.split()) == 3 ]
+            cutoffs = fields[1::3]
+            fracs = np.array(fields[2::3], dtype=float)
+
+            # Rows for each contig come together, so work through each run of rows
+            start = 0
+            for contig, rows in itertools.groupby(fields[0::3]):
+                end = start + len(list(rows))
+                if contig == 'total':  # for global coverage distribution
+                    total_x.append(np.array(cutoffs[start:end], dtype=np.int64))
+                    total_frac.append(fracs[start:end])
+                else:  # for per-contig plot
+                    running = np.concatenate(([contig_sums.get(contig, 0)], fracs[start:end]))
+                    contig_sums[contig] = float(np.add.accumulate(running)[-1])
+                start = end
+
+        x = np.concatenate(total_x) if total_x else np.zeros(0, dtype=np.int64)
+        cumcov = 100.0 * np.concatenate(total_frac) if total_frac else np.zeros(0)
+        return x, cumcov, contig_sums
+
     def genstats_cov_thresholds(self, dist_data, threshs, hidden_threshs):
         data = defaultdict(OrderedDict)
-        for s_name, d in dist_data.items():
-            dist_subset = {t: data for t, data in d.items() if t in threshs}
-            for t in threshs:
-                if int(t) in dist_subset:
-                    data[s_name]['{}_x_pc'.format(t)] = dist_subset[t]
-                else:
-                    data[s_name]['{}_x_pc'.format(t)] = 0
+        t_arr = np.array(threshs, dtype=np.int64)
+        for s_name in dist_data:
+            xs, cumcov = last_per_coverage(*self.dist_arrays[s_name])
+            idx = np.minimum(np.searchsorted(xs, t_arr), len(xs) - 1)
+            values = np.where(xs[idx] == t_arr, cumcov[idx], 0)
+            for t, v in zip(threshs, values.tolist()):
+                data[s_name]['{}_x_pc'.format(t)] = v
 
         headers = OrderedDict()
         for t in threshs:
@@ -212,13 +251,11 @@ class MultiqcModule(BaseMultiqcModule):
 
     def genstats_mediancov(self, dist_data):
         data = defaultdict(OrderedDict)
-        for s_name, d in dist_data.items():
-            median_cov = None
-            for this_cov, cum_pct in d.items():
-                if cum_pct >= 50:
-                    median_cov = this_cov
-                    break
-            data[s_name]['median_coverage'] = median_cov
+        for s_name in dist_data:
+            x, cumcov = self.dist_arrays[s_name]
+            # First coverage in the file with at least 50% of bases covered
+            above = np.flatnonzero(cumcov >= 50)
+            data[s_name]['median_coverage'] = int(x[above[0]]) if len(above) > 0 else None
 
         headers = OrderedDict()
         headers['median_coverage'] = {
@@ -231,6 +268,13 @@ class MultiqcModule(BaseMultiqcModule):
         self.general_stats_addcols(data, headers)
 
 
+def last_per_coverage(x, cumcov):
+    """ Sorted coverage values and the cumulative coverage from the last row
+    for each, as if the rows had been put into a dict
+    """
+    last = len(x) - 1 - np.unique(x[::-1], return_index=True)[1]
+    return x[last], cumcov[last]
+
 def get_cov_thresholds():
     """ Reads coverage thresholds from the config, otherwise sets sensible defaults
     """
@@ -4,10 +4,13 @@
 
 from __future__ import print_function
 from collections import OrderedDict
+import itertools
 import logging
 import json
+import numpy as np
 
 from multiqc.plots import scatter
+from multiqc.utils import sample_pairs
 from multiqc.modules.base_module import BaseMultiqcModule
 
 # Initialise the logger
@@ -31,6 +34,7 @@ class MultiqcModule(BaseMultiqcModule):
         self.peddy_length_counts = dict()
         self.peddy_length_exp = dict()
         self.peddy_length_obsexp = dict()
+        self.peddy_pairs = sample_pairs.SamplePairs()
 
         # parse peddy summary file
         for f in self.find_log_files('peddy/summary_table'):
@@ -43,8 +47,12 @@ class MultiqcModule(BaseMultiqcModule):
                     except KeyError:
                         self.peddy_data[s_name] = parsed_data[s_name]
 
+        # parse peddy pairs file
+        for f in self.find_log_files('peddy/ped_check', filehandles=True):
+            self.parse_peddy_ped_check(f)
+
         # parse peddy CSV files
-        for pattern in ['het_check', 'ped_check', 'sex_check']:
+        for pattern in ['het_check', 'sex_check']:
             sp_key = 'peddy/{}'.format(pattern)
             for f in self.find_log_files(sp_key):
                 # some columns have the same name in het_check and sex_check (median_depth)
@@ -71,14 +79,17 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Filter to strip out ignored sample names
         self.peddy_data = self.ignore_samples(self.peddy_data)
+        self.peddy_pairs.finish(self.is_ignore_sample)
 
-        if len(self.peddy_data) == 0:
+        if len(self.peddy_data) == 0 and len(self.peddy_pairs) == 0:
             raise UserWarning
 
-        log.info("Found {} reports".format(len(self.peddy_data)))
+        log.info("Found {} reports and {} sample pairs".format(len(self.peddy_data), len(self.peddy_pairs)))
 
         # Write parsed report data to a file
         self.write_data_file(self.peddy_data, 'multiqc_peddy')
+        if len(self.peddy_pairs) > 0:
+            self.peddy_pairs.write_data_file('multiqc_peddy_pairs', '-')
 
         # Basic Stats Table
         self.peddy_general_stats_table()
@@ -115,6 +126,39 @@ class MultiqcModule(BaseMultiqcModule):
             return None
         return parsed_data
 
+    def parse_peddy_ped_check(self, f):
+        """ Parse the ped_check csv output from peddy into self.peddy_pairs, a block of lines at a time """
+        headers = f['f'].readline().rstrip('\r\n').split(",")
+        try:
+            s_name_idx = [headers.index("sample_a"), headers.index("sample_b")]
+        except ValueError:
+            log.warning("Could not find sample name in Peddy output: {}".format(f['fn']))
+            return
+        s_names = dict()
+        while True:
+            lines = list(itertools.islice(f['f'], self.peddy_pairs.block_size))
+            if len(lines) == 0:
+                break
+            rows = [ s for s in (l.rstrip('\r\n').split(",") for l in lines) if len(s) == len(headers) ]
+            if len(rows) == 0:
+                continue
+            cols = list(zip(*rows))
+
+            # Clean each sample name once, in the order they are first seen
+            for s_name in OrderedDict.fromkeys(itertools.chain(cols[s_name_idx[0]], cols[s_name_idx[1]])):
+                if s_name not in s_names:
+                    s_names[s_name] = self.clean_s_name(s_name, f['root'])
+
+            columns = OrderedDict()
+            for i, k in enumerate(headers):
+                if i not in s_name_idx:
+                    columns[k + "_ped_check"] = cols[i]
+            self.peddy_pairs.add_rows(
+                [ s_names[s_name] for s_name in cols[s_name_idx[0]] ],
+                [ s_names[s_name] for s_name in cols[s_name_idx[1]] ],
+                columns
+            )
+
     def parse_peddy_csv(self, f, pattern):
         """ Parse csv output from peddy """
         parsed_data = dict()
@@ -241,19 +285,17 @@ class MultiqcModule(BaseMultiqcModule):
 
     def peddy_relatedness_plot(self):
         data = dict()
-        for s_name, d in self.peddy_data.items():
-            if 'ibs0_ped_check' in d and 'ibs2_ped_check' in d:
-                data[s_name] = {
-                    'x': d['ibs0_ped_check'],
-                    'y': d['ibs2_ped_check']
-                }
-            if 'rel_ped_check' in d:
-                if d['rel_ped_check'] < 0.25:
-                    data[s_name]['color'] = 'rgba(109, 164, 202, 0.9)'
-                elif d['rel_ped_check'] < 0.5:
-                    data[s_name]['color'] = 'rgba(250, 160, 81, 0.8)'
-                else:
-                    data[s_name]['color'] = 'rgba(43, 159, 43, 0.8)'
+        pairs = self.peddy_pairs
+        if pairs.column('ibs0_ped_check') is not None and pairs.column('ibs2_ped_check') is not None:
+            colours = None
+            if pairs.column('rel_ped_check') is not None:
+                rel = pairs.column('rel_ped_check').astype(float)
+                colours = np.select(
+                    [rel < 0.25, rel < 0.5],
+                    ['rgba(109, 164, 202, 0.9)', 'rgba(250, 160, 81, 0.8)'],
+                    'rgba(43, 159, 43, 0.8)'
+                ).astype(object)
+            data = pairs.scatter_data('ibs0_ped_check', 'ibs2_ped_check', '-', colours)
 
         pconfig = {
             'id': 'peddy_relatedness_plot',
@@ -4,10 +4,9 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc.plots import bargraph
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -19,38 +18,18 @@ def parse_reports(self):
     self.picard_alignment_metrics = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/alignment_metrics', filehandles=True):
+    for f in util.read_metrics_files(self, 'picard/alignment_metrics'):
         parsed_data = dict()
-        s_name = None
-        keys = None
-        for l in f['f']:
-            # New log starting
-            if 'AlignmentSummaryMetrics' in l and 'INPUT' in l:
-                s_name = None
-                keys = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data[s_name] = dict()
-
-            if s_name is not None:
-                if 'AlignmentSummaryMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        # Ignore the FIRST_OF_PAIR / SECOND_OF_PAIR data to simplify things
-                        if vals[0] == 'PAIR' or vals[0] == 'UNPAIRED':
-                            for i, k in enumerate(keys):
-                                try:
-                                    parsed_data[s_name][k] = float(vals[i])
-                                except ValueError:
-                                    parsed_data[s_name][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['AlignmentSummaryMetrics'])
+            if s_name is None:
+                continue
+            parsed_data[s_name] = dict()
+            for block in util.find_blocks(run, ['AlignmentSummaryMetrics']):
+                for row in util.metrics_rows(block):
+                    # Ignore the FIRST_OF_PAIR / SECOND_OF_PAIR data to simplify things
+                    if row[block['columns'][0]] in ('PAIR', 'UNPAIRED'):
+                        parsed_data[s_name].update(row)
 
         # Remove empty dictionaries
         for s_name in list(parsed_data.keys()):
@@ -4,11 +4,10 @@
 
 from collections import OrderedDict, defaultdict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import table, linegraph
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -63,53 +62,37 @@ def parse_reports(self):
     self.picard_HsMetrics_data = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/hsmetrics', filehandles=True):
+    for f in util.read_metrics_files(self, 'picard/hsmetrics'):
         parsed_data = dict()
-        s_name = None
-        keys = None
         commadecimal = None
-        for l in f['f']:
-            # New log starting
-            if 'CalculateHsMetrics' in l or 'CollectHsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                keys = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data[s_name] = dict()
-
-            if s_name is not None:
-                if 'HsMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        j = 'NA'
-                        if keys[0] == 'BAIT_SET':
-                            j = vals[0]
-                        parsed_data[s_name][j] = dict()
-                        # Check that we're not using commas for decimal places
-                        if commadecimal is None:
-                            for i, k in enumerate(keys):
-                                if k.startswith('PCT_'):
-                                    if ',' in vals[i]:
-                                        commadecimal = True
-                                    else:
-                                        commadecimal = False
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['CalculateHsMetrics', 'CollectHsMetrics'])
+            if s_name is None:
+                continue
+            parsed_data[s_name] = dict()
+            for block in util.find_blocks(run, ['HsMetrics']):
+                keys = block['columns']
+                for vals, row in zip(block['raw'], block['rows']):
+                    j = 'NA'
+                    if keys[0] == 'BAIT_SET':
+                        j = vals[0]
+                    parsed_data[s_name][j] = dict()
+                    # Check that we're not using commas for decimal places
+                    if commadecimal is None:
                         for i, k in enumerate(keys):
+                            if k.startswith('PCT_'):
+                                if ',' in vals[i]:
+                                    commadecimal = True
+                                else:
+                                    commadecimal = False
+                    for i, k in enumerate(keys):
+                        parsed_data[s_name][j][k] = row[i]
+                        if commadecimal:
+                            v = vals[i].replace('.', '').replace(',', '.')
                             try:
-                                if commadecimal:
-                                    vals[i] = vals[i].replace('.', '')
-                                    vals[i] = vals[i].replace(',', '.')
-                                parsed_data[s_name][j][k] = float(vals[i])
+                                parsed_data[s_name][j][k] = float(v)
                             except ValueError:
-                                parsed_data[s_name][j][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+                                parsed_data[s_name][j][k] = v
 
         # Remove empty dictionaries
         for s_name in list(parsed_data.keys()):
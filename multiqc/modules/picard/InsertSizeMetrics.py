@@ -4,11 +4,10 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import linegraph
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -23,72 +22,43 @@ def parse_reports(self):
     self.picard_insertSize_samplestats = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/insertsize', filehandles=True):
-        s_name = None
-        in_hist = False
-        for l in f['f']:
-
-            # Catch the histogram values
-            if s_name is not None and in_hist is True:
-                try:
-                    sections = l.split("\t")
-                    ins = int(sections[0])
-                    tot_count = sum( [int(x) for x in sections[1:]] )
-                    self.picard_insertSize_histogram[s_name][ins] = tot_count
-                    self.picard_insertSize_samplestats[s_name]['total_count'] += tot_count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            # New log starting
-            if 'InsertSizeMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if 'InsertSizeMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_insertSize_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='InsertSizeMetrics')
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    self.picard_insertSize_samplestats[s_name] = {'total_count': 0, 'meansum':0, 'total_pairs':0 }
-                    orientation_idx = keys.index('PAIR_ORIENTATION')
-                    while len(vals) == len(keys):
-                        pair_orientation = vals[orientation_idx]
-                        rowkey = '{}_{}'.format(s_name, pair_orientation)
-                        self.picard_insertSize_data[rowkey] = OrderedDict()
-                        self.picard_insertSize_data[rowkey]['SAMPLE_NAME'] = s_name
-                        for i, k in enumerate(keys):
+    for f in util.read_metrics_files(self, 'picard/insertsize'):
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['InsertSizeMetrics'])
+            if s_name is None:
+                continue
+            for block in util.find_blocks(run, ['InsertSizeMetrics']):
+                if s_name in self.picard_insertSize_data:
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='InsertSizeMetrics')
+                self.picard_insertSize_samplestats[s_name] = {'total_count': 0, 'meansum':0, 'total_pairs':0 }
+                for row in util.metrics_rows(block):
+                    rowkey = '{}_{}'.format(s_name, row['PAIR_ORIENTATION'])
+                    self.picard_insertSize_data[rowkey] = OrderedDict()
+                    self.picard_insertSize_data[rowkey]['SAMPLE_NAME'] = s_name
+                    for k, v in row.items():
+                        if isinstance(v, str):
                             try:
-                                self.picard_insertSize_data[rowkey][k] = float(vals[i])
+                                v = float(v.replace(',','.'))
+                                log.debug("Switching commas for points in '{}': {} - {}".format(f['fn'], row[k], v))
                             except ValueError:
-                                try:
-                                    self.picard_insertSize_data[rowkey][k] = float(vals[i].replace(',','.'))
-                                    log.debug("Switching commas for points in '{}': {} - {}".format(f['fn'], vals[i], vals[i].replace(',','.')))
-                                except ValueError:
-                                    self.picard_insertSize_data[rowkey][k] = vals[i]
-                            except IndexError:
-                                pass # missing data
-                        # Add to mean sums
-                        rp = self.picard_insertSize_data[rowkey]['READ_PAIRS']
-                        mis = self.picard_insertSize_data[rowkey]['MEAN_INSERT_SIZE']
-                        self.picard_insertSize_samplestats[s_name]['meansum'] += (rp * mis)
-                        self.picard_insertSize_samplestats[s_name]['total_pairs'] += rp
-
-                        vals = f['f'].readline().strip("\n").split("\t")
-
-                    # Skip lines on to histogram
-                    l = f['f'].readline().strip("\n")
-                    l = f['f'].readline().strip("\n")
-
-                    self.picard_insertSize_histogram[s_name] = OrderedDict()
-                    in_hist = True
+                                pass
+                        self.picard_insertSize_data[rowkey][k] = v
+                    # Add to mean sums
+                    rp = self.picard_insertSize_data[rowkey]['READ_PAIRS']
+                    mis = self.picard_insertSize_data[rowkey]['MEAN_INSERT_SIZE']
+                    self.picard_insertSize_samplestats[s_name]['meansum'] += (rp * mis)
+                    self.picard_insertSize_samplestats[s_name]['total_pairs'] += rp
+
+                # Histogram of counts for each read orientation
+                self.picard_insertSize_histogram[s_name] = OrderedDict()
+                hists = util.find_blocks(run, block_type='HISTOGRAM')
+                if len(hists) > 0:
+                    columns = list(hists[0]['data'].values())
+                    if len(columns) > 1 and all(c.dtype.kind == 'i' for c in columns):
+                        tot_counts = sum(columns[1:])
+                        self.picard_insertSize_histogram[s_name] = OrderedDict(zip(columns[0].tolist(), tot_counts.tolist()))
+                        self.picard_insertSize_samplestats[s_name]['total_count'] += int(tot_counts.sum())
 
         for key in list(self.picard_insertSize_data.keys()):
             if len(self.picard_insertSize_data[key]) == 0:
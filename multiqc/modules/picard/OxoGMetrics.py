@@ -3,8 +3,8 @@
 """ MultiQC submodule to parse output from Picard OxoGMetrics """
 
 import logging
-import os
-import re
+
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -17,57 +17,25 @@ def parse_reports(self):
     self.picard_OxoGMetrics_data = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/oxogmetrics', filehandles=True):
-        # We use lists to make sure that we don't overwrite when no data will be parsed
-        parsed_data = list()
-        sample_names = list()
-        s_files = list()
-        s_name = None
-        keys = None
-        for l in f['f']:
-            # New log starting
-            if ('CollectOxoGMetrics' in l or 'ConvertSequencingArtifactToOxoG' in l) and 'INPUT' in l:
-                s_name = None
-                keys = None
-                context_col = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data.append(dict())
-                    sample_names.append(s_name)
-                    s_files.append(f)
-
-
-            if s_name is not None:
-                if 'CollectOxoGMetrics$CpcgMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    context_col = keys.index('CONTEXT')
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys) and context_col is not None:
-                        context = vals[context_col]
-                        parsed_data[-1][context] = dict()
-                        for i, k in enumerate(keys):
-                            k = k.strip()
-                            try:
-                                parsed_data[-1][context][k] = float(vals[i])
-                            except ValueError:
-                                vals[i] = vals[i].strip()
-                                parsed_data[-1][context][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
-
-        # Remove empty dictionaries
-        for idx, s_name in enumerate(sample_names):
-            if len(parsed_data[idx]) > 0:
+    for f in util.read_metrics_files(self, 'picard/oxogmetrics'):
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['CollectOxoGMetrics', 'ConvertSequencingArtifactToOxoG'])
+            if s_name is None:
+                continue
+            parsed_data = dict()
+            for block in util.find_blocks(run, ['CollectOxoGMetrics$CpcgMetrics']):
+                keys = [ k.strip() for k in block['columns'] ]
+                context_col = keys.index('CONTEXT')
+                for row in block['rows']:
+                    row = [ v.strip() if isinstance(v, str) else v for v in row ]
+                    parsed_data[row[context_col]] = dict(zip(keys, row))
+
+            # Don't overwrite when no data was parsed
+            if len(parsed_data) > 0:
                 if s_name in self.picard_OxoGMetrics_data:
-                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(s_files[idx], s_name))
-                self.add_data_source(s_files[idx], s_name, section='OxoGMetrics')
-                self.picard_OxoGMetrics_data[s_name] = parsed_data[idx]
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='OxoGMetrics')
+                self.picard_OxoGMetrics_data[s_name] = parsed_data
 
 
     # Filter to strip out ignored sample names
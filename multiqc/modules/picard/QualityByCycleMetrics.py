@@ -2,6 +2,7 @@
 
 """ MultiQC submodule to parse output from Picard MeanQualityByCycle"""
 
+from collections import OrderedDict
 import logging
 import os
 import re
@@ -15,15 +16,17 @@ log = logging.getLogger(__name__)
 def parse_reports(self):
     """ Find Picard QualityByCycleMetrics reports and parse their data """
 
-    headers = ['CYCLE', 'MEAN_QUALITY']
-    formats = [int, float]
-    all_data = read_histogram(self, 'picard/quality_by_cycle', 'MeanQualityByCycle', headers, formats)
+    all_data = read_histogram(self, 'picard/quality_by_cycle', 'MeanQualityByCycle', ['CYCLE', 'MEAN_QUALITY'])
 
     if not all_data:
         return 0
 
+    lg = dict()
+    for s_name, d in all_data.items():
+        lg[s_name] = OrderedDict(zip(d['CYCLE'].tolist(), d['MEAN_QUALITY'].tolist()))
+
     # Write parsed data to a file
-    self.write_data_file(all_data, 'multiqc_picard_quality_by_cycle')
+    self.write_data_file(lg, 'multiqc_picard_quality_by_cycle')
 
     # Plot the data and add section
     pconfig = {
@@ -36,10 +39,6 @@ def parse_reports(self):
         'ymin': 0,
     }
 
-    lg = {}
-    for s_name in all_data:
-        lg[s_name] = dict((cycle, data['MEAN_QUALITY']) for cycle, data in all_data[s_name].items())
-
     self.add_section (
         name = 'Mean Base Quality by Cycle',
         anchor = 'picard-quality-by-cycle',
@@ -16,15 +16,17 @@ log = logging.getLogger(__name__)
 def parse_reports(self):
     """ Find Picard QualityScoreDistribution reports and parse their data """
 
-    headers = ['QUALITY', 'COUNT_OF_Q']
-    formats = [int, int]
-    all_data = read_histogram(self, 'picard/quality_score_distribution', 'QualityScoreDistribution', headers, formats)
+    all_data = read_histogram(self, 'picard/quality_score_distribution', 'QualityScoreDistribution', ['QUALITY', 'COUNT_OF_Q'])
 
     if not all_data:
         return 0
 
+    lg = dict()
+    for s_name, d in all_data.items():
+        lg[s_name] = OrderedDict(zip(d['QUALITY'].tolist(), d['COUNT_OF_Q'].tolist()))
+
     # Write parsed data to a file
-    self.write_data_file(all_data, 'multiqc_picard_quality_score_distribution')
+    self.write_data_file(lg, 'multiqc_picard_quality_score_distribution')
 
     # Plot the data and add section
     pconfig = {
@@ -37,10 +39,6 @@ def parse_reports(self):
         'ymin': 0,
     }
 
-    lg = {}
-    for s_name in all_data:
-        lg[s_name] = OrderedDict((qual, data['COUNT_OF_Q']) for qual, data in all_data[s_name].items())
-
     self.add_section (
         name = 'Base Quality Distribution',
         anchor = 'picard-quality-score-distribution',
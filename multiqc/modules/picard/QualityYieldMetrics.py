@@ -4,12 +4,10 @@
 
 from collections import OrderedDict, defaultdict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import table, linegraph
-from .util import read_sample_name
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -38,41 +36,17 @@ def parse_reports(self):
     header = list(DESC.keys())
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/quality_yield_metrics', filehandles=True):
-        parsed_data = dict()
-        s_name = None
-        keys = None
-        commadecimal = None
-
-        lines = iter(f['f'])
-
-        clean_fn = lambda n: self.clean_s_name(n, f['root'])
-        s_name = read_sample_name(lines, clean_fn, 'CollectQualityYieldMetrics')
-
-        if s_name is None:
-            continue
-
-        sample_data = dict()
-        try:
-            # skip to the histogram
-            line = next(lines)
-            while not line.startswith('## METRICS CLASS'):
-                line = next(lines)
-
-            # check the header
-            line = next(lines)
-            if header != line.strip().split('\t'):
+    for f in util.read_metrics_files(self, 'picard/quality_yield_metrics'):
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['CollectQualityYieldMetrics'])
+            if s_name is None:
                 continue
 
-            # one row
-            line = next(lines)
-            fields = [int(field) for field in line.strip('\n').split('\t')]
-            sample_data = OrderedDict(zip(header, fields))
-        except StopIteration:
-            pass
-
-        if sample_data:
-            all_data[s_name] = OrderedDict(zip(header, fields))
+            # one row, with the expected header
+            for block in util.find_blocks(run, ['QualityYieldMetrics']):
+                if block['columns'] == header and len(block['raw']) > 0:
+                    all_data[s_name] = OrderedDict(zip(header, [int(field) for field in block['raw'][0]]))
+                break
 
 
     # Filter to strip out ignored sample names
@@ -4,10 +4,9 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc.plots import bargraph
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -19,36 +18,16 @@ def parse_reports(self):
     self.picard_rrbs_metrics = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/rrbs_metrics', filehandles=True):
+    for f in util.read_metrics_files(self, 'picard/rrbs_metrics'):
         parsed_data = dict()
-        s_name = None
-        keys = None
-        for l in f['f']:
-            # New log starting
-            if 'CollectRrbsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                keys = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data[s_name] = dict()
-
-            if s_name is not None:
-                if 'RrbsSummaryMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        for i, k in enumerate(keys):
-                            try:
-                                parsed_data[s_name][k] = float(vals[i])
-                            except ValueError:
-                                parsed_data[s_name][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['CollectRrbsMetrics'])
+            if s_name is None:
+                continue
+            parsed_data[s_name] = dict()
+            for block in util.find_blocks(run, ['RrbsSummaryMetrics']):
+                for row in util.metrics_rows(block):
+                    parsed_data[s_name].update(row)
 
         # Remove empty dictionaries
         for s_name in list(parsed_data.keys()):
@@ -4,11 +4,10 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import linegraph, bargraph
+from . import util
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -23,55 +22,24 @@ def parse_reports(self):
     self.picard_wgsmetrics_samplestats = dict()
 
     # Go through logs and find Metrics
-    for f in self.find_log_files('picard/wgs_metrics', filehandles=True):
-        s_name = None
-        in_hist = False
-        for l in f['f']:
-
-            # Catch the histogram values
-            if s_name is not None and in_hist is True:
-                try:
-                    sections = l.split("\t")
-                    cov = int(sections[0])
-                    count = int(sections[1])
-                    self.picard_wgsmetrics_histogram[s_name][cov] = count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            # New log starting
-            if 'WgsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                metric_names = ['CollectWgsMetrics$WgsMetrics', 'picard.analysis.WgsMetrics']
-                if any(n in l for n in metric_names) and '## METRICS CLASS' in l:
-                    if s_name in self.picard_wgsmetrics_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='WgsMetrics')
-                    self.picard_wgsmetrics_data[s_name] = dict()
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        for i, k in enumerate(keys):
-                            try:
-                                self.picard_wgsmetrics_data[s_name][k] = float(vals[i])
-                            except ValueError:
-                                self.picard_wgsmetrics_data[s_name][k] = vals[i]
-
-                    # Skip lines on to histogram
-                    next(f['f'])
-                    next(f['f'])
-                    next(f['f'])
-
-                    self.picard_wgsmetrics_histogram[s_name] = OrderedDict()
-                    in_hist = True
+    for f in util.read_metrics_files(self, 'picard/wgs_metrics'):
+        for run in f['runs']:
+            s_name = util.run_sample_name(self, f, run, ['WgsMetrics'])
+            if s_name is None:
+                continue
+            for block in util.find_blocks(run, ['CollectWgsMetrics$WgsMetrics', 'picard.analysis.WgsMetrics']):
+                if s_name in self.picard_wgsmetrics_data:
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='WgsMetrics')
+                self.picard_wgsmetrics_data[s_name] = util.metrics_rows(block)[0] if len(block['rows']) > 0 else dict()
+
+                # Coverage histogram - first column is the coverage, second is the count
+                self.picard_wgsmetrics_histogram[s_name] = OrderedDict()
+                hists = util.find_blocks(run, block_type='HISTOGRAM')
+                if len(hists) > 0:
+                    columns = list(hists[0]['data'].values())
+                    if len(columns) > 1 and columns[0].dtype.kind == 'i' and columns[1].dtype.kind == 'i':
+                        self.picard_wgsmetrics_histogram[s_name] = OrderedDict(zip(columns[0].tolist(), columns[1].tolist()))
 
         for key in list(self.picard_wgsmetrics_data.keys()):
             if len(self.picard_wgsmetrics_data[key]) == 0:
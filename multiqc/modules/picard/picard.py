@@ -47,6 +47,8 @@ class MultiqcModule(BaseMultiqcModule):
         # Set up class objects to hold parsed data
         self.general_stats_headers = OrderedDict()
         self.general_stats_data = dict()
+        # Metrics files parsed by util.read_metrics_files(), shared by the submodules
+        self.picard_metrics_files = dict()
         n = dict()
 
         # Call submodule functions
@@ -114,6 +116,9 @@ class MultiqcModule(BaseMultiqcModule):
         if n['WgsMetrics'] > 0:
             log.info("Found {} WgsMetrics reports".format(n['WgsMetrics']))
 
+        # Parsed files are no longer needed
+        self.picard_metrics_files = dict()
+
         # Exit if we didn't find anything
         if sum(n.values()) == 0:
             raise UserWarning
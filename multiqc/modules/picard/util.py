@@ -1,35 +1,195 @@
 #!/usr/bin/env python
 
+from collections import OrderedDict
+import functools
+import numpy as np
 import os
 import re
-from collections import OrderedDict
 
+from multiqc import config
 
-def read_sample_name(line_iter, clean_fn, program_name):
-    """
-    Consumes lines from the provided line_iter and parses those lines
-    as a header for the picard base distribution file.  The header
-    file is assumed to contain a line with both 'INPUT' and
-    'BaseDistributionByCycle'.
 
-    If the header parses correctly, the sample name is returned.  If
-    the header does not parse correctly, None is returned.
+def read_metrics_file(contents):
+    """
+    Splits the contents of a Picard metrics file into its '## METRICS CLASS'
+    and '## HISTOGRAM' blocks in one pass. Files can hold more than one run of
+    a tool (for example when logs have been concatenated), so the blocks are
+    grouped into runs: the '#' header lines written by a tool and the blocks
+    that follow them.
+
+    Rows of METRICS CLASS blocks are typed - numbers are floats and anything
+    else stays a string. The original strings are also kept, in 'raw'.
+    Columns of HISTOGRAM blocks are NumPy arrays, in 'data' - of integers
+    if every value is a whole number, otherwise of floats.
+
+    Returns a list of runs. Each run is a dict with 'header' (list of lines)
+    and 'blocks'. Each block is a dict with 'type' ('METRICS CLASS' or
+    'HISTOGRAM'), 'class' (eg. picard.analysis.InsertSizeMetrics) and 'columns'.
+    """
+    runs = list()
+    lines = contents.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if line.startswith('## METRICS CLASS') or line.startswith('## HISTOGRAM'):
+            if len(runs) == 0:
+                runs.append({ 'header': list(), 'blocks': list() })
+            block_type, _, block_class = line[3:].partition("\t")
+            block = { 'type': block_type.strip(), 'class': block_class.strip(), 'columns': list() }
+            if i < len(lines):
+                block['columns'] = lines[i].split("\t")
+                i += 1
+            # Rows run up to the next blank line
+            try:
+                end = lines.index('', i)
+            except ValueError:
+                end = len(lines)
+            fields, i = _split_rows(lines, i, end, len(block['columns']))
+            _type_block(block, fields)
+            runs[-1]['blocks'].append(block)
+        elif line.startswith('#'):
+            # Header lines after some blocks are the start of another run
+            if len(runs) == 0 or len(runs[-1]['blocks']) > 0:
+                runs.append({ 'header': list(), 'blocks': list() })
+            runs[-1]['header'].append(line)
+    return runs
+
+def _split_rows(lines, start, end, ncols):
     """
+    Splits lines[start:end] into a flat list of fields, all at once if every
+    row has ncols fields. Otherwise the rows stop at the first one that
+    doesn't, or that starts with a '#'.
+    Returns the fields and the index of the line after the last row.
+    """
+    rows_text = "\n".join(lines[start:end])
+    if not rows_text.startswith('#') and "\n#" not in rows_text:
+        fields = rows_text.replace("\n", "\t").split("\t")
+        if len(fields) == ncols * (end - start):
+            return fields, end
+    fields = list()
+    for i in range(start, end):
+        vals = lines[i].split("\t")
+        if lines[i].startswith('#') or len(vals) != ncols:
+            return fields, i
+        fields.extend(vals)
+    return fields, end
+
+def _type_block(block, fields):
+    """ Typed rows or arrays from the flat list of fields of a block """
+    ncols = len(block['columns'])
+    if block['type'] == 'HISTOGRAM':
+        block['data'] = OrderedDict()
+        for c, k in enumerate(block['columns']):
+            for dtype in (np.int64, float, object):
+                try:
+                    block['data'][k] = np.array(fields[c::ncols], dtype=dtype)
+                    break
+                except (ValueError, OverflowError):
+                    pass
+    else:
+        block['raw'] = [ fields[r:r + ncols] for r in range(0, len(fields), ncols) ] if ncols > 0 else list()
+        block['rows'] = [ [ _metrics_value(v) for v in vals ] for vals in block['raw'] ]
+
+def _metrics_value(v):
     try:
-        while True:
-            new_line = next(line_iter)
-            new_line = new_line.strip()
-            if program_name in new_line and 'INPUT' in new_line:
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT=?\s*(\[?[^\s]+\]?)", new_line, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = clean_fn(s_name)
-                    return s_name
-    except StopIteration:
-        return None
-
-def read_histogram(self, program_key, program_name, headers, formats):
+        return float(v)
+    except ValueError:
+        return v
+
+def read_metrics_files(self, program_key):
+    """
+    Finds Picard metrics files and reads them with read_metrics_file(). The same
+    file is often found by more than one submodule, so parsed files are cached in
+    self.picard_metrics_files and each file is only read once. With --incremental,
+    files that haven't changed since the previous run aren't read at all.
+
+    Args:
+        self: the Picard QC module
+        program_key: the key used to find the program (ex. picard/quality_by_cycle)
+
+    Yields the file dicts from find_log_files(), with the runs in f['runs'].
+    """
+    parse_fn = functools.partial(_parse_metrics_file, self.picard_metrics_files)
+    for f in self.find_parsed_log_files(program_key, parse_fn, filehandles=True):
+        fpath = os.path.join(f['root'], f['fn'])
+        if fpath not in self.picard_metrics_files:
+            # Saved by a previous run, with histograms as lists
+            self.picard_metrics_files[fpath] = _histograms_to_arrays(f['parsed'])
+        f['runs'] = self.picard_metrics_files[fpath]
+        yield f
+
+def _parse_metrics_file(parsed_files, f):
+    """
+    Parsing function for find_parsed_log_files(). Reads the file unless it's
+    already in parsed_files. For --incremental the result has to be saved as
+    JSON, so histograms are returned as lists instead of arrays.
+    """
+    fpath = os.path.join(f['root'], f['fn'])
+    if fpath not in parsed_files:
+        parsed_files[fpath] = read_metrics_file(f['f'].read())
+    if config.incremental:
+        return _histograms_to_lists(parsed_files[fpath])
+    return parsed_files[fpath]
+
+def _histograms_to_lists(runs):
+    """ Copy of runs from read_metrics_file(), with histogram columns as lists """
+    runs_lists = list()
+    for run in runs:
+        blocks = list()
+        for block in run['blocks']:
+            if block['type'] == 'HISTOGRAM':
+                block = dict(block)
+                block['data'] = OrderedDict([ (k, v.tolist()) for k, v in block['data'].items() ])
+            blocks.append(block)
+        runs_lists.append({ 'header': run['header'], 'blocks': blocks })
+    return runs_lists
+
+def _histograms_to_arrays(runs):
+    """ Convert histogram columns from _histograms_to_lists() back to arrays, in place """
+    for run in runs:
+        for block in run['blocks']:
+            if block['type'] == 'HISTOGRAM':
+                for k, values in block['data'].items():
+                    arr = np.array(values)
+                    if arr.dtype.kind not in 'iuf':
+                        arr = np.array(values, dtype=object)
+                    block['data'][k] = arr
+    return runs
+
+def run_sample_name(self, f, run, program_names):
+    """
+    Gets the sample name from the INPUT of a header line that mentions
+    one of program_names, or None if there isn't one.
+    """
+    s_name = None
+    for line in run['header']:
+        if any(p in line for p in program_names) and 'INPUT' in line:
+            s_name = None
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", line, flags=re.IGNORECASE)
+            if fn_search:
+                s_name = os.path.basename(fn_search.group(1).strip('[]'))
+                s_name = self.clean_s_name(s_name, f['root'])
+    return s_name
+
+def find_blocks(run, class_names=None, block_type='METRICS CLASS'):
+    """
+    Blocks of a run with a class that contains one of class_names (case insensitive).
+    Set block_type to 'HISTOGRAM' for histograms. All blocks of that type are
+    returned if class_names is None.
+    """
+    blocks = [ b for b in run['blocks'] if b['type'] == block_type ]
+    if class_names is not None:
+        class_names = [ n.lower() for n in class_names ]
+        blocks = [ b for b in blocks if any(n in b['class'].lower() for n in class_names) ]
+    return blocks
+
+def metrics_rows(block):
+    """ Rows of a METRICS CLASS block as dicts of column: typed value """
+    return [ OrderedDict(zip(block['columns'], row)) for row in block['rows'] ]
+
+def read_histogram(self, program_key, program_name, headers):
     """
     Reads a Picard HISTOGRAM file.
 
@@ -38,52 +198,20 @@ def read_histogram(self, program_key, program_name, headers, formats):
         program_key: the key used to find the program (ex. picard/quality_by_cycle)
         program_name: the program key in the header to find the I/INPUT line
         headers: the list of expected headers for the histogram
-        formats: the list of methods to apply to re-format each field (on a given row)
+
+    Returns a dict of sample name: OrderedDict of header: array of values.
     """
     all_data = OrderedDict()
 
-    assert len(formats) == len(headers)
-
     # Go through logs and find Metrics
-    for f in self.find_log_files(program_key, filehandles=True):
-        lines = iter(f['f'])
-
-        # read through the header of the file to obtain the
-        # sample name
-        clean_fn = lambda n: self.clean_s_name(n, f['root'])
-        s_name = read_sample_name(lines, clean_fn, program_name)
-        if s_name is None:
-            continue
-
-        sample_data = OrderedDict()
-
-        try:
-            # skip to the histogram
-            line = next(lines)
-            while not line.startswith('## HISTOGRAM'):
-                line = next(lines)
-
-            # check the header
-            line = next(lines)
-            if headers != line.strip().split("\t"):
+    for f in read_metrics_files(self, program_key):
+        for run in f['runs']:
+            s_name = run_sample_name(self, f, run, [program_name])
+            if s_name is None:
                 continue
-
-            # slurp the data
-            line = next(lines).rstrip()
-            while line:
-                fields = line.split('\t')
-                assert len(fields) == len(headers)
-                for i in range(len(fields)):
-                    fields[i] = formats[i](fields[i])
-
-                sample_data[fields[0]] = OrderedDict(zip(headers, fields))
-                line = next(lines).rstrip()
-
-        except StopIteration:
-            pass
-
-        # append the data
-        if sample_data:
-            all_data[s_name] = sample_data
+            hists = find_blocks(run, block_type='HISTOGRAM')
+            # check the header
+            if len(hists) > 0 and hists[0]['columns'] == headers and len(hists[0]['data'][headers[0]]) > 0:
+                all_data[s_name] = hists[0]['data']
 
     return self.ignore_samples(all_data)
@@ -27,20 +27,20 @@ def parse_reports(self):
 
     # Coverage - coverage_histogram.txt
     self.qualimap_bamqc_coverage_hist = dict()
-    for f in self.find_log_files('qualimap/bamqc/coverage', filehandles=True):
+    for f in self.find_log_files('qualimap/bamqc/coverage', stream='lines'):
         parse_coverage(self, f)
     self.qualimap_bamqc_coverage_hist = self.ignore_samples(self.qualimap_bamqc_coverage_hist)
 
     # Insert size - insert_size_histogram.txt
     self.qualimap_bamqc_insert_size_hist = dict()
-    for f in self.find_log_files('qualimap/bamqc/insert_size', filehandles=True):
+    for f in self.find_log_files('qualimap/bamqc/insert_size', stream='lines'):
         parse_insert_size(self, f)
     self.qualimap_bamqc_insert_size_hist = self.ignore_samples(self.qualimap_bamqc_insert_size_hist)
 
     # GC distribution - mapped_reads_gc-content_distribution.txt
     self.qualimap_bamqc_gc_content_dist = dict()
     self.qualimap_bamqc_gc_by_species = dict()  # {'HUMAN': data_dict, 'MOUSE': data_dict}
-    for f in self.find_log_files('qualimap/bamqc/gc_dist', filehandles=True):
+    for f in self.find_log_files('qualimap/bamqc/gc_dist', stream='lines'):
         parse_gc_dist(self, f)
     self.qualimap_bamqc_gc_content_dist = self.ignore_samples(self.qualimap_bamqc_gc_content_dist)
     self.qualimap_bamqc_gc_by_species = self.ignore_samples(self.qualimap_bamqc_gc_by_species)
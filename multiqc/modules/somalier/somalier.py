@@ -3,15 +3,16 @@
 """ MultiQC module to parse output from somalier """
 
 from __future__ import print_function
-from collections import OrderedDict, defaultdict
-from math import isnan, isinf
+from collections import OrderedDict
 import csv
+import itertools
 import logging
+import numpy as np
 import random
 import spectra
 
 from multiqc.plots import bargraph, heatmap, scatter, table
-from multiqc.utils import mqc_colour
+from multiqc.utils import mqc_colour, sample_pairs
 from multiqc.modules.base_module import BaseMultiqcModule
 
 # Initialise the logger
@@ -40,6 +41,7 @@ class MultiqcModule(BaseMultiqcModule):
         self.somalier_length_counts = dict()
         self.somalier_length_exp = dict()
         self.somalier_length_obsexp = dict()
+        self.somalier_pairs = sample_pairs.SamplePairs()
 
         # parse somalier sample file
         for f in self.find_log_files('somalier/samples'):
@@ -52,16 +54,9 @@ class MultiqcModule(BaseMultiqcModule):
                     self.add_data_source(f, s_name)
                     self.somalier_data[s_name] = parsed_data[s_name]
 
-        # parse somalier CSV files
-        for f in self.find_log_files('somalier/pairs'):
-            parsed_data = self.parse_somalier_pairs_tsv(f)
-            if parsed_data is not None:
-                for s_name in parsed_data:
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    if s_name in self.somalier_data.keys():
-                        log.debug("Duplicate sample name found! Overwriting: {}".format(s_name))
-                    self.add_data_source(f, s_name)
-                    self.somalier_data[s_name] = parsed_data[s_name]
+        # parse somalier pairs files
+        for f in self.find_log_files('somalier/pairs', filehandles=True):
+            self.parse_somalier_pairs_tsv(f)
 
         # parse somalier ancestry files
         for f in self.find_log_files('somalier/somalier-ancestry', filehandles=True):
@@ -69,14 +64,24 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Filter to strip out ignored sample names
         self.somalier_data = self.ignore_samples(self.somalier_data)
+        self.somalier_pairs.finish(self.is_ignore_sample)
 
-        if len(self.somalier_data) == 0:
+        if len(self.somalier_data) == 0 and len(self.somalier_pairs) == 0:
             raise UserWarning
 
-        log.info("Found {} reports".format(len(self.somalier_data)))
+        log.info("Found {} reports and {} sample pairs".format(len(self.somalier_data), len(self.somalier_pairs)))
+
+        # Highest relatedness of each sample to any other sample
+        if self.somalier_pairs.column('relatedness') is not None:
+            max_relatedness = self.somalier_pairs.per_sample('relatedness', ignore=-2)
+            for s_name, d in self.somalier_data.items():
+                if s_name in max_relatedness:
+                    d['max_relatedness'] = max_relatedness[s_name]
 
         # Write parsed report data to a file
         self.write_data_file(self.somalier_data, 'multiqc_somalier')
+        if len(self.somalier_pairs) > 0:
+            self.somalier_pairs.write_data_file('multiqc_somalier_pairs', '*')
 
         # Somalier Stats Table
         self.somalier_stats_table()
@@ -120,38 +125,41 @@ class MultiqcModule(BaseMultiqcModule):
         return parsed_data
 
     def parse_somalier_pairs_tsv(self, f):
-        """ Parse csv output from somalier """
-        parsed_data = dict()
-        headers = None
-        s_name_idx = None
-        for l in f['f'].splitlines():
-            s = l.lstrip('#').split("\t")
-            if headers is None:
-                headers = s
-                try:
-                    s_name_idx = [headers.index("sample_a"), headers.index("sample_b")]
-                except ValueError:
-                    log.warning("Could not find sample name in somalier output: {}".format(f['fn']))
-                    return None
-            else:
-                s_name = '*'.join([s[idx] for idx in s_name_idx]) # not safe to hard code, but works
-                parsed_data[s_name] = dict()
-                for i, v in enumerate(s):
-                    if i not in s_name_idx: # Skip if (i == 0 or 1); i.e. sample_a, sample_b
-                        if (isnan(float(v)) or isinf(float(v))):
-                             # TODO: find better solution
-                            log.debug("Found Inf or NaN value. Overwriting with -2.")
-                            v = -2
-                        try:
-                            # add the pattern as a suffix to key
-                            parsed_data[s_name][headers[i]] = float(v)
-                        except ValueError:
-                            # add the pattern as a suffix to key
-                            parsed_data[s_name][headers[i]] = v
-
-        if len(parsed_data) == 0:
-            return None
-        return parsed_data
+        """ Parse tsv output from somalier into self.somalier_pairs, a block of lines at a time """
+        headers = f['f'].readline().rstrip('\r\n').lstrip('#').split("\t")
+        try:
+            s_name_idx = [headers.index("sample_a"), headers.index("sample_b")]
+        except ValueError:
+            log.warning("Could not find sample name in somalier output: {}".format(f['fn']))
+            return
+        s_names = dict()
+        while True:
+            lines = list(itertools.islice(f['f'], self.somalier_pairs.block_size))
+            if len(lines) == 0:
+                break
+            rows = [ s for s in (l.rstrip('\r\n').split("\t") for l in lines) if len(s) == len(headers) ]
+            if len(rows) == 0:
+                continue
+            cols = list(zip(*rows))
+
+            # Clean each sample name once, in the order they are first seen. The pairs file is
+            # recorded in its own section so that it doesn't replace the samples file as the source.
+            for s_name in OrderedDict.fromkeys(itertools.chain(cols[s_name_idx[0]], cols[s_name_idx[1]])):
+                if s_name not in s_names:
+                    s_names[s_name] = self.clean_s_name(s_name, f['root'])
+                    self.add_data_source(f, s_names[s_name], section='pairs')
+
+            columns = OrderedDict()
+            for i, k in enumerate(headers):
+                if i not in s_name_idx: # Skip if (i == 0 or 1); i.e. sample_a, sample_b
+                    columns[k] = np.array(cols[i], dtype=float)
+                    # TODO: find better solution for Inf and NaN values
+                    columns[k][~np.isfinite(columns[k])] = -2
+            self.somalier_pairs.add_rows(
+                [ s_names[s_name] for s_name in cols[s_name_idx[0]] ],
+                [ s_names[s_name] for s_name in cols[s_name_idx[1]] ],
+                columns
+            )
 
     def parse_somalier_ancestry(self, f):
         # dict for parsed data, ancestry prediction probabilities and PCs
@@ -280,6 +288,15 @@ class MultiqcModule(BaseMultiqcModule):
             'scale': "RdYlGn",
             'format': '{:,.2f}',
         }
+        headers['max_relatedness'] = {
+            'title': 'Max relatedness',
+            'description': 'Highest relatedness to any other sample',
+            'max': 1,
+            'min': 0,
+            'scale': 'RdYlGn-rev',
+            'format': '{:,.2f}',
+            'hidden': True
+        }
         headers['n_het'] = {
             'title': 'HetVar',
             'description': 'Heterozygous variants',
@@ -426,32 +443,30 @@ class MultiqcModule(BaseMultiqcModule):
         extra_colours = cscale.get_colours("Dark2")
         extra_colours = _make_col_alpha(extra_colours, alpha)
 
-        extra_colour_idx = 0
-        for s_name, d in self.somalier_data.items():
-            if 'ibs0' in d and 'ibs2' in d:
-                data[s_name] = {
-                    'x': d['ibs0'],
-                    'y': d['ibs2']
-                }
-            if 'relatedness' in d:
-                relatedness = d['expected_relatedness']
+        pairs = self.somalier_pairs
+        if pairs.column('ibs0') is not None and pairs.column('ibs2') is not None:
+            colours = None
+            if pairs.column('relatedness') is not None and pairs.column('expected_relatedness') is not None:
                 # -1 is not the same family, 0 is same family but unreleaed
                 # @brentp says he usually bundles them together
-                if relatedness == -1:
-                    relatedness = 0
-
-                # New unique value that we've not seen before
-                if relatedness not in relatedness_colours:
-                    relatedness_colours[relatedness] = [
-                        str(relatedness),
-                        extra_colours[extra_colour_idx]
-                    ]
-                    extra_colour_idx += 0
-                    if extra_colour_idx > len(extra_colours):
-                        extra_colour_idx = 0
+                expected = np.where(pairs.column('expected_relatedness') == -1, 0, pairs.column('expected_relatedness'))
+                expected_values, expected_idx = np.unique(expected, return_inverse=True)
+
+                extra_colour_idx = 0
+                for relatedness in expected_values.tolist():
+                    # New unique value that we've not seen before
+                    if relatedness not in relatedness_colours:
+                        relatedness_colours[relatedness] = [
+                            str(relatedness),
+                            extra_colours[extra_colour_idx]
+                        ]
+                        extra_colour_idx += 0
+                        if extra_colour_idx > len(extra_colours):
+                            extra_colour_idx = 0
 
                 # Assign colour
-                data[s_name]['color'] = relatedness_colours[relatedness][1]
+                colours = np.array([relatedness_colours[r][1] for r in expected_values.tolist()], dtype=object)[expected_idx]
+            data = pairs.scatter_data('ibs0', 'ibs2', '*', colours)
 
         if len(data) > 0:
             pconfig = {
@@ -479,28 +494,11 @@ class MultiqcModule(BaseMultiqcModule):
     def somalier_relatedness_heatmap_plot(self):
         # inspiration: MultiQC/modules/vcftools/relatedness2.py
 
-        data = []
-        labels = set()
-        rels = defaultdict(dict)
-        for s_name, d in self.somalier_data.items():
-            if 'relatedness' in d:
-                a, b = s_name.split('*')
-                labels.add(a)
-                labels.add(b)
-                rels[a][b] = rels[b][a] = float(d["relatedness"])
-                rels[a][a] = rels[b][b] = float(1)
-
-        # impose alphabetical order and avoid json serialisation errors in utils.report
-        labels = sorted(labels)
-
-        for x in labels:
-            line = []
-            for y in labels:
-                try:
-                    line.append(rels[x][y])
-                except KeyError:
-                    line.append(-2)
-            data.append(line)
+        if self.somalier_pairs.column('relatedness') is None:
+            return
+
+        # Sample names in alphabetical order, -2 for missing pairs
+        labels, data = self.somalier_pairs.matrix('relatedness', fill=-2, diagonal=1)
 
         if len(data) > 0:
             pconfig = {
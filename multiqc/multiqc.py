@@ -35,8 +35,8 @@ except ImportError:
     reload(sys)
     sys.setdefaultencoding('utf8')
 
-from .plots import table
-from .utils import report, plugin_hooks, megaqc, util_functions, lint_helpers, config, log
+from .plots import linegraph, table
+from .utils import report, plugin_hooks, megaqc, util_functions, lint_helpers, config, log, parse_cache, parallel_modules, flat_plots
 
 start_execution_time = time.time()
 logger = config.logger
@@ -162,6 +162,10 @@ logger = config.logger
                     is_flag = True,
                     help = "Use only interactive plots (HighCharts Javascript)"
 )
+@click.option('--auto-plots', 'plots_auto',
+                    is_flag = True,
+                    help = "Choose interactive, downsampled, summary or flat plots based on how much data each plot has"
+)
 @click.option('--lint', 'lint',
                     is_flag = True,
                     help = "Use strict linting (validation) to help code development"
@@ -193,6 +197,34 @@ logger = config.logger
                     is_flag = True,
                     help = "Only show log warnings"
 )
+@click.option('--search-workers', 'search_workers',
+                    type = int,
+                    help = "Number of parallel threads to use when searching files. Default: {}".format(config.search_workers)
+)
+@click.option('--parse-workers', 'parse_workers',
+                    type = int,
+                    help = "Number of parallel processes to use when parsing files, for modules that support it. Default: {}".format(config.parse_workers)
+)
+@click.option('--module-workers', 'module_workers',
+                    type = int,
+                    help = "Number of parallel processes to use when running modules. Default: {}".format(config.module_workers)
+)
+@click.option('--plot-workers', 'plot_workers',
+                    type = int,
+                    help = "Number of parallel processes to use when rendering flat plots. Default: {}".format(config.plot_workers)
+)
+@click.option('--search-cache', 'search_cache',
+                    is_flag = True,
+                    help = "Cache file search results in the output directory, so that unchanged files aren't searched again in later runs"
+)
+@click.option('--plot-cache', 'plot_cache',
+                    is_flag = True,
+                    help = "Cache rendered flat plot images, so that identical plots aren't drawn again in later runs"
+)
+@click.option('--incremental', 'incremental',
+                    type = click.Path(file_okay=False),
+                    help = "Reuse parsed data for unchanged files from a previous multiqc_data directory"
+)
 @click.option('--profile-runtime',
                     is_flag = True,
                     help = "Add analysis of how long MultiQC takes to run to the report"
@@ -205,7 +237,7 @@ logger = config.logger
 
 def run_cli(analysis_dir, dirs, dirs_depth, no_clean_sname, title, report_comment, template, module_tag, module, exclude, outdir,
 ignore, ignore_samples, sample_names, sample_filters, file_list, filename, make_data_dir, no_data_dir, data_format, zip_data_dir, force, ignore_symlinks,
-export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, config_file, cl_config, verbose, quiet, profile_runtime, no_ansi, **kwargs):
+export_plots, plots_flat, plots_interactive, plots_auto, lint, make_pdf, no_megaqc_upload, config_file, cl_config, verbose, quiet, search_workers, parse_workers, module_workers, plot_workers, search_cache, plot_cache, incremental, profile_runtime, no_ansi, **kwargs):
     """
     Main MultiQC run command for use with the click command line, complete with all click function decorators.
     To make it easy to use MultiQC within notebooks and other locations that don't need click, we simply pass the
@@ -239,6 +271,7 @@ export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, c
         export_plots=export_plots,
         plots_flat=plots_flat,
         plots_interactive=plots_interactive,
+        plots_auto=plots_auto,
         lint=lint,
         make_pdf=make_pdf,
         no_megaqc_upload=no_megaqc_upload,
@@ -246,6 +279,13 @@ export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, c
         cl_config=cl_config,
         verbose=verbose,
         quiet=quiet,
+        search_workers=search_workers,
+        parse_workers=parse_workers,
+        module_workers=module_workers,
+        plot_workers=plot_workers,
+        search_cache=search_cache,
+        plot_cache=plot_cache,
+        incremental=incremental,
         profile_runtime=profile_runtime,
         no_ansi=no_ansi,
         kwargs=kwargs
@@ -282,6 +322,7 @@ def run(
         export_plots = False,
         plots_flat = False,
         plots_interactive = False,
+        plots_auto = False,
         lint = False,
         make_pdf = False,
         no_megaqc_upload = False,
@@ -289,6 +330,13 @@ def run(
         cl_config = (),
         verbose = 0,
         quiet = False,
+        search_workers = None,
+        parse_workers = None,
+        module_workers = None,
+        plot_workers = None,
+        search_cache = False,
+        plot_cache = False,
+        incremental = None,
         profile_runtime = False,
         no_ansi = False,
         kwargs = {}
@@ -374,6 +422,8 @@ def run(
         config.plots_force_flat = True
     if plots_interactive:
         config.plots_force_interactive = True
+    if plots_auto:
+        config.plots_auto_strategy = True
     if lint:
         config.lint = True
         lint_helpers.run_tests()
@@ -392,6 +442,20 @@ def run(
         config.run_modules = module
     if len(exclude) > 0:
         config.exclude_modules = exclude
+    if search_workers is not None:
+        config.search_workers = search_workers
+    if parse_workers is not None:
+        config.parse_workers = parse_workers
+    if module_workers is not None:
+        config.module_workers = module_workers
+    if plot_workers is not None:
+        config.plot_workers = plot_workers
+    if search_cache:
+        config.search_cache = True
+    if plot_cache:
+        config.plot_cache = True
+    if incremental is not None:
+        config.incremental = incremental
     if profile_runtime:
         config.profile_runtime = True
     config.kwargs = kwargs # Plugin command line options
@@ -525,6 +589,12 @@ def run(
     if filename != 'stdout' and config.make_data_dir == True:
         config.data_dir = config.data_tmp_dir
         os.makedirs(config.data_dir)
+        if config.data_format == 'parquet':
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                logger.warning("Saving data as parquet needs the 'pyarrow' Python package - using tsv instead")
+                config.data_format = 'tsv'
     else:
         config.data_dir = None
     config.plots_tmp_dir = os.path.join(tmp_dir, 'multiqc_plots')
@@ -554,21 +624,32 @@ def run(
     # Get the list of files to search
     report.get_filelist(run_module_names)
 
+    # Load parsed data from a previous run
+    if config.incremental:
+        if config.data_dir is None:
+            logger.warning("No data directory is being created, so parsed data will not be saved for the next --incremental run")
+        parse_cache.load(config.incremental)
+
     # Run the modules!
     plugin_hooks.mqc_trigger('before_modules')
     report.modules_output = list()
     sys_exit_code = 0
     total_mods_starttime = time.time()
+    worker_results = None
+    if config.module_workers > 1 and len(run_modules) > 1:
+        worker_results = parallel_modules.run_in_workers(run_modules, config.module_workers, tmp_dir)
     for mod_idx, mod_dict in enumerate(run_modules):
         mod_starttime = time.time()
         try:
             this_module = list(mod_dict.keys())[0]
-            mod_cust_config = list(mod_dict.values())[0]
-            mod = config.avail_modules[this_module].load()
-            mod.mod_cust_config = mod_cust_config # feels bad doing this, but seems to work
-            output = mod()
-            if type(output) != list:
-                output = [output]
+            output = None
+            # Merge in the results if this module was run in a worker process
+            if worker_results is not None:
+                if worker_results[mod_idx].status in ('ok', 'no_samples'):
+                    mod_starttime -= worker_results[mod_idx].runtime
+                output = parallel_modules.merge(worker_results[mod_idx], mod_dict)
+            if output is None:
+                output = parallel_modules.load_and_run(mod_dict)
             for m in output:
                 report.modules_output.append(m)
 
@@ -619,6 +700,8 @@ def run(
                           this_module, traceback.format_exc()) + ('='*60))
             sys_exit_code = 1
         report.runtimes['mods'][run_module_names[mod_idx]] = time.time() - mod_starttime
+    if worker_results is not None:
+        parallel_modules.cleanup(tmp_dir)
     report.runtimes['total_mods'] = time.time() - total_mods_starttime
 
     # Special-case module if we want to profile the MultiQC running time
@@ -713,13 +796,21 @@ def run(
     else:
         config.skip_generalstats = True
 
+    # Wait for any flat plots still being rendered in worker processes
+    flat_plots.finish()
+
     # Write the report sources to disk
     if config.data_dir is not None:
         report.data_sources_tofile()
+        if config.incremental:
+            parse_cache.save(config.data_dir)
     # Compress the report plot JSON data
     runtime_compression_start = time.time()
     logger.info("Compressing plot data")
-    report.plot_compressed_json = report.compress_json(report.plot_data)
+    # Downsample dense line graphs for the report - the full data is still saved in multiqc_data
+    report_plot_data = linegraph.downsample_plot_data(report.plot_data)
+    report.plot_compressed_json, report.plot_compressed_chunks = report.compress_plot_data(report_plot_data)
+    report.table_compressed_json = report.compress_json(report.table_data)
     report.runtimes['total_compression'] = time.time() - runtime_compression_start
 
     plugin_hooks.mqc_trigger('before_report_generation')
@@ -840,6 +931,7 @@ def run(
     # Use jinja2 to render the template and overwrite
     config.analysis_dir = [os.path.realpath(d) for d in config.analysis_dir]
     report_output = j_template.render(report=report, config=config)
+    report_output = flat_plots.splice(report_output)
     if filename == 'stdout':
         print(report_output.encode('utf-8'), file = sys.stdout)
     else:
@@ -902,7 +994,12 @@ def run(
     if config.profile_runtime:
         logger.info("Run took {:.2f} seconds".format(report.runtimes['total']))
         logger.info(" - {:.2f}s: Searching files".format(report.runtimes['total_sp']))
+        logger.info("    - {} file content reads, {} re-reads saved".format(report.runtimes['sp_file_reads'], report.runtimes['sp_file_reads_saved']))
+        if config.search_cache:
+            logger.info("    - {} files found in search cache, {} searched".format(report.runtimes['sp_cache_hits'], report.runtimes['sp_cache_misses']))
         logger.info(" - {:.2f}s: Running modules".format(report.runtimes['total_mods']))
+        if config.plot_cache:
+            logger.info("    - {} flat plots found in plot cache, {} rendered".format(report.runtimes['plot_cache_hits'], report.runtimes['plot_cache_misses']))
         logger.info(" - {:.2f}s: Compressing report data".format(report.runtimes['total_compression']))
         logger.info("For more information, see the 'Run Time' section in {}".format(os.path.relpath(config.output_fn)))
 
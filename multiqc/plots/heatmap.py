@@ -3,18 +3,52 @@
 """ MultiQC functions to plot a heatmap """
 
 from __future__ import print_function
+import itertools
 import logging
+import math
+import numpy as np
 import random
+import sys
+import warnings
 
-from multiqc.utils import config, report
+from multiqc.utils import config, flat_plots, plot_strategy, report
 
 logger = logging.getLogger(__name__)
 
+try:
+    # Import matplot lib but avoid default X environment
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LinearSegmentedColormap
+except Exception as e:
+    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
+    # The lack of the library will be handled when plots are attempted
+    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
+    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
+    print(e)
+
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+# Same default colour scale as the HighCharts heatmap
+default_colstops = [
+    [0, '#313695'], [0.1, '#4575b4'], [0.2, '#74add1'], [0.3, '#abd9e9'],
+    [0.4, '#e0f3f8'], [0.5, '#ffffbf'], [0.6, '#fee090'], [0.7, '#fdae61'],
+    [0.8, '#f46d43'], [0.9, '#d73027'], [1, '#a50026']
+]
+
+# Load the template so that we can access its configuration
+# Do this lazily to mitigate import-spaghetti when running unit tests
+_template_mod = None
+def get_template_mod():
+    global _template_mod
+    if not _template_mod:
+        _template_mod = config.avail_templates[config.template].load()
+    return _template_mod
+
 def plot (data, xcats, ycats=None, pconfig=None):
     """ Plot a 2D heatmap.
-    :param data: List of lists, each a representing a row of values.
+    :param data: List of lists, each a representing a row of values, or a 2D NumPy array.
     :param xcats: Labels for x axis
     :param ycats: Labels for y axis. Defaults to same as x.
     :param pconfig: optional dict with config key:value pairs.
@@ -32,7 +66,18 @@ def plot (data, xcats, ycats=None, pconfig=None):
     if ycats is None:
         ycats = xcats
 
-    # Make a plot
+    # Average blocks of cells if the heatmap is too big
+    max_cells = pconfig.get('max_cells', config.heatmap_max_cells)
+    if max_cells is not None and len(ycats) * len(xcats) > max_cells:
+        data, xcats, ycats = aggregate_heatmap(data, xcats, ycats, max_cells)
+
+    # Make a plot - flat if it has too many cells to be interactive
+    if plot_strategy.choose('heatmap', None, len(ycats) * len(xcats), 1, pconfig) == 'flat':
+        try:
+            return matplotlib_heatmap(data, xcats, ycats, pconfig)
+        except Exception as e:
+            logger.error("############### Error making MatPlotLib figure! Falling back to HighCharts.")
+            logger.debug(e, exc_info=True)
     return highcharts_heatmap(data, xcats, ycats, pconfig)
 
 
@@ -45,11 +90,18 @@ def highcharts_heatmap (data, xcats, ycats, pconfig=None):
     if pconfig is None:
         pconfig = {}
 
-    # Reformat the data for highcharts
-    pdata = []
-    for i, arr in enumerate(data):
-        for j, val in enumerate(arr):
-            pdata.append([j,i,val])
+    # Reformat the data for highcharts. Large heatmaps are saved as a flat
+    # matrix instead, which the report expands to [x, y, value] points
+    matrix = None
+    if len(xcats) * len(ycats) >= config.heatmap_compact_min_cells:
+        matrix, triangle = heatmap_matrix(data, xcats, ycats)
+    else:
+        if isinstance(data, np.ndarray):
+            data = data.tolist()
+        pdata = []
+        for i, arr in enumerate(data):
+            for j, val in enumerate(arr):
+                pdata.append([j,i,val])
 
     # Get the plot ID
     if pconfig.get('id') is None:
@@ -75,10 +127,164 @@ def highcharts_heatmap (data, xcats, ycats, pconfig=None):
 
     report.plot_data[pconfig['id']] = {
         'plot_type': 'heatmap',
-        'data': pdata,
         'xcats': xcats,
         'ycats': ycats,
         'config': pconfig
     }
+    if matrix is None:
+        report.plot_data[pconfig['id']]['data'] = pdata
+    else:
+        report.plot_data[pconfig['id']]['matrix'] = matrix
+        report.plot_data[pconfig['id']]['triangle'] = triangle
 
     return html
+
+
+def heatmap_matrix(data, xcats, ycats):
+    """
+    Flatten heatmap rows into one row-major list of values. Symmetric heatmaps,
+    such as sample relatedness matrices, only keep the lower triangle (including
+    the diagonal): row i is stored as its first i+1 values.
+    Returns the list of values and whether it is a triangle.
+    """
+    if isinstance(data, np.ndarray):
+        triangle = list(xcats) == list(ycats) and data.shape == (len(xcats), len(xcats)) and \
+            np.array_equal(data, data.T, equal_nan=True)
+        if triangle:
+            return data[np.tril_indices(len(xcats))].tolist(), True
+        return data[:len(ycats), :len(xcats)].ravel().tolist(), False
+    triangle = list(xcats) == list(ycats) and len(data) == len(xcats) and \
+        all(len(row) == len(data) for row in data) and \
+        all(data[i][j] == data[j][i] for i in range(len(data)) for j in range(i))
+    if triangle:
+        matrix = list(itertools.chain.from_iterable(row[:i+1] for i, row in enumerate(data)))
+    else:
+        # Pad short rows so that every row has a value for each column
+        matrix = list(itertools.chain.from_iterable(
+            list(row[:len(xcats)]) + [None] * (len(xcats) - len(row)) for row in data))
+    return matrix, triangle
+
+
+def aggregate_heatmap(data, xcats, ycats, max_cells):
+    """
+    Shrink a heatmap to at most max_cells by averaging square blocks of cells.
+    Each block is labelled with the first and last of its categories.
+    Returns the new data, xcats and ycats.
+    """
+    block = int(math.ceil(math.sqrt(len(xcats) * len(ycats) / float(max_cells))))
+    nrows = int(math.ceil(len(ycats) / float(block)))
+    ncols = int(math.ceil(len(xcats) / float(block)))
+    values = np.full((nrows * block, ncols * block), np.nan)
+    if isinstance(data, np.ndarray):
+        values[:len(ycats), :len(xcats)] = data[:len(ycats), :len(xcats)]
+    else:
+        for i, row in enumerate(data[:len(ycats)]):
+            row = row[:len(xcats)]
+            values[i, :len(row)] = [np.nan if v is None else v for v in row]
+    with warnings.catch_warnings():
+        # Blocks with no values give NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        means = np.nanmean(values.reshape(nrows, block, ncols, block), axis=(1, 3))
+    newdata = [[None if math.isnan(v) else v for v in row] for row in means.tolist()]
+
+    def block_labels(cats):
+        labels = list()
+        for i in range(0, len(cats), block):
+            first, last = cats[i], cats[min(i + block, len(cats)) - 1]
+            labels.append(first if first == last else '{} - {}'.format(first, last))
+        return labels
+
+    logger.debug("Averaged heatmap from {} x {} to {} x {} cells".format(len(ycats), len(xcats), nrows, ncols))
+    return newdata, block_labels(xcats), block_labels(ycats)
+
+
+matplotlib_heatmap_config_keys = ['title', 'xTitle', 'yTitle', 'min', 'max', 'colstops', 'reverseColors', 'square']
+
+def matplotlib_heatmap (data, xcats, ycats, pconfig=None):
+    """
+    Plot a heatmap with MatPlotLib and return a HTML string. Either embeds a base64
+    encoded image within HTML or writes the plot and links to it. Should be called
+    by heatmap.plot(), used for heatmaps with too many cells to draw interactively.
+    """
+    if pconfig is None:
+        pconfig = {}
+
+    # Plot ID
+    if pconfig.get('id') is None:
+        pconfig['id'] = 'mqc_mplplot_'+''.join(random.sample(letters, 10))
+
+    # Sanitise plot ID and check for duplicates
+    pconfig['id'] = report.save_htmlid(pconfig['id'])
+    pid = report.save_htmlid('mqc_{}_1'.format(pconfig['id']), skiplint=True)
+
+    html = '<p class="text-info"><small><span class="glyphicon glyphicon-picture" aria-hidden="true"></span> ' + \
+          'Flat image plot. Toolbox functions such as highlighting / hiding samples will not work ' + \
+          '(see the <a href="http://multiqc.info/docs/#flat--interactive-plots" target="_blank">docs</a>).</small></p>'
+    html += '<div class="mqc_mplplot_plotgroup" id="{}">'.format(pconfig['id'])
+
+    # Draw the plot, save it to the plots directory if export is requested
+    # and either embed it as a base64 encoded image or link to the saved file
+    fig_pconfig = { k: pconfig[k] for k in matplotlib_heatmap_config_keys if k in pconfig }
+    img_src = flat_plots.plot_image(pid, matplotlib_heatmap_figure, (data, xcats, ycats, fig_pconfig),
+        base64_plots = getattr(get_template_mod(), 'base64_plots', True) is True)
+    html += '<div class="mqc_mplplot" id="{}"><img src="{}" /></div>'.format(pid, img_src)
+
+    # Close wrapping div
+    html += '</div>'
+
+    report.num_mpl_plots += 1
+
+    return html
+
+
+def matplotlib_heatmap_figure(data, xcats, ycats, pconfig):
+    """
+    Draw one MatPlotLib heatmap figure. Called by matplotlib_heatmap, possibly
+    in a worker process. Returns the figure and the savefig() keyword arguments.
+    """
+    if isinstance(data, np.ndarray):
+        values = data.astype(float)
+    else:
+        values = np.array([[np.nan if v is None else v for v in row] for row in data], dtype=float)
+
+    # Colour scale, reversed in the same way as the HighCharts heatmap
+    colstops = pconfig.get('colstops', default_colstops)
+    if pconfig.get('reverseColors'):
+        colstops = [[1 - stop, col] for stop, col in reversed(colstops)]
+    cmap = LinearSegmentedColormap.from_list('mqc_heatmap', [(stop, col) for stop, col in colstops])
+
+    # Set up figure
+    if pconfig.get('square'):
+        figsize = (10, 10)
+    else:
+        figsize = (14, min(30, max(6, len(ycats) / 4)))
+    fig = plt.figure(figsize=figsize, frameon=False)
+    axes = fig.add_subplot(111)
+    img = axes.imshow(values, cmap=cmap, aspect='equal' if pconfig.get('square') else 'auto',
+        interpolation='nearest', vmin=pconfig.get('min'), vmax=pconfig.get('max'))
+    fig.colorbar(img, ax=axes)
+
+    # Only label the cells if there is room for them
+    for cats, set_ticks, set_labels, rotation in [
+        (xcats, axes.set_xticks, axes.set_xticklabels, 90),
+        (ycats, axes.set_yticks, axes.set_yticklabels, 0)
+    ]:
+        if len(cats) <= 100:
+            set_ticks(range(len(cats)))
+            set_labels([str(c)[:20] for c in cats], rotation=rotation, fontsize=8)
+        else:
+            set_ticks([])
+    axes.xaxis.tick_top()
+    axes.tick_params(length=0)
+    for spine in axes.spines.values():
+        spine.set_visible(False)
+
+    # Titles
+    if 'xTitle' in pconfig:
+        axes.set_xlabel(pconfig['xTitle'])
+    if 'yTitle' in pconfig:
+        axes.set_ylabel(pconfig['yTitle'])
+    if 'title' in pconfig:
+        fig.suptitle(pconfig['title'], fontsize=16)
+
+    return fig, {'bbox_inches': 'tight'}
@@ -4,16 +4,17 @@
 
 from __future__ import print_function, division
 from collections import OrderedDict
-import base64
-import inspect
 import io
+import itertools
 import logging
+import numpy as np
 import os
 import random
 import re
 import sys
+import warnings
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, flat_plots, plot_strategy, report, util_functions
 logger = logging.getLogger(__name__)
 
 try:
@@ -62,23 +63,17 @@ def plot (data, pconfig=None):
 
     # Validate config if linting
     if config.lint:
-        # Get module name
-        modname = ''
-        callstack = inspect.stack()
-        for n in callstack:
-            if 'multiqc/modules/' in n[1] and 'base_module.py' not in n[1]:
-                callpath = n[1].split('multiqc/modules/',1)[-1]
-                modname = '>{}< '.format(callpath)
-                break
+        # Get module name (only when needed, as this is slow)
+        modname = lambda: report.lint_callsite()[0]
         # Look for essential missing pconfig keys
         for k in ['id', 'title', 'ylab']:
             if k not in pconfig:
-                errmsg = "LINT: {}Linegraph pconfig was missing key '{}'".format(modname, k)
+                errmsg = "LINT: {}Linegraph pconfig was missing key '{}'".format(modname(), k)
                 logger.error(errmsg)
                 report.lint_errors.append(errmsg)
         # Check plot title format
         if not re.match( r'^[^:]*\S: \S[^:]*$', pconfig.get('title', '')):
-            errmsg = "LINT: {} Linegraph title did not match format 'Module: Plot Name' (found '{}')".format(modname, pconfig.get('title', ''))
+            errmsg = "LINT: {} Linegraph title did not match format 'Module: Plot Name' (found '{}')".format(modname(), pconfig.get('title', ''))
             logger.error(errmsg)
             report.lint_errors.append(errmsg)
 
@@ -154,6 +149,9 @@ def plot (data, pconfig=None):
                 thisplotdata.append(this_series)
         plotdata.append(thisplotdata)
 
+    # Number of samples in each dataset, before any annotation series
+    n_samples = [len(d) for d in plotdata]
+
     # Add on annotation data series
     try:
         if pconfig.get('extra_series'):
@@ -172,7 +170,21 @@ def plot (data, pconfig=None):
     try:
         return get_template_mod().linegraph(plotdata, pconfig)
     except (AttributeError, TypeError):
-        if config.plots_force_flat or (not config.plots_force_interactive and len(plotdata[0]) > config.plots_flat_numseries):
+        n_points = max([len(series['data']) for d in plotdata for series in d] or [0])
+        strategy = plot_strategy.choose('linegraph', len(plotdata[0]), n_points, len(plotdata), pconfig)
+        html = ''
+        if strategy == 'aggregate':
+            aggdata = aggregate_line_data(plotdata, n_samples)
+            if aggdata is None:
+                strategy = 'flat'
+            else:
+                plotdata = aggdata
+                html = '<p class="text-info"><small><span class="glyphicon glyphicon-stats" aria-hidden="true"></span> ' + \
+                    'Summary of {} samples: the median, 25th / 75th and 5th / 95th percentiles and the samples '.format(max(n_samples)) + \
+                    'furthest from the median (see the <a href="http://multiqc.info/docs/#automatic-plot-types" target="_blank">docs</a>).</small></p>'
+        elif strategy == 'downsampled':
+            pconfig.setdefault('max_points', config.plots_auto_max_points // len(plotdata))
+        if strategy == 'flat':
             try:
                 return matplotlib_linegraph(plotdata, pconfig)
             except Exception as e:
@@ -184,7 +196,7 @@ def plot (data, pconfig=None):
             if config.export_plots:
                 matplotlib_linegraph(plotdata, pconfig)
             # Return HTML for HighCharts dynamic plot
-            return highcharts_linegraph(plotdata, pconfig)
+            return html + highcharts_linegraph(plotdata, pconfig)
 
 
 
@@ -261,6 +273,10 @@ def highcharts_linegraph (plotdata, pconfig=None):
     return html
 
 
+# pconfig keys used to draw flat line graphs
+matplotlib_linegraph_config_keys = ['xlab', 'ylab', 'data_labels', 'ymin', 'ymax', 'yFloor', 'yCeiling', 'yMinRange',
+    'xmin', 'xmax', 'xFloor', 'xCeiling', 'xMinRange', 'title', 'categories', 'yPlotBands', 'xPlotBands']
+
 def matplotlib_linegraph (plotdata, pconfig=None):
     """
     Plot a line graph with Matplot lib and return a HTML string. Either embeds a base64
@@ -293,10 +309,6 @@ def matplotlib_linegraph (plotdata, pconfig=None):
           '(see the <a href="http://multiqc.info/docs/#flat--interactive-plots" target="_blank">docs</a>).</small></p>'
     html += '<div class="mqc_mplplot_plotgroup" id="{}">'.format(pconfig['id'])
 
-    # Same defaults as HighCharts for consistency
-    default_colors = ['#7cb5ec', '#434348', '#90ed7d', '#f7a35c', '#8085e9',
-                      '#f15c80', '#e4d354', '#2b908f', '#f45b5b', '#91e8e1']
-
     # Buttons to cycle through different datasets
     if len(plotdata) > 1 and not config.simple_output:
         html += '<div class="btn-group mpl_switch_group mqc_mplplot_bargraph_switchds">\n'
@@ -349,152 +361,146 @@ def matplotlib_linegraph (plotdata, pconfig=None):
         else:
             util_functions.write_data_file(fdata, pid)
 
-        # Set up figure
-        fig = plt.figure(figsize=(14, 6), frameon=False)
-        axes = fig.add_subplot(111)
+        # Should this plot be hidden on report load?
+        hidediv = ''
+        if pidx > 0:
+            hidediv = ' style="display:none;"'
 
-        # Go through data series
-        for idx, d in enumerate(pdata):
+        # Draw the plot, save it to the plots directory if export is requested
+        # and either embed it as a base64 encoded image or link to the saved file
+        fig_pconfig = { k: pconfig[k] for k in matplotlib_linegraph_config_keys if k in pconfig }
+        img_src = flat_plots.plot_image(pid, matplotlib_linegraph_figure, (pdata, fig_pconfig, pidx),
+            base64_plots = getattr(get_template_mod(), 'base64_plots', True) is True)
+        html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, img_src)
 
-            # Default colour index
-            cidx = idx
-            while cidx >= len(default_colors):
-                cidx -= len(default_colors)
 
-            # Line style
-            linestyle = 'solid'
-            if d.get('dashStyle', None) == 'Dash':
-                linestyle = 'dashed'
+    # Close wrapping div
+    html += '</div>'
 
-            # Reformat data (again)
-            try:
-                axes.plot([x[0] for x in d['data']], [x[1] for x in d['data']], label=d['name'], color=d.get('color', default_colors[cidx]), linestyle=linestyle, linewidth=1, marker=None)
-            except TypeError:
-                # Categorical data on x axis
-                axes.plot(d['data'], label=d['name'], color=d.get('color', default_colors[cidx]), linewidth=1, marker=None)
+    report.num_mpl_plots += 1
 
-        # Tidy up axes
-        axes.tick_params(labelsize=8, direction='out', left=False, right=False, top=False, bottom=False)
-        axes.set_xlabel(pconfig.get('xlab', ''))
-        axes.set_ylabel(pconfig.get('ylab', ''))
+    return html
 
-        # Dataset specific y label
-        try:
-            axes.set_ylabel(pconfig['data_labels'][pidx]['ylab'])
-        except:
-            pass
 
-        # Axis limits
-        default_ylimits = axes.get_ylim()
-        ymin = default_ylimits[0]
-        if 'ymin' in pconfig:
-            ymin = pconfig['ymin']
-        elif 'yFloor' in pconfig:
-            ymin = max(pconfig['yFloor'], default_ylimits[0])
-        ymax = default_ylimits[1]
-        if 'ymax' in pconfig:
-            ymax = pconfig['ymax']
-        elif 'yCeiling' in pconfig:
-            ymax = min(pconfig['yCeiling'], default_ylimits[1])
-        if (ymax - ymin) < pconfig.get('yMinRange', 0):
-            ymax = ymin + pconfig['yMinRange']
-        axes.set_ylim((ymin, ymax))
-
-        # Dataset specific ymax
-        try:
-            axes.set_ylim((ymin, pconfig['data_labels'][pidx]['ymax']))
-        except:
-            pass
+def matplotlib_linegraph_figure(pdata, pconfig, pidx):
+    """
+    Draw one MatPlotLib line graph figure. Called by matplotlib_linegraph, possibly
+    in a worker process. Returns the figure and the savefig() keyword arguments.
+    """
 
-        default_xlimits = axes.get_xlim()
-        xmin = default_xlimits[0]
-        if 'xmin' in pconfig:
-            xmin = pconfig['xmin']
-        elif 'xFloor' in pconfig:
-            xmin = max(pconfig['xFloor'], default_xlimits[0])
-        xmax = default_xlimits[1]
-        if 'xmax' in pconfig:
-            xmax = pconfig['xmax']
-        elif 'xCeiling' in pconfig:
-            xmax = min(pconfig['xCeiling'], default_xlimits[1])
-        if (xmax - xmin) < pconfig.get('xMinRange', 0):
-            xmax = xmin + pconfig['xMinRange']
-        axes.set_xlim((xmin, xmax))
-
-        # Plot title
-        if 'title' in pconfig:
-            plt.text(0.5, 1.05, pconfig['title'], horizontalalignment='center', fontsize=16, transform=axes.transAxes)
-        axes.grid(True, zorder=10, which='both', axis='y', linestyle='-', color='#dedede', linewidth=1)
-
-        # X axis categories, if specified
-        if 'categories' in pconfig:
-            axes.set_xticks([i for i,v in enumerate(pconfig['categories'])])
-            axes.set_xticklabels(pconfig['categories'])
-
-        # Axis lines
-        xlim = axes.get_xlim()
-        axes.plot([xlim[0], xlim[1]], [0, 0], linestyle='-', color='#dedede', linewidth=2)
-        axes.set_axisbelow(True)
-        axes.spines['right'].set_visible(False)
-        axes.spines['top'].set_visible(False)
-        axes.spines['bottom'].set_visible(False)
-        axes.spines['left'].set_visible(False)
-
-        # Background colours, if specified
-        if 'yPlotBands' in pconfig:
-            xlim = axes.get_xlim()
-            for pb in pconfig['yPlotBands']:
-                axes.barh(pb['from'], xlim[1], height = pb['to']-pb['from'], left=xlim[0], color=pb['color'], linewidth=0, zorder=0, align='edge')
-        if 'xPlotBands' in pconfig:
-            ylim = axes.get_ylim()
-            for pb in pconfig['xPlotBands']:
-                axes.bar(pb['from'], ylim[1], width = pb['to']-pb['from'], bottom=ylim[0], color=pb['color'], linewidth=0, zorder=0, align='edge')
-
-        # Tight layout - makes sure that legend fits in and stuff
-        if len(pdata) <= 15:
-            axes.legend(loc='lower center', bbox_to_anchor=(0, -0.22, 1, .102), ncol=5, mode='expand', fontsize=8, frameon=False)
-            plt.tight_layout(rect=[0,0.08,1,0.92])
-        else:
-            plt.tight_layout(rect=[0,0,1,0.92])
+    # Same defaults as HighCharts for consistency
+    default_colors = ['#7cb5ec', '#434348', '#90ed7d', '#f7a35c', '#8085e9',
+                      '#f15c80', '#e4d354', '#2b908f', '#f45b5b', '#91e8e1']
 
-        # Should this plot be hidden on report load?
-        hidediv = ''
-        if pidx > 0:
-            hidediv = ' style="display:none;"'
+    # Set up figure
+    fig = plt.figure(figsize=(14, 6), frameon=False)
+    axes = fig.add_subplot(111)
 
-        # Save the plot to the data directory if export is requests
-        if config.export_plots:
-            for fformat in config.export_plot_formats:
-                # Make the directory if it doesn't already exist
-                plot_dir = os.path.join(config.plots_dir, fformat)
-                if not os.path.exists(plot_dir):
-                    os.makedirs(plot_dir)
-                # Save the plot
-                plot_fn = os.path.join(plot_dir, '{}.{}'.format(pid, fformat))
-                fig.savefig(plot_fn, format=fformat, bbox_inches='tight')
-
-        # Output the figure to a base64 encoded string
-        if getattr(get_template_mod(), 'base64_plots', True) is True:
-            img_buffer = io.BytesIO()
-            fig.savefig(img_buffer, format='png', bbox_inches='tight')
-            b64_img = base64.b64encode(img_buffer.getvalue()).decode('utf8')
-            img_buffer.close()
-            html += '<div class="mqc_mplplot" id="{}"{}><img src="data:image/png;base64,{}" /></div>'.format(pid, hidediv, b64_img)
-
-        # Save to a file and link <img>
-        else:
-            plot_relpath = os.path.join(config.plots_dir_name, 'png', '{}.png'.format(pid))
-            html += '<div class="mqc_mplplot" id="{}"{}><img src="{}" /></div>'.format(pid, hidediv, plot_relpath)
+    # Go through data series
+    for idx, d in enumerate(pdata):
 
-        plt.close(fig)
+        # Default colour index
+        cidx = idx
+        while cidx >= len(default_colors):
+            cidx -= len(default_colors)
 
+        # Line style
+        linestyle = 'solid'
+        if d.get('dashStyle', None) == 'Dash':
+            linestyle = 'dashed'
 
-    # Close wrapping div
-    html += '</div>'
+        # Reformat data (again)
+        try:
+            axes.plot([x[0] for x in d['data']], [x[1] for x in d['data']], label=d['name'], color=d.get('color', default_colors[cidx]), linestyle=linestyle, linewidth=1, marker=None)
+        except TypeError:
+            # Categorical data on x axis
+            axes.plot(d['data'], label=d['name'], color=d.get('color', default_colors[cidx]), linewidth=1, marker=None)
 
-    report.num_mpl_plots += 1
+    # Tidy up axes
+    axes.tick_params(labelsize=8, direction='out', left=False, right=False, top=False, bottom=False)
+    axes.set_xlabel(pconfig.get('xlab', ''))
+    axes.set_ylabel(pconfig.get('ylab', ''))
 
-    return html
+    # Dataset specific y label
+    try:
+        axes.set_ylabel(pconfig['data_labels'][pidx]['ylab'])
+    except:
+        pass
+
+    # Axis limits
+    default_ylimits = axes.get_ylim()
+    ymin = default_ylimits[0]
+    if 'ymin' in pconfig:
+        ymin = pconfig['ymin']
+    elif 'yFloor' in pconfig:
+        ymin = max(pconfig['yFloor'], default_ylimits[0])
+    ymax = default_ylimits[1]
+    if 'ymax' in pconfig:
+        ymax = pconfig['ymax']
+    elif 'yCeiling' in pconfig:
+        ymax = min(pconfig['yCeiling'], default_ylimits[1])
+    if (ymax - ymin) < pconfig.get('yMinRange', 0):
+        ymax = ymin + pconfig['yMinRange']
+    axes.set_ylim((ymin, ymax))
+
+    # Dataset specific ymax
+    try:
+        axes.set_ylim((ymin, pconfig['data_labels'][pidx]['ymax']))
+    except:
+        pass
+
+    default_xlimits = axes.get_xlim()
+    xmin = default_xlimits[0]
+    if 'xmin' in pconfig:
+        xmin = pconfig['xmin']
+    elif 'xFloor' in pconfig:
+        xmin = max(pconfig['xFloor'], default_xlimits[0])
+    xmax = default_xlimits[1]
+    if 'xmax' in pconfig:
+        xmax = pconfig['xmax']
+    elif 'xCeiling' in pconfig:
+        xmax = min(pconfig['xCeiling'], default_xlimits[1])
+    if (xmax - xmin) < pconfig.get('xMinRange', 0):
+        xmax = xmin + pconfig['xMinRange']
+    axes.set_xlim((xmin, xmax))
+
+    # Plot title
+    if 'title' in pconfig:
+        plt.text(0.5, 1.05, pconfig['title'], horizontalalignment='center', fontsize=16, transform=axes.transAxes)
+    axes.grid(True, zorder=10, which='both', axis='y', linestyle='-', color='#dedede', linewidth=1)
+
+    # X axis categories, if specified
+    if 'categories' in pconfig:
+        axes.set_xticks([i for i,v in enumerate(pconfig['categories'])])
+        axes.set_xticklabels(pconfig['categories'])
+
+    # Axis lines
+    xlim = axes.get_xlim()
+    axes.plot([xlim[0], xlim[1]], [0, 0], linestyle='-', color='#dedede', linewidth=2)
+    axes.set_axisbelow(True)
+    axes.spines['right'].set_visible(False)
+    axes.spines['top'].set_visible(False)
+    axes.spines['bottom'].set_visible(False)
+    axes.spines['left'].set_visible(False)
+
+    # Background colours, if specified
+    if 'yPlotBands' in pconfig:
+        xlim = axes.get_xlim()
+        for pb in pconfig['yPlotBands']:
+            axes.barh(pb['from'], xlim[1], height = pb['to']-pb['from'], left=xlim[0], color=pb['color'], linewidth=0, zorder=0, align='edge')
+    if 'xPlotBands' in pconfig:
+        ylim = axes.get_ylim()
+        for pb in pconfig['xPlotBands']:
+            axes.bar(pb['from'], ylim[1], width = pb['to']-pb['from'], bottom=ylim[0], color=pb['color'], linewidth=0, zorder=0, align='edge')
+
+    # Tight layout - makes sure that legend fits in and stuff
+    if len(pdata) <= 15:
+        axes.legend(loc='lower center', bbox_to_anchor=(0, -0.22, 1, .102), ncol=5, mode='expand', fontsize=8, frameon=False)
+        plt.tight_layout(rect=[0,0.08,1,0.92])
+    else:
+        plt.tight_layout(rect=[0,0,1,0.92])
+
+    return fig, {'bbox_inches': 'tight'}
 
 
 def smooth_line_data(data, numpoints, sumcounts=True):
@@ -534,3 +540,160 @@ def smooth_line_data(data, numpoints, sumcounts=True):
         smoothed_data[s_name] = smoothed_d
 
     return smoothed_data
+
+
+def aggregate_line_data(plotdata, n_samples):
+    """
+    Summarise the samples in each dataset as lines for the median, 25th / 75th and
+    5th / 95th percentiles, and keep the config.plots_aggregate_outliers samples that
+    are furthest from the median. Series are interpolated onto a shared x axis of up
+    to 1000 points. Annotation series after the samples are kept as they are.
+    Returns None if the data can't be summarised, eg. for categorical x axes.
+    """
+    aggdata = list()
+    for dataset, n in zip(plotdata, n_samples):
+        samples = dataset[:n]
+        lines = list()
+        for series in samples:
+            try:
+                if len(series['data']) > 0 and set(map(len, series['data'])) != {2}:
+                    raise ValueError
+                xy = np.fromiter(itertools.chain.from_iterable(series['data']), dtype=float).reshape(-1, 2)
+            except (TypeError, ValueError):
+                return None
+            xy = xy[np.isfinite(xy).all(axis=1)]
+            lines.append(xy[np.argsort(xy[:, 0], kind='stable')])
+        if len(lines) == 0:
+            aggdata.append(dataset)
+            continue
+
+        # Shared x axis, keeping the spacing of the original x values
+        xvals = np.unique(np.concatenate([xy[:, 0] for xy in lines]))
+        if len(xvals) > 1000:
+            xvals = np.unique(xvals[np.linspace(0, len(xvals) - 1, 1000).round().astype(int)])
+        ymatrix = np.full((len(lines), len(xvals)), np.nan)
+        for i, xy in enumerate(lines):
+            if len(xy) > 0:
+                ymatrix[i] = np.interp(xvals, xy[:, 0], xy[:, 1], left=np.nan, right=np.nan)
+
+        with warnings.catch_warnings():
+            # x values that no sample covers give all-NaN columns
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            p5, p25, median, p75, p95 = np.nanpercentile(ymatrix, [5, 25, 50, 75, 95], axis=0)
+            spread = np.where(p95 - p5 > 0, p95 - p5, np.nan)
+            scores = np.nanmean(np.abs(ymatrix - median) / spread, axis=1)
+        scores = np.nan_to_num(scores, nan=0.0)
+        outliers = set(int(i) for i in np.argsort(-scores, kind='stable')[:config.plots_aggregate_outliers] if scores[i] > 0)
+
+        def summary_series(name, yvals, color, dashed=False):
+            keep = np.isfinite(yvals)
+            series = {
+                'name': name,
+                'data': [[float(x), float(y)] for x, y in zip(xvals[keep], yvals[keep])],
+                'color': color
+            }
+            if dashed:
+                series['dashStyle'] = 'Dash'
+            return series
+
+        newdata = [
+            summary_series('Median', median, '#434348'),
+            summary_series('25th percentile', p25, '#7cb5ec', dashed=True),
+            summary_series('75th percentile', p75, '#7cb5ec', dashed=True),
+            summary_series('5th percentile', p5, '#b3b3b3', dashed=True),
+            summary_series('95th percentile', p95, '#b3b3b3', dashed=True),
+        ]
+        newdata.extend(series for i, series in enumerate(samples) if i in outliers)
+        newdata.extend(dataset[n:])
+        aggdata.append(newdata)
+    return aggdata
+
+
+def downsample_plot_data(plot_data):
+    """
+    Return a copy of report.plot_data for the report HTML, with dense line graph series
+    downsampled. Each dataset of an xy line plot can have up to config.linegraph_max_points
+    points in total (or pconfig 'max_points'). Above that, series are cut down with
+    lttb_indices() to share the budget, keeping at least 100 points in each series.
+    Plots that don't need downsampling are not copied, and plot_data itself is not
+    changed, so the full data is still saved in multiqc_data.
+    """
+    report_plot_data = OrderedDict()
+    for pid, pdata in plot_data.items():
+        report_plot_data[pid] = pdata
+        if pdata.get('plot_type') != 'xy_line' or 'categories' in pdata.get('config', {}):
+            continue
+        max_points = pdata.get('config', {}).get('max_points', config.linegraph_max_points)
+        if max_points is None:
+            continue
+        datasets = list()
+        for dataset in pdata['datasets']:
+            num_points = sum(len(series['data']) for series in dataset)
+            if num_points <= max_points or len(dataset) == 0:
+                datasets.append(dataset)
+                continue
+            series_points = max(100, max_points // len(dataset))
+            new_dataset = list()
+            changed = False
+            for series in dataset:
+                if len(series['data']) > series_points:
+                    try:
+                        if set(map(len, series['data'])) != {2}:
+                            raise ValueError
+                        xy = np.fromiter(itertools.chain.from_iterable(series['data']), dtype=float).reshape(-1, 2)
+                    except (TypeError, ValueError):
+                        xy = None
+                    if xy is not None and np.isfinite(xy).all():
+                        series = series.copy()
+                        series['data'] = [series['data'][i] for i in lttb_indices(xy[:, 0], xy[:, 1], series_points)]
+                        changed = True
+                new_dataset.append(series)
+            if changed:
+                logger.debug("Downsampled plot '{}' from {} to {} points".format(pid, num_points, sum(len(series['data']) for series in new_dataset)))
+                datasets.append(new_dataset)
+            else:
+                datasets.append(dataset)
+        if any(new is not old for new, old in zip(datasets, pdata['datasets'])):
+            report_plot_data[pid] = pdata.copy()
+            report_plot_data[pid]['datasets'] = datasets
+    return report_plot_data
+
+
+def lttb_indices(x, y, numpoints):
+    """
+    Pick which of the x-y points to keep to downsample a line to numpoints, using
+    Largest-Triangle-Three-Buckets. This keeps the points that matter to the shape of
+    the line (peaks and troughs) rather than evenly spaced ones. The first and last
+    points are always kept, the rest are split into buckets and the point making the
+    largest triangle with its neighbouring buckets is kept from each.
+
+    This is the usual LTTB, except that the triangle for each bucket uses the average
+    of the previous bucket rather than the point that was picked from it. That way
+    all buckets can be done at once with numpy.
+    """
+    n = len(x)
+    if numpoints >= n or numpoints < 3:
+        return np.arange(n)
+
+    # Buckets for all points between the first and last
+    every = (n - 2) / (numpoints - 2)
+    edges = np.floor(np.arange(numpoints - 1) * every).astype(int) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    bucket = np.repeat(np.arange(numpoints - 2), counts)
+    px = x[1:-1]
+    py = y[1:-1]
+
+    # Average point of each bucket, with the first and last points either side
+    avg_x = np.add.reduceat(px, edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(py, edges[:-1] - 1) / counts
+    ax = np.concatenate(([x[0]], avg_x[:-1]))[bucket]
+    ay = np.concatenate(([y[0]], avg_y[:-1]))[bucket]
+    cx = np.concatenate((avg_x[1:], [x[-1]]))[bucket]
+    cy = np.concatenate((avg_y[1:], [y[-1]]))[bucket]
+
+    # Twice the triangle area for each point, keep the first largest in each bucket
+    area = np.abs((ax - cx) * (py - ay) - (ax - px) * (cy - ay))
+    is_max = np.flatnonzero(area == np.maximum.reduceat(area, edges[:-1] - 1)[bucket])
+    _, first = np.unique(bucket[is_max], return_index=True)
+    return np.concatenate(([0], is_max[first] + 1, [n - 1]))
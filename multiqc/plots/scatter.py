@@ -3,9 +3,11 @@
 """ MultiQC functions to plot a scatter plot """
 
 import logging
+import math
+import numpy as np
 import random
 
-from multiqc.utils import config, report
+from multiqc.utils import config, plot_strategy, report
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +69,13 @@ def plot (data, pconfig=None):
                 d.append(this_series)
         plotdata.append(d)
 
+    # Thin out the points if there are too many for the browser
+    n_points = max([len(d) for d in plotdata] or [0])
+    if plot_strategy.choose('scatter', None, n_points, len(plotdata), pconfig) == 'downsampled':
+        max_points = config.plots_auto_max_points // len(plotdata)
+        for idx, d in enumerate(plotdata):
+            plotdata[idx] = thin_scatter_points(d, max_points)
+
     # Add on annotation data series
     try:
         if pconfig.get('extra_series'):
@@ -138,3 +147,52 @@ def highcharts_scatter_plot (plotdata, pconfig=None):
     }
 
     return html
+
+
+def thin_scatter_points(points, max_points):
+    """
+    Cut a scatter plot dataset down to about max_points with grid_thin_indices().
+    Points with different colours are never merged, and points without numeric
+    x and y values are always kept.
+    """
+    if len(points) <= max_points:
+        return points
+    try:
+        xy = np.array([[p['x'], p['y']] for p in points], dtype=float)
+    except (TypeError, ValueError):
+        return points
+    colours = dict()
+    groups = [colours.setdefault(p.get('color'), len(colours)) for p in points]
+    thinned = [points[i] for i in grid_thin_indices(xy[:, 0], xy[:, 1], max_points, groups)]
+    logger.debug("Thinned scatter plot from {} to {} points".format(len(points), len(thinned)))
+    return thinned
+
+
+def grid_thin_indices(x, y, max_points, groups=None):
+    """
+    Pick which points to keep to thin out a scatter plot to about max_points, by
+    keeping the first point in each cell of a grid across the plot. Unlike random
+    sampling, this keeps outliers and the overall shape of the data.
+    :param x: x values
+    :param y: y values
+    :param max_points: Roughly how many points to keep
+    :param groups: Optional integer for each point (eg. a colour), points in
+                   different groups are never merged
+    :return: Sorted NumPy array of the indices to keep
+    """
+    xy = np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+    finite = np.isfinite(xy).all(axis=1)
+    grid = int(math.sqrt(max_points))
+    cells = np.zeros(len(xy), dtype=np.int64)
+    if finite.any():
+        mins = xy[finite].min(axis=0)
+        ranges = xy[finite].max(axis=0) - mins
+        ranges[~(ranges > 0)] = 1
+        cxy = np.floor((xy[finite] - mins) / ranges * (grid - 1)).astype(np.int64)
+        cells[finite] = cxy[:, 0] * grid + cxy[:, 1]
+    if groups is not None:
+        cells += np.asarray(groups, dtype=np.int64) * grid * grid
+    # Points without a cell get a key of their own, so that they are always kept
+    cells[~finite] = -1 - np.arange(np.count_nonzero(~finite))
+    first = np.unique(cells, return_index=True)[1]
+    return np.sort(first)
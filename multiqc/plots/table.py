@@ -4,7 +4,9 @@
 
 from collections import defaultdict, OrderedDict
 import logging
+import numpy as np
 import random
+import re
 
 from multiqc.utils import config, report, util_functions, mqc_colour
 from multiqc.plots import table_object, beeswarm
@@ -49,6 +51,181 @@ def plot (data, headers=None, pconfig=None):
         return make_table ( dt )
 
 
+# Conditional formatting comparisons, in the order that they are tested
+cond_formatting_cmp_keys = ['s_eq', 's_contains', 's_ne', 'eq', 'ne', 'gt', 'lt']
+
+def compile_cond_formatting_rules(rid):
+    """ Compile the conditional formatting rules that apply to a table column
+    into a small program that can be applied to the whole column at once.
+    All of the rules for a format type are merged - sets of strings, a regex
+    for substrings and arrays / thresholds for numbers - as a cell gets the
+    format type if it matches any of its comparisons.
+    :param rid: The column ID, used to find column-specific rules
+    :return: A list of (colour, tests), in increasing order of priority, and a list
+             of (rule, warn_all) for rules that log a warning for cells they can't be
+             applied to - cells that aren't numbers, or all cells if warn_all is True
+    """
+    ftypes = OrderedDict()
+    for cfc in config.table_cond_formatting_colours:
+        for cfck in cfc: # should always be one, but you never know
+            ftypes.pop(cfck, None)
+            ftypes[cfck] = cfc[cfck]
+
+    program = OrderedDict([ (ftype, defaultdict(list)) for ftype in ftypes ])
+    warnings = list()
+    # Find general rules followed by column-specific rules
+    for cfk in ['all_columns', rid]:
+        if cfk in config.table_cond_formatting_rules:
+            # Loop through match types
+            for ftype in program:
+                # Loop through array of comparison types
+                for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
+                    numeric, invalid = compile_cond_formatting_cmp(cmp, program[ftype])
+                    if numeric or invalid:
+                        warnings.append((cmp, invalid))
+
+    compiled = list()
+    for ftype, tests in program.items():
+        if len(tests) == 0:
+            continue
+        gt = [ v for v in tests['gt'] if v == v ]
+        lt = [ v for v in tests['lt'] if v == v ]
+        compiled.append((ftypes[ftype], {
+            's_eq': set(tests['s_eq']),
+            's_contains': re.compile('|'.join([ re.escape(v) for v in tests['s_contains'] ])) if tests['s_contains'] else None,
+            's_ne': set(tests['s_ne']),
+            'eq': np.array(tests['eq'], dtype=float),
+            'ne': np.array(tests['ne'], dtype=float),
+            'gt': min(gt) if gt else None,
+            'lt': max(lt) if lt else None,
+        }))
+    return compiled, warnings
+
+def compile_cond_formatting_cmp(cmp, tests):
+    """ Add the comparisons of a single conditional formatting rule to the tests for
+    its format type - lowercase strings and floats. Each comparison should be a dict
+    with single key: val. Numeric comparisons after one that can't be made are
+    never tested, as cells stop being tested against a rule at the first error.
+    :return: Whether the rule has numeric comparisons, and whether one of them can never be made
+    """
+    if not isinstance(cmp, dict):
+        try:
+            invalid = any([ k in cmp for k in cond_formatting_cmp_keys ])
+        except TypeError:
+            invalid = True
+        return False, invalid
+    numeric = False
+    for k in cond_formatting_cmp_keys:
+        if k in cmp:
+            if k.startswith('s_'):
+                tests[k].append(str(cmp[k]).lower())
+                continue
+            numeric = True
+            try:
+                tests[k].append(float(cmp[k]))
+            except (TypeError, ValueError, OverflowError):
+                return True, True
+    return numeric, False
+
+def cond_formatting_colours(cond_formatting, vals):
+    """ Apply conditional formatting rules from compile_cond_formatting_rules()
+    to all of the values in a table column.
+    Returns a list with the background colour to use for each value, or None """
+    compiled, warnings = cond_formatting
+    if len(compiled) == 0 and len(warnings) == 0:
+        return [None] * len(vals)
+
+    svals = [ str(val).lower() for val in vals ]
+    if all(type(val) in (int, float) for val in vals):
+        fvals = np.asarray(vals, dtype=float)
+        valid = np.ones(len(vals), dtype=bool)
+    else:
+        fvals = np.zeros(len(vals))
+        valid = np.zeros(len(vals), dtype=bool)
+        for i, val in enumerate(vals):
+            try:
+                fvals[i] = float(val)
+                valid[i] = True
+            except (TypeError, ValueError, OverflowError):
+                pass
+
+    for cmp, warn_all in warnings:
+        for i in (range(len(vals)) if warn_all else np.flatnonzero(~valid)):
+            logger.warning("Not able to apply table conditional formatting to '{}' ({})".format(vals[i], cmp))
+
+    # Apply in order of config keys, so that later format types win
+    bgcols = np.full(len(vals), None, dtype=object)
+    for colour, tests in compiled:
+        matched = np.zeros(len(vals), dtype=bool)
+        if tests['s_eq']:
+            matched |= np.array([ s in tests['s_eq'] for s in svals ], dtype=bool)
+        if tests['s_contains'] is not None:
+            matched |= np.array([ tests['s_contains'].search(s) is not None for s in svals ], dtype=bool)
+        if tests['s_ne']:
+            # A value is different to at least one of two or more strings
+            if len(tests['s_ne']) > 1:
+                matched[:] = True
+            else:
+                matched |= np.array([ s not in tests['s_ne'] for s in svals ], dtype=bool)
+        num_matched = np.zeros(len(vals), dtype=bool)
+        if len(tests['eq']) > 0:
+            num_matched |= np.isin(fvals, tests['eq'])
+        if len(tests['ne']) > 0:
+            ne_vals = np.unique(tests['ne'])
+            if len(ne_vals) > 1 or np.isnan(ne_vals).any():
+                num_matched[:] = True
+            else:
+                num_matched |= fvals != ne_vals[0]
+        if tests['gt'] is not None:
+            num_matched |= fvals > tests['gt']
+        if tests['lt'] is not None:
+            num_matched |= fvals < tests['lt']
+        matched |= num_matched & valid
+        bgcols[matched] = colour
+    return bgcols.tolist()
+
+def is_lazy_table(pconfig, num_rows):
+    """ Whether a table should be rendered lazily in the browser instead of as HTML """
+    if config.simple_output:
+        return False
+    if pconfig.get('lazy') is not None:
+        return pconfig['lazy'] is True
+    return bool(config.table_lazy_min_rows) and num_rows >= config.table_lazy_min_rows
+
+def lazy_table_data(rids, t_rows, t_row_keys, dt):
+    """ Table data for rendering a table in the browser, saved with the
+    report plot data. Each column has lists of the cell values (used for
+    sorting), formatted text, bar widths and colours, with one entry per
+    row - or None where a sample has no value.
+    :param rids: Column IDs, in table order
+    :param t_rows: Dict of sample name: dict of column ID: (value, text, bar width, colour)
+    :param t_row_keys: Sample names, in table order
+    :param dt: MultiQC datatable object
+    :return: Dict of the data for the table
+    """
+    scales = dict()
+    for idx, k, header in dt.get_headers_in_order():
+        scales[header['rid']] = bool(header['scale'])
+    columns = list()
+    for rid in rids:
+        col = { 'rid': rid, 'scale': scales.get(rid, False), 'values': [], 'text': [], 'bars': [], 'colours': [] }
+        for s_name in t_row_keys:
+            val, valstring, percentage, colour = t_rows[s_name].get(rid, (None, None, None, None))
+            if val is not None and not isinstance(val, str):
+                try:
+                    val = float(val)
+                except (TypeError, ValueError):
+                    val = str(val)
+            col['values'].append(val)
+            col['text'].append(valstring)
+            col['bars'].append(round(percentage, 2) if percentage is not None else None)
+            col['colours'].append(colour)
+        columns.append(col)
+    return {
+        'samples': list(t_row_keys),
+        'columns': columns
+    }
+
 def make_table (dt):
     """
     Build the HTML needed for a MultiQC table.
@@ -68,6 +245,10 @@ def make_table (dt):
     if table_title is None:
         table_title = table_id.replace("_", " ").title()
 
+    # Big tables are sent to the browser as data and rendered as they are scrolled
+    num_rows = len(set(s_name for d in dt.data for s_name in d.keys()))
+    lazy = is_lazy_table(dt.pconfig, num_rows)
+
     for idx, k, header in dt.get_headers_in_order():
 
         rid = header['rid']
@@ -128,7 +309,11 @@ def make_table (dt):
         else:
             c_scale = mqc_colour.mqc_colour_scale(header['scale'], header['dmin'], header['dmax'])
 
-        # Add the data table cells
+        # Conditional formatting rules for this column
+        cond_formatting = compile_cond_formatting_rules(rid)
+
+        # Collect the values for this column
+        col_vals = OrderedDict()
         for (s_name, samp) in dt.data[idx].items():
             if k in samp:
                 val = samp[k]
@@ -137,6 +322,18 @@ def make_table (dt):
 
                 if 'modify' in header and callable(header['modify']):
                     val = header['modify'](val)
+                col_vals[s_name] = val
+
+        # Colour all of the values in one go
+        if header['scale'] and c_scale is not None:
+            cell_colours = dict(zip(col_vals.keys(), c_scale.get_colours_for(list(col_vals.values()))))
+        # Conditional formatting for the whole column
+        cond_colours = dict(zip(col_vals.keys(), cond_formatting_colours(cond_formatting, list(col_vals.values()))))
+
+        # Add the data table cells
+        for (s_name, samp) in dt.data[idx].items():
+            if s_name in col_vals:
+                val = col_vals[s_name]
 
                 try:
                     dmin = header['dmin']
@@ -169,49 +366,22 @@ def make_table (dt):
                 valstring += header.get('suffix', '')
 
                 # Conditional formatting
-                cmatches = { cfck: False for cfc in config.table_cond_formatting_colours for cfck in cfc }
-                # Find general rules followed by column-specific rules
-                for cfk in ['all_columns', rid]:
-                    if cfk in config.table_cond_formatting_rules:
-                        # Loop through match types
-                        for ftype in cmatches.keys():
-                            # Loop through array of comparison types
-                            for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
-                                try:
-                                    # Each comparison should be a dict with single key: val
-                                    if 's_eq' in cmp and str(cmp['s_eq']).lower() == str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_contains' in cmp and str(cmp['s_contains']).lower() in str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_ne' in cmp and str(cmp['s_ne']).lower() != str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 'eq' in cmp and float(cmp['eq']) == float(val):
-                                        cmatches[ftype] = True
-                                    if 'ne' in cmp and float(cmp['ne']) != float(val):
-                                        cmatches[ftype] = True
-                                    if 'gt' in cmp and float(cmp['gt']) < float(val):
-                                        cmatches[ftype] = True
-                                    if 'lt' in cmp and float(cmp['lt']) > float(val):
-                                        cmatches[ftype] = True
-                                except:
-                                    logger.warning("Not able to apply table conditional formatting to '{}' ({})".format(val, cmp))
-                # Apply HTML in order of config keys
-                bgcol = None
-                for cfc in config.table_cond_formatting_colours:
-                    for cfck in cfc: # should always be one, but you never know
-                        if cmatches[cfck]:
-                            bgcol = cfc[cfck]
+                bgcol = cond_colours[s_name]
                 if bgcol is not None:
                     valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(bgcol, valstring)
 
                 # Build HTML
-                if not header['scale']:
+                if lazy:
+                    if s_name not in t_rows:
+                        t_rows[s_name] = dict()
+                    t_rows[s_name][rid] = (val, valstring, percentage, cell_colours.get(s_name) if c_scale is not None else None)
+                elif not header['scale']:
                     if s_name not in t_rows:
                         t_rows[s_name] = dict()
                     t_rows[s_name][rid] = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
                 else:
                     if c_scale is not None:
-                        col = ' background-color:{};'.format(c_scale.get_colour(val))
+                        col = ' background-color:{};'.format(cell_colours[s_name])
                     else:
                         col = ''
                     bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentage, col)
@@ -293,11 +463,12 @@ def make_table (dt):
 
     # Build the table itself
     collapse_class = 'mqc-table-collapse' if len(t_rows) > 10 and config.collapse_tables else ''
+    lazy_class = 'mqc_table_lazy' if lazy else ''
     html += """
         <div id="{tid}_container" class="mqc_table_container">
             <div class="table-responsive mqc-table-responsive {cc}">
-                <table id="{tid}" class="table table-condensed mqc_table" data-title="{title}">
-        """.format( tid=table_id, title=table_title, cc=collapse_class)
+                <table id="{tid}" class="table table-condensed mqc_table {lc}" data-title="{title}">
+        """.format( tid=table_id, title=table_title, cc=collapse_class, lc=lazy_class)
 
     # Build the header row
     col1_header = dt.pconfig.get('col1_header', 'Sample Name')
@@ -308,6 +479,9 @@ def make_table (dt):
     t_row_keys = t_rows.keys()
     if dt.pconfig.get('sortRows') is not False:
         t_row_keys = sorted(t_row_keys)
+    if lazy:
+        report.table_data[table_id] = lazy_table_data(t_headers.keys(), t_rows, t_row_keys, dt)
+        t_row_keys = []
     for s_name in t_row_keys:
         # Hide the row if all cells are empty or hidden
         row_hidden = ' style="display:none"' if all(t_rows_empty[s_name].values()) else  ''
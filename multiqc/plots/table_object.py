@@ -3,7 +3,9 @@
 """ MultiQC datatable class, used by tables and beeswarm plots """
 
 from collections import defaultdict, OrderedDict
+from itertools import compress
 import logging
+import numpy as np
 import re
 
 from multiqc.utils import config, report
@@ -31,6 +33,7 @@ class datatable (object):
         shared_keys = defaultdict(lambda: dict())
 
         # Go through each table section
+        columns = dict()
         for idx, d in enumerate(data):
 
             # Get the header keys
@@ -44,11 +47,11 @@ class datatable (object):
             if pconfig.get('only_defined_headers', True) is False:
 
                 # Get the keys from the data
-                keys = list()
+                keys = OrderedDict()
                 for samp in d.values():
                     for k in samp.keys():
-                        if k not in keys:
-                            keys.append(k)
+                        keys[k] = True
+                keys = list(keys)
 
                 # If we don't have a headers dict for this data set yet, create one
                 try:
@@ -76,12 +79,23 @@ class datatable (object):
                 cdata[str(k)] = v
             data[idx] = cdata
             for s_name in data[idx].keys():
-                for k in list(data[idx][s_name].keys()):
-                    data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
+                if not all(type(k) is str for k in data[idx][s_name]):
+                    for k in list(data[idx][s_name].keys()):
+                        data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
+
+            # Large sections are also held by column, to work out empty columns and
+            # min / max values with numpy instead of looping over every sample
+            columns[idx] = None
+            if config.table_columnar_min_samples and len(data[idx]) >= config.table_columnar_min_samples:
+                columns[idx] = datatable_columns(data[idx], keys)
 
             # Check that we have some data in each column
             empties = list()
             for k in keys:
+                if columns[idx] is not None:
+                    if not columns[idx].has_data(k):
+                        empties.append(k)
+                    continue
                 n = 0
                 for samp in d.values():
                     if k in samp:
@@ -178,19 +192,27 @@ class datatable (object):
 
                 # Figure out the min / max if not supplied
                 if setdmax or setdmin:
-                    for s_name, samp in data[idx].items():
-                        try:
-                            val = float(samp[k])
-                            if callable(headers[idx][k]['modify']):
-                                val = float(headers[idx][k]['modify'](val))
+                    if columns[idx] is not None:
+                        vals = columns[idx].float_values(k, headers[idx][k]['modify'])
+                        if len(vals) > 0:
                             if setdmax:
-                                headers[idx][k]['dmax'] = max(headers[idx][k]['dmax'], val)
+                                headers[idx][k]['dmax'] = max(headers[idx][k]['dmax'], float(vals.max()))
                             if setdmin:
-                                headers[idx][k]['dmin'] = min(headers[idx][k]['dmin'], val)
-                        except ValueError:
-                            val = samp[k] # couldn't convert to float - keep as a string
-                        except KeyError:
-                            pass # missing data - skip
+                                headers[idx][k]['dmin'] = min(headers[idx][k]['dmin'], float(vals.min()))
+                    else:
+                        for s_name, samp in data[idx].items():
+                            try:
+                                val = float(samp[k])
+                                if callable(headers[idx][k]['modify']):
+                                    val = float(headers[idx][k]['modify'](val))
+                                if setdmax:
+                                    headers[idx][k]['dmax'] = max(headers[idx][k]['dmax'], val)
+                                if setdmin:
+                                    headers[idx][k]['dmin'] = min(headers[idx][k]['dmin'], val)
+                            except ValueError:
+                                val = samp[k] # couldn't convert to float - keep as a string
+                            except KeyError:
+                                pass # missing data - skip
                     # Limit auto-generated scales with floor, ceiling and minRange.
                     if headers[idx][k]['ceiling'] is not None and headers[idx][k]['max'] is None:
                         headers[idx][k]['dmax'] = min(headers[idx][k]['dmax'], float(headers[idx][k]['ceiling']))
@@ -233,6 +255,11 @@ class datatable (object):
         # Skip any data that is not used in the table
         # Would be ignored for making the table anyway, but can affect whether a beeswarm plot is used
         for idx, d in enumerate(data):
+            if columns.get(idx) is not None:
+                keep = columns[idx].rows_with_data(headers[idx].keys())
+                if not keep.all():
+                    data[idx] = OrderedDict(compress(d.items(), keep))
+                continue
             for s_name in list(d.keys()):
                 if not any ( h in data[idx][s_name].keys() for h in headers[idx]):
                     del(data[idx][s_name])
@@ -252,3 +279,77 @@ class datatable (object):
             for idx, k in self.headers_in_order[bucket]:
                 res.append( (idx, k, self.headers[idx][k]) )
         return res
+
+
+class datatable_columns (object):
+    """ Column-oriented copy of one section of table data, used for large tables.
+    For each column, holds a mask of the samples that have a value and the
+    values themselves, so that empty columns, min / max values and unused
+    rows can be found with vectorised numpy operations. """
+
+    def __init__ (self, data, keys):
+        samples = list(data.values())
+        self.num_samples = len(samples)
+        self.present = dict()
+        self.values = dict()
+        for k in keys:
+            self.present[k] = np.fromiter((k in samp for samp in samples), dtype=bool, count=len(samples))
+            self.values[k] = [samp[k] for samp in compress(samples, self.present[k])]
+
+    def has_data(self, k):
+        """ Whether any sample has a value for this column """
+        return len(self.values[k]) > 0
+
+    def rows_with_data(self, keys):
+        """ Boolean mask of the samples that have a value in any of these columns """
+        masks = [self.present[k] for k in keys if k in self.present]
+        if len(masks) == 0:
+            return np.zeros(self.num_samples, dtype=bool)
+        return np.logical_or.reduce(masks)
+
+    def float_values(self, k, modify=None):
+        """ Numeric values of a column, with modify applied. Values that
+        can't be converted to a float (eg. strings) and NaNs are skipped. """
+        try:
+            vals = np.array(self.values[k], dtype=float)
+            assert vals.ndim == 1
+        except (TypeError, ValueError, AssertionError):
+            vals = _floats(self.values[k])
+        if callable(modify) and len(vals) > 0:
+            modified = _modify_floats(modify, vals)
+            if modified is None:
+                modified = _floats(vals.tolist(), modify)
+            vals = modified
+        return vals[~np.isnan(vals)]
+
+
+def _floats(vals, modify=None):
+    """ Convert values to floats one at a time, skipping those that fail """
+    fvals = np.zeros(len(vals))
+    ok = np.ones(len(vals), dtype=bool)
+    for i, val in enumerate(vals):
+        try:
+            val = float(val)
+            if modify is not None:
+                val = float(modify(val))
+            fvals[i] = val
+        except ValueError:
+            ok[i] = False
+    return fvals[ok]
+
+def _modify_floats(modify, vals):
+    """ Try to apply a modify function to a whole array at once. Returns None
+    if it doesn't work with arrays or gives different results to single values. """
+    try:
+        with np.errstate(all='ignore'):
+            modified = np.asarray(modify(vals.copy()), dtype=float)
+        finite = np.flatnonzero(np.isfinite(vals))
+        if modified.shape != vals.shape or len(finite) == 0:
+            return None
+        for i in set([finite[0], finite[len(finite) // 2], finite[-1]]):
+            expected = float(modify(float(vals[i])))
+            if expected != modified[i] and not (np.isnan(expected) and np.isnan(modified[i])):
+                return None
+    except Exception:
+        return None
+    return modified
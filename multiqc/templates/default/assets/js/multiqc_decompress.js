@@ -0,0 +1,213 @@
+////////////////////////////////////////////////
+// Decompress the plot and table data embedded in the report
+////////////////////////////////////////////////
+
+// Parse compressed JSON data, using the codec set in config.data_compression
+function mqc_decompress_json(data){
+  if(mqc_config['data_compression'] == 'zlib'){
+    return JSON.parse(mqc_utf8_decode(mqc_inflate(mqc_base64_decode(data))));
+  }
+  return JSON.parse(LZString.decompressFromBase64(data));
+}
+
+// Base64 string to a Uint8Array of bytes
+function mqc_base64_decode(data){
+  var bin = atob(data.trim());
+  var bytes = new Uint8Array(bin.length);
+  for(var i = 0; i < bin.length; i++){
+    bytes[i] = bin.charCodeAt(i);
+  }
+  return bytes;
+}
+
+// Uint8Array of UTF-8 encoded bytes to a string
+function mqc_utf8_decode(bytes){
+  if(typeof TextDecoder !== 'undefined'){
+    return new TextDecoder('utf-8').decode(bytes);
+  }
+  // Older browsers - build the string in chunks to avoid call stack limits
+  var bin = '';
+  for(var i = 0; i < bytes.length; i += 32768){
+    bin += String.fromCharCode.apply(null, bytes.subarray(i, i + 32768));
+  }
+  return decodeURIComponent(escape(bin));
+}
+
+// Inflate zlib compressed data (RFC 1950 / 1951). Synchronous, so that the
+// data is ready as soon as the page loads, like with lzstring.
+var mqc_inflate = (function(){
+
+  var LEN_BASE = [3,4,5,6,7,8,9,10,11,13,15,17,19,23,27,31,35,43,51,59,67,83,99,115,131,163,195,227,258];
+  var LEN_EXTRA = [0,0,0,0,0,0,0,0,1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4,5,5,5,5,0];
+  var DIST_BASE = [1,2,3,4,5,7,9,13,17,25,33,49,65,97,129,193,257,385,513,769,1025,1537,2049,3073,4097,6145,8193,12289,16385,24577];
+  var DIST_EXTRA = [0,0,0,0,1,1,2,2,3,3,4,4,5,5,6,6,7,7,8,8,9,9,10,10,11,11,12,12,13,13];
+  var CL_ORDER = [16,17,18,0,8,7,9,6,10,5,11,4,12,3,13,2,14,1,15];
+
+  // Lookup table for a set of Huffman code lengths. Deflate packs codes starting
+  // from the most significant bit, so entries are indexed by the bit-reversed code.
+  // Each entry is (symbol << 4) | code length.
+  function huffman_table(lengths){
+    var max_bits = 0;
+    var counts = new Uint16Array(16);
+    for(var i = 0; i < lengths.length; i++){
+      counts[lengths[i]]++;
+      if(lengths[i] > max_bits){ max_bits = lengths[i]; }
+    }
+    counts[0] = 0;
+    var next_code = new Uint16Array(16);
+    var code = 0;
+    for(var len = 1; len < 16; len++){
+      code = (code + counts[len-1]) << 1;
+      next_code[len] = code;
+    }
+    var size = 1 << max_bits;
+    var table = new Uint32Array(size);
+    for(var sym = 0; sym < lengths.length; sym++){
+      var len = lengths[sym];
+      if(len == 0){ continue; }
+      var c = next_code[len]++;
+      var rev = 0;
+      for(var k = 0; k < len; k++){
+        rev = (rev << 1) | (c & 1);
+        c >>= 1;
+      }
+      for(var j = rev; j < size; j += (1 << len)){
+        table[j] = (sym << 4) | len;
+      }
+    }
+    return { table: table, bits: max_bits, mask: size - 1 };
+  }
+
+  var fixed_lit, fixed_dist;
+  function fixed_tables(){
+    if(fixed_lit === undefined){
+      var lengths = new Uint8Array(288);
+      for(var i = 0; i < 288; i++){
+        lengths[i] = i < 144 ? 8 : (i < 256 ? 9 : (i < 280 ? 7 : 8));
+      }
+      fixed_lit = huffman_table(lengths);
+      var dist_lengths = new Uint8Array(30);
+      for(var i = 0; i < 30; i++){ dist_lengths[i] = 5; }
+      fixed_dist = huffman_table(dist_lengths);
+    }
+  }
+
+  return function(src){
+    var pos = 2; // Skip the zlib header
+    var bitbuf = 0;
+    var bitcnt = 0;
+    var out = new Uint8Array(src.length * 4 + 1024);
+    var o = 0;
+
+    function need(n){
+      while(bitcnt < n){
+        bitbuf |= (pos < src.length ? src[pos] : 0) << bitcnt;
+        pos++;
+        bitcnt += 8;
+      }
+    }
+    function bits(n){
+      need(n);
+      var v = bitbuf & ((1 << n) - 1);
+      bitbuf >>>= n;
+      bitcnt -= n;
+      return v;
+    }
+    function decode(h){
+      need(h.bits);
+      var entry = h.table[bitbuf & h.mask];
+      var len = entry & 15;
+      if(len == 0){ throw new Error('Invalid compressed data'); }
+      bitbuf >>>= len;
+      bitcnt -= len;
+      return entry >> 4;
+    }
+    function grow(n){
+      if(o + n > out.length){
+        var bigger = new Uint8Array(Math.max(out.length * 2, o + n));
+        bigger.set(out);
+        out = bigger;
+      }
+    }
+
+    var last = 0;
+    while(!last){
+      last = bits(1);
+      var type = bits(2);
+
+      // Stored block - copy bytes straight through
+      if(type == 0){
+        pos -= bitcnt >> 3;
+        bitbuf = 0;
+        bitcnt = 0;
+        var len = src[pos] | (src[pos+1] << 8);
+        pos += 4;
+        grow(len);
+        out.set(src.subarray(pos, pos + len), o);
+        o += len;
+        pos += len;
+        continue;
+      }
+
+      // Compressed block - fixed or dynamic Huffman codes
+      var lit, dist;
+      if(type == 1){
+        fixed_tables();
+        lit = fixed_lit;
+        dist = fixed_dist;
+      } else if(type == 2){
+        var hlit = bits(5) + 257;
+        var hdist = bits(5) + 1;
+        var hclen = bits(4) + 4;
+        var cl_lengths = new Uint8Array(19);
+        for(var i = 0; i < hclen; i++){
+          cl_lengths[CL_ORDER[i]] = bits(3);
+        }
+        var cl = huffman_table(cl_lengths);
+        var lengths = new Uint8Array(hlit + hdist);
+        var i = 0;
+        while(i < hlit + hdist){
+          var sym = decode(cl);
+          if(sym < 16){
+            lengths[i++] = sym;
+          } else {
+            var prev = 0, repeat;
+            if(sym == 16){
+              prev = lengths[i-1];
+              repeat = 3 + bits(2);
+            } else if(sym == 17){
+              repeat = 3 + bits(3);
+            } else {
+              repeat = 11 + bits(7);
+            }
+            while(repeat--){ lengths[i++] = prev; }
+          }
+        }
+        lit = huffman_table(lengths.subarray(0, hlit));
+        dist = huffman_table(lengths.subarray(hlit));
+      } else {
+        throw new Error('Invalid compressed data');
+      }
+
+      while(true){
+        var sym = decode(lit);
+        if(sym < 256){
+          grow(1);
+          out[o++] = sym;
+        } else if(sym == 256){
+          break;
+        } else {
+          sym -= 257;
+          var len = LEN_BASE[sym] + bits(LEN_EXTRA[sym]);
+          var dsym = decode(dist);
+          var d = DIST_BASE[dsym] + bits(DIST_EXTRA[dsym]);
+          grow(len);
+          for(var k = 0; k < len; k++, o++){
+            out[o] = out[o - d];
+          }
+        }
+      }
+    }
+    return out.subarray(0, o);
+  };
+})();
@@ -24,7 +24,26 @@ $(function () {
   $('.mqc_loading_warning').show();
 
   // Decompress the JSON plot data
-  mqc_plots = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  mqc_plots = mqc_decompress_json(mqc_compressed_plotdata);
+
+  // Big reports have the data for each plot compressed separately.
+  // Only decompress it when something first asks for that plot.
+  $('.mqc_compressed_plotdata_chunk').each(function(){
+    var chunk = this;
+    var pid = $(chunk).data('plot');
+    Object.defineProperty(mqc_plots, pid, {
+      configurable: true,
+      enumerable: true,
+      get: function(){
+        var pdata = mqc_decompress_json(chunk.innerHTML);
+        Object.defineProperty(mqc_plots, pid, { value: pdata, configurable: true, enumerable: true, writable: true });
+        return pdata;
+      },
+      set: function(pdata){
+        Object.defineProperty(mqc_plots, pid, { value: pdata, configurable: true, enumerable: true, writable: true });
+      }
+    });
+  });
 
   // HighCharts Defaults
   window.HCDefaults = $.extend(true, {}, Highcharts.getOptions(), {});
@@ -62,20 +81,38 @@ $(function () {
   });
 
   // Render plots on page load
-  $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
-    var target = $(this).attr('id');
-    // Only one point per dataset, so multiply limit by arbitrary number.
-    var max_num = mqc_config['num_datasets_plot_limit'] * 50;
-    // Deferring each plot call prevents browser from locking up
-    setTimeout(function(){
-        plot_graph(target, undefined, max_num);
-        if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
-          $('.mqc_loading_warning').hide();
+  // Only one point per dataset, so multiply limit by arbitrary number.
+  var max_num = mqc_config['num_datasets_plot_limit'] * 50;
+  if($('.mqc_compressed_plotdata_chunk').length > 0 && 'IntersectionObserver' in window){
+    // Plot data is compressed separately - render plots as they scroll into view
+    var plot_observer = new IntersectionObserver(function(entries){
+      entries.forEach(function(entry){
+        if(entry.isIntersecting){
+          plot_observer.unobserve(entry.target);
+          if($(entry.target).hasClass('not_rendered')){
+            plot_graph($(entry.target).attr('id'), undefined, max_num);
+          }
         }
-    }, 50);
-  });
-  if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+      });
+    }, { rootMargin: '500px 0px' });
+    $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
+      plot_observer.observe(this);
+    });
     $('.mqc_loading_warning').hide();
+  } else {
+    $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
+      var target = $(this).attr('id');
+      // Deferring each plot call prevents browser from locking up
+      setTimeout(function(){
+          plot_graph(target, undefined, max_num);
+          if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+            $('.mqc_loading_warning').hide();
+          }
+      }, 50);
+    });
+    if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+      $('.mqc_loading_warning').hide();
+    }
   }
 
   // Render a plot when clicked
@@ -1199,6 +1236,30 @@ function plot_beeswarm_graph(target, ds){
 }
 
 // Heatmap plot
+// Heatmap data as a new list of [x,y,value] points. Large heatmaps are saved as a
+// flat row-major matrix (or just the lower triangle if symmetric) and are expanded here
+function heatmap_points(plot){
+  if(plot['matrix'] === undefined){
+    return JSON.parse(JSON.stringify(plot['data']));
+  }
+  var matrix = plot['matrix'];
+  var ncols = plot['xcats'].length;
+  var nrows = plot['ycats'].length;
+  var data = new Array(nrows * ncols);
+  var n = 0;
+  for (var i = 0; i < nrows; i++) {
+    for (var j = 0; j < ncols; j++) {
+      if(plot['triangle']){
+        // Row i of the triangle starts at i*(i+1)/2
+        data[n++] = [j, i, j <= i ? matrix[i*(i+1)/2 + j] : matrix[j*(j+1)/2 + i]];
+      } else {
+        data[n++] = [j, i, matrix[i*ncols + j]];
+      }
+    }
+  }
+  return data;
+}
+
 function plot_heatmap(target, ds){
   if(mqc_plots[target] === undefined || mqc_plots[target]['plot_type'] !== 'heatmap'){
     return false;
@@ -1211,7 +1272,7 @@ function plot_heatmap(target, ds){
 
   // Make a clone of the data, so that we can mess with it,
   // while keeping the original data in tact
-  var data = JSON.parse(JSON.stringify(mqc_plots[target]['data']));
+  var data = heatmap_points(mqc_plots[target]);
   var xcats = JSON.parse(JSON.stringify(mqc_plots[target]['xcats']));
   var ycats = JSON.parse(JSON.stringify(mqc_plots[target]['ycats']));
   // "xcats" and "ycats" are labels of columns and rows respectively
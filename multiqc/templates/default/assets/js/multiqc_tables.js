@@ -8,16 +8,28 @@ var brewer_scales = ['YlOrRd', 'YlOrBr', 'YlGnBu', 'YlGn', 'Reds', 'RdPu',
   'Paired', 'Dark2', 'Accent', 'Spectral', 'RdYlGn', 'RdYlBu', 'RdGy', 'RdBu',
   'PuOr', 'PRGn', 'PiYG', 'BrBG'];
 
+// Tables with lots of rows are rendered from the compressed table data as they are scrolled
+var mqc_lazy_tables = {};
+var mqc_lazy_table_batch_size = 100;
+
 // Execute when page load has finished loading
 $(function () {
 
   if($('.mqc_table').length > 0){
 
+    // Render tables that are saved as data
+    if($('.mqc_table_lazy').length > 0){
+      var mqc_table_data = mqc_decompress_json(mqc_compressed_tabledata);
+      $('.mqc_table_lazy').each(function(){
+        mqc_lazy_table_init($(this).attr('id'), mqc_table_data[$(this).attr('id')]);
+      });
+    }
+
     // Enable tablesorter on MultiQC tables
     var strip_non_numeric = function(node){
       return node.innerText.replace(/[^\d.-]/g, '');
     }
-    $('.mqc_table').tablesorter({sortInitialOrder: 'desc', textExtraction: strip_non_numeric});
+    $('.mqc_table').not('.mqc_table_lazy').tablesorter({sortInitialOrder: 'desc', textExtraction: strip_non_numeric});
 
     // Update tablesorter if samples renamed
     $(document).on('mqc_renamesamples', function(e, f_texts, t_texts, regex_mode){
@@ -25,7 +37,16 @@ $(function () {
     });
 
     // Copy table contents to clipboard
-    var clipboard = new Clipboard('.mqc_table_copy_btn');
+    // Tables rendered from data are copied from the data, as not all rows are in the page
+    var clipboard = new Clipboard('.mqc_table_copy_btn', {
+      text: function(trigger){
+        var target = $(trigger).data('clipboard-target');
+        if($(target).hasClass('mqc_table_lazy')){
+          return mqc_lazy_table_text(target.substr(1));
+        }
+        return undefined;
+      }
+    });
     clipboard.on('success', function(e) { e.clearSelection(); });
     $('.mqc_table_copy_btn').click(function(){
       var btn = $(this);
@@ -80,6 +101,11 @@ $(function () {
           $(target+'_configModal_table .'+cclass).addClass('text-muted');
         }
       });
+      // Tables rendered from data work out which rows to show themselves
+      if($(target).hasClass('mqc_table_lazy')){
+        mqc_lazy_table_filter(target.substr(1));
+        return;
+      }
       // Hide empty rows
       $(target+' tbody tr').show();
       $(target+' tbody tr').each(function(){
@@ -121,25 +147,18 @@ $(function () {
     $(document).on('mqc_highlights', function(e, f_texts, f_cols, regex_mode){
       $('.mqc_table_sortHighlight').hide();
       $('.mqc_table tbody th').removeClass('highlighted').removeData('highlight');
-      $('.mqc_table tbody th').each(function(i){
-        var th = $(this);
-        var thtext = $(this).text();
-        var thiscol = '#333';
-        $.each(f_texts, function(idx, f_text){
-          if((regex_mode && thtext.match(f_text)) || (!regex_mode && thtext.indexOf(f_text) > -1)){
-            thiscol = f_cols[idx];
-            th.addClass('highlighted').data('highlight', idx);
-            $('.mqc_table_sortHighlight').show();
-          }
-        });
-        $(this).css('color', thiscol);
-      });
+      mqc_table_highlight_rows($('.mqc_table tbody th'), f_texts, f_cols, regex_mode);
     });
 
     // Sort MultiQC tables by highlight
     $('.mqc_table_sortHighlight').click(function(e){
       e.preventDefault();
       var target = $(this).data('target');
+      if($(target).hasClass('mqc_table_lazy')){
+        mqc_lazy_table_sort_highlights(target.substr(1), $(this).data('direction') == 'desc');
+        $(this).data('direction', $(this).data('direction') == 'desc' ? 'asc' : 'desc');
+        return;
+      }
       // collect highlighted rows
       var hrows = $(target+' tbody th.highlighted').parent().detach();
       hrows = hrows.sort(function (a, b) {
@@ -174,8 +193,13 @@ $(function () {
     // Hide samples
     $(document).on('mqc_hidesamples', function(e, f_texts, regex_mode){
 
+      // Filter the data for tables rendered from data
+      $.each(mqc_lazy_tables, function(tid){
+        mqc_lazy_table_filter(tid);
+      });
+
       // Hide rows in MultiQC tables
-      $(".mqc_table tbody th").each(function(){
+      $(".mqc_table").not('.mqc_table_lazy').find("tbody th").each(function(){
         var match = false;
         var hfilter = $(this).text();
         $.each(f_texts, function(idx, f_text){
@@ -194,11 +218,13 @@ $(function () {
       });
       $('.mqc_table_numrows').each(function(){
         var tid = $(this).attr('id').replace('_numrows','');
-        $(this).text( $('#'+tid+' tbody tr:visible').length );
+        if(mqc_lazy_tables[tid] === undefined){
+          $(this).text( $('#'+tid+' tbody tr:visible').length );
+        }
       });
 
       // Hide empty columns
-      $('.mqc_table').each(function(){
+      $('.mqc_table').not('.mqc_table_lazy').each(function(){
         var table = $(this);
         var gsthidx = 0;
         table.find("thead th, tbody tr td").show();
@@ -281,18 +307,33 @@ $(function () {
         },
         'datasets': [[]]
       };
-      $(tid+' tbody tr').each(function(e){
-        var s_name = $(this).children('th.rowheader').text();
-        var val_1 = $(this).children('td.'+col1).text().replace(/[^\d\.]/g,'');
-        var val_2 = $(this).children('td.'+col2).text().replace(/[^\d\.]/g,'');
-        if(!isNaN(parseFloat(val_1)) && isFinite(val_1) && !isNaN(parseFloat(val_2)) && isFinite(val_2)){
-          mqc_plots['tableScatterPlot']['datasets'][0].push({
-            'name': s_name,
-            'x': parseFloat(val_1),
-            'y': parseFloat(val_2)
-          });
+      if($(tid).hasClass('mqc_table_lazy')){
+        var data = mqc_lazy_tables[tid.substr(1)];
+        var vals_1 = data['columns'][data['col_idx'][col1]]['values'];
+        var vals_2 = data['columns'][data['col_idx'][col2]]['values'];
+        for(var i = 0; i < data['samples'].length; i++){
+          if(typeof vals_1[i] == 'number' && isFinite(vals_1[i]) && typeof vals_2[i] == 'number' && isFinite(vals_2[i])){
+            mqc_plots['tableScatterPlot']['datasets'][0].push({
+              'name': mqc_table_rename_sample(data['samples'][i]),
+              'x': vals_1[i],
+              'y': vals_2[i]
+            });
+          }
         }
-      });
+      } else {
+        $(tid+' tbody tr').each(function(e){
+          var s_name = $(this).children('th.rowheader').text();
+          var val_1 = $(this).children('td.'+col1).text().replace(/[^\d\.]/g,'');
+          var val_2 = $(this).children('td.'+col2).text().replace(/[^\d\.]/g,'');
+          if(!isNaN(parseFloat(val_1)) && isFinite(val_1) && !isNaN(parseFloat(val_2)) && isFinite(val_2)){
+            mqc_plots['tableScatterPlot']['datasets'][0].push({
+              'name': s_name,
+              'x': parseFloat(val_1),
+              'y': parseFloat(val_2)
+            });
+          }
+        });
+      }
       if(Object.keys(mqc_plots['tableScatterPlot']['datasets'][0]).length > 0){
         if(plot_scatter_plot('tableScatterPlot') == false){
           $('#tableScatterPlot').html('<small>Error: Something went wrong when plotting the scatter plot.</small>');
@@ -348,3 +389,276 @@ function change_mqc_table_col_order(table){
     }
   });
 }
+
+// Colour sample names in table rows that match the toolbox highlight patterns
+function mqc_table_highlight_rows(ths, f_texts, f_cols, regex_mode){
+  ths.each(function(i){
+    var th = $(this);
+    var thtext = $(this).text();
+    var thiscol = '#333';
+    $.each(f_texts, function(idx, f_text){
+      if((regex_mode && thtext.match(f_text)) || (!regex_mode && thtext.indexOf(f_text) > -1)){
+        thiscol = f_cols[idx];
+        th.addClass('highlighted').data('highlight', idx);
+        $('.mqc_table_sortHighlight').show();
+      }
+    });
+    $(this).css('color', thiscol);
+  });
+}
+
+// Apply the toolbox rename patterns to a sample name
+function mqc_table_rename_sample(s_name){
+  s_name = String(s_name);
+  $.each(window.mqc_rename_f_texts, function(idx, f_text){
+    if(window.mqc_rename_regex_mode){
+      var re = new RegExp(f_text,"g");
+      s_name = s_name.replace(re, window.mqc_rename_t_texts[idx]);
+    } else {
+      s_name = s_name.replace(f_text, window.mqc_rename_t_texts[idx]);
+    }
+  });
+  return s_name;
+}
+
+// Check whether a (renamed) sample is hidden by the toolbox hide patterns
+function mqc_table_sample_hidden(s_name){
+  var match = false;
+  $.each(window.mqc_hide_f_texts, function(idx, f_text){
+    if((window.mqc_hide_regex_mode && s_name.match(f_text)) || (!window.mqc_hide_regex_mode && s_name.indexOf(f_text) > -1)){
+      match = true;
+    }
+  });
+  if(window.mqc_hide_mode == 'show'){
+    match = !match;
+  }
+  return match;
+}
+
+// Set up a table that is rendered from data. Rows are sorted and filtered
+// on the data and only rendered as the table is scrolled.
+function mqc_lazy_table_init(tid, data){
+  var table = $('#'+tid);
+  data['order'] = [];
+  for(var i = 0; i < data['samples'].length; i++){
+    data['order'].push(i);
+  }
+  data['rows'] = [];
+  data['num_rendered'] = 0;
+  data['empty_cols'] = {};
+  data['col_idx'] = {};
+  $.each(data['columns'], function(idx, col){
+    data['col_idx'][col['rid']] = idx;
+  });
+  mqc_lazy_tables[tid] = data;
+
+  // Sort by clicking on column headers - descending first, like tablesorter
+  table.find('thead th').click(function(){
+    var th = $(this);
+    var desc = !th.hasClass('headerSortUp');
+    table.find('thead th').removeClass('headerSortUp headerSortDown');
+    th.addClass(desc ? 'headerSortUp' : 'headerSortDown');
+    var rid = th.hasClass('rowheader') ? null : th.attr('id').replace(/^header_/, '');
+    mqc_lazy_table_sort(tid, rid, desc);
+  });
+
+  // Render more rows when scrolling near the end of the table
+  table.closest('.mqc-table-responsive').scroll(function(){
+    mqc_lazy_table_scroll(tid);
+  });
+  $(window).scroll(function(){
+    mqc_lazy_table_scroll(tid);
+  });
+
+  mqc_lazy_table_filter(tid);
+}
+
+// Sort the rows of a table rendered from data by a column, or by sample name if rid is null
+function mqc_lazy_table_sort(tid, rid, desc){
+  var data = mqc_lazy_tables[tid];
+  var vals = [];
+  for(var i = 0; i < data['samples'].length; i++){
+    if(rid === null){
+      vals.push(mqc_table_rename_sample(data['samples'][i]));
+    } else {
+      vals.push(data['columns'][data['col_idx'][rid]]['values'][i]);
+    }
+  }
+  data['order'].sort(function(a, b){
+    var va = vals[a];
+    var vb = vals[b];
+    // Empty cells always go at the end
+    var ea = va === null || String(va).trim() === '';
+    var eb = vb === null || String(vb).trim() === '';
+    if(ea || eb){
+      return (ea - eb) || (a - b);
+    }
+    var cmp;
+    if(typeof va == 'number' && typeof vb == 'number'){
+      cmp = va - vb;
+    } else {
+      cmp = String(va).localeCompare(String(vb), undefined, {numeric: true});
+    }
+    if(cmp == 0){
+      return a - b;
+    }
+    return desc ? -cmp : cmp;
+  });
+  mqc_lazy_table_filter(tid);
+}
+
+// Move highlighted samples to the top (desc) or bottom of a table rendered from data
+function mqc_lazy_table_sort_highlights(tid, desc){
+  var data = mqc_lazy_tables[tid];
+  var f_texts = window.mqc_highlight_f_texts;
+  var regex_mode = window.mqc_highlight_regex_mode;
+  var highlights = {};
+  $.each(data['order'], function(pos, i){
+    var s_name = mqc_table_rename_sample(data['samples'][i]);
+    $.each(f_texts, function(idx, f_text){
+      if((regex_mode && s_name.match(f_text)) || (!regex_mode && s_name.indexOf(f_text) > -1)){
+        highlights[i] = idx;
+      }
+    });
+  });
+  var positions = {};
+  $.each(data['order'], function(pos, i){ positions[i] = pos; });
+  data['order'].sort(function(a, b){
+    var ha = highlights[a] !== undefined;
+    var hb = highlights[b] !== undefined;
+    if(ha && hb && highlights[a] != highlights[b]){
+      return desc ? highlights[b] - highlights[a] : highlights[a] - highlights[b];
+    }
+    if(ha != hb){
+      return (desc ? hb - ha : ha - hb);
+    }
+    return positions[a] - positions[b];
+  });
+  mqc_lazy_table_filter(tid);
+}
+
+// Work out which rows of a table rendered from data should be shown -
+// not hidden with the toolbox, and with a value in at least one visible column
+function mqc_lazy_table_filter(tid){
+  var data = mqc_lazy_tables[tid];
+  var table = $('#'+tid);
+  var visible_cols = [];
+  table.find('thead th').not('.rowheader').each(function(){
+    if(!$(this).hasClass('hidden')){
+      visible_cols.push(data['columns'][data['col_idx'][$(this).attr('id').replace(/^header_/, '')]]);
+    }
+  });
+  data['rows'] = [];
+  $.each(data['order'], function(pos, i){
+    if(mqc_table_sample_hidden(mqc_table_rename_sample(data['samples'][i]))){
+      return true;
+    }
+    for(var c = 0; c < visible_cols.length; c++){
+      var val = visible_cols[c]['values'][i];
+      if(visible_cols[c]['text'][i] !== null && (val === null || String(val).trim() !== '')){
+        data['rows'].push(i);
+        break;
+      }
+    }
+  });
+
+  // Hide columns with no values in any of the rows shown
+  $.each(data['columns'], function(idx, col){
+    var empty = data['rows'].length > 0;
+    for(var r = 0; r < data['rows'].length; r++){
+      if(col['text'][data['rows'][r]] !== null && col['text'][data['rows'][r]] !== ''){
+        empty = false;
+        break;
+      }
+    }
+    data['empty_cols'][col['rid']] = empty;
+    table.find('thead th#header_'+col['rid']).toggle(!empty);
+  });
+
+  $('#'+tid+'_numrows').text( data['rows'].length );
+  $('#'+tid+'_numcols').text( table.find('thead th:visible').length - 1 );
+
+  // Render the first rows again
+  table.find('tbody').empty();
+  data['num_rendered'] = 0;
+  mqc_lazy_table_render(tid);
+}
+
+// Add the next batch of rows to a table rendered from data
+function mqc_lazy_table_render(tid){
+  var data = mqc_lazy_tables[tid];
+  var table = $('#'+tid);
+
+  // Use the column order and visibility currently in the table header
+  var cols = [];
+  table.find('thead th').not('.rowheader').each(function(){
+    var rid = $(this).attr('id').replace(/^header_/, '');
+    cols.push({
+      'col': data['columns'][data['col_idx'][rid]],
+      'classes': rid + ' ' + ($(this).hasClass('hidden') ? 'hidden' : ''),
+      'style': data['empty_cols'][rid] ? ' style="display:none"' : ''
+    });
+  });
+
+  var end = Math.min(data['num_rendered'] + mqc_lazy_table_batch_size, data['rows'].length);
+  var html = '';
+  for(var r = data['num_rendered']; r < end; r++){
+    var i = data['rows'][r];
+    html += '<tr><th class="rowheader" data-original-sn="'+data['samples'][i]+'">'+mqc_table_rename_sample(data['samples'][i])+'</th>';
+    for(var c = 0; c < cols.length; c++){
+      var col = cols[c]['col'];
+      var text = col['text'][i];
+      if(text === null){
+        html += '<td class="data-coloured '+cols[c]['classes']+'"'+cols[c]['style']+'></td>';
+      } else if(!col['scale']){
+        html += '<td class="'+cols[c]['classes']+'"'+cols[c]['style']+'>'+text+'</td>';
+      } else {
+        var colour = col['colours'][i] === null ? '' : ' background-color:'+col['colours'][i]+';';
+        html += '<td class="data-coloured '+cols[c]['classes']+'"'+cols[c]['style']+'><div class="wrapper">' +
+          '<span class="bar" style="width:'+col['bars'][i]+'%;'+colour+'"></span>' +
+          '<span class="val">'+text+'</span></div></td>';
+      }
+    }
+    html += '</tr>';
+  }
+  var new_rows = $(html);
+  table.find('tbody').append(new_rows);
+  data['num_rendered'] = end;
+  mqc_table_highlight_rows(new_rows.children('th'), window.mqc_highlight_f_texts, window.mqc_highlight_f_cols, window.mqc_highlight_regex_mode);
+}
+
+// Render more rows if the end of a table rendered from data is close to being shown
+function mqc_lazy_table_scroll(tid){
+  var data = mqc_lazy_tables[tid];
+  if(data['num_rendered'] >= data['rows'].length){
+    return;
+  }
+  var container = $('#'+tid).closest('.mqc-table-responsive');
+  var container_left = container[0].scrollHeight - container.scrollTop() - container.innerHeight();
+  var window_left = container.offset().top + container.outerHeight() - $(window).scrollTop() - $(window).height();
+  if(container_left < 300 && window_left < 300){
+    mqc_lazy_table_render(tid);
+  }
+}
+
+// Tab-separated text of a table rendered from data, for copying to the clipboard
+function mqc_lazy_table_text(tid){
+  var data = mqc_lazy_tables[tid];
+  var table = $('#'+tid);
+  var cols = [];
+  var lines = [];
+  var line = [table.find('thead th.rowheader').text()];
+  table.find('thead th:visible').not('.rowheader').each(function(){
+    cols.push(data['columns'][data['col_idx'][$(this).attr('id').replace(/^header_/, '')]]);
+    line.push($(this).text());
+  });
+  lines.push(line.join('\t'));
+  $.each(data['rows'], function(r, i){
+    line = [mqc_table_rename_sample(data['samples'][i])];
+    $.each(cols, function(c, col){
+      line.push(col['text'][i] === null ? '' : col['text'][i].replace(/<[^>]*>/g, ''));
+    });
+    lines.push(line.join('\t'));
+  });
+  return lines.join('\n');
+}
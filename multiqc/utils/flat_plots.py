@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+""" MultiQC code to render flat plots in parallel worker processes (--plot-workers) and cache them (--plot-cache) """
+
+from __future__ import print_function
+import base64
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import pickle
+import re
+import time
+import zipfile
+
+from multiqc import config
+from multiqc.utils import report, search_cache
+logger = config.logger
+
+placeholder_re = re.compile(r'mqc_flat_plot_placeholder_(\d+)')
+
+_pool = None
+_pending = list()
+_images = dict()
+_tokens = itertools.count()
+
+def render_figure(figure_fn, args, formats, embed):
+    """
+    Draw a figure once and save it in every requested format. figure_fn returns
+    the MatPlotLib figure and the savefig() keyword arguments for exported files.
+    Returns a dict of file format: image bytes, and the PNG bytes to embed in the
+    report (or None).
+    """
+    import matplotlib.pyplot as plt
+    fig, savefig_kwargs = figure_fn(*args)
+    try:
+        images = dict()
+        for fformat in formats:
+            img_buffer = io.BytesIO()
+            fig.savefig(img_buffer, format=fformat, **savefig_kwargs)
+            images[fformat] = img_buffer.getvalue()
+        embedded = None
+        if embed:
+            if 'png' in images and savefig_kwargs == {'bbox_inches': 'tight'}:
+                embedded = images['png']
+            else:
+                img_buffer = io.BytesIO()
+                fig.savefig(img_buffer, format='png', bbox_inches='tight')
+                embedded = img_buffer.getvalue()
+    finally:
+        plt.close(fig)
+    return images, embedded
+
+def _render_pickled(payload):
+    """ Worker process entry point - unpickle a figure job and render it """
+    return render_figure(*pickle.loads(payload))
+
+def _get_pool():
+    """ Start the plot worker processes the first time that they're needed """
+    global _pool
+    if _pool is None:
+        ctx = multiprocessing.get_context('fork')
+        logger.debug("Rendering flat plots using {} worker processes".format(config.plot_workers))
+        _pool = ctx.Pool(config.plot_workers)
+    return _pool
+
+def _use_workers():
+    if config.plot_workers <= 1 or multiprocessing.current_process().daemon:
+        return False
+    try:
+        multiprocessing.get_context('fork')
+    except ValueError:
+        logger.debug("Can't fork worker processes on this platform, rendering flat plots one at a time")
+        return False
+    return True
+
+def _save_images(pid, images):
+    """ Write exported plot images to the plots directory """
+    for fformat, img in images.items():
+        # Make the directory if it doesn't already exist
+        plot_dir = os.path.join(config.plots_dir, fformat)
+        if not os.path.exists(plot_dir):
+            os.makedirs(plot_dir)
+        with io.open(os.path.join(plot_dir, '{}.{}'.format(pid, fformat)), 'wb') as fh:
+            fh.write(img)
+
+def cache_key(job):
+    """
+    Hash of everything that can change how a flat plot looks, or None if the
+    plot arguments can't be hashed exactly (eg. they contain a function)
+    """
+    figure_fn, args, formats, embed = job
+    try:
+        import matplotlib
+        mpl_version = matplotlib.__version__
+    except ImportError:
+        mpl_version = None
+    try:
+        fp = json.dumps([config.version, mpl_version, figure_fn.__module__, figure_fn.__name__, args, formats, embed], default=_cache_key_value)
+    except (TypeError, ValueError) as e:
+        logger.debug("Not caching flat plot, its data can't be hashed: {}".format(e))
+        return None
+    return hashlib.sha1(fp.encode('utf-8')).hexdigest()
+
+def _cache_key_value(obj):
+    """ JSON-serialisable value for NumPy data in plot arguments, for cache_key() """
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.tolist()
+        # Every value counts - str() of a big array is cut short
+        return ['ndarray', obj.shape, obj.dtype.str, hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest()]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Object of type {} can't be hashed".format(type(obj).__name__))
+
+def _cache_fn(key):
+    return os.path.join(search_cache.get_cache_dir(), 'plot_images', '{}.zip'.format(key))
+
+def _cache_get(key):
+    """ Return the images saved for a plot in an earlier run, or None """
+    cache_fn = _cache_fn(key)
+    try:
+        with zipfile.ZipFile(cache_fn) as zf:
+            images = dict()
+            embedded = None
+            for name in zf.namelist():
+                if name == 'embedded.png':
+                    embedded = zf.read(name)
+                else:
+                    images[name] = zf.read(name)
+        # Mark as recently used, so that it's kept when the cache is trimmed
+        os.utime(cache_fn, None)
+    except (IOError, OSError, zipfile.BadZipfile, KeyError):
+        report.runtimes['plot_cache_misses'] += 1
+        return None
+    report.runtimes['plot_cache_hits'] += 1
+    return images, embedded
+
+def _cache_set(key, images, embedded):
+    """ Save the images for a plot so that later runs can reuse them """
+    cache_fn = _cache_fn(key)
+    tmp_fn = None
+    try:
+        cache_dir = os.path.dirname(cache_fn)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write to a temporary file first so that other processes never see half a file
+        tmp_fn = '{}.{}.tmp'.format(cache_fn, os.getpid())
+        with zipfile.ZipFile(tmp_fn, 'w') as zf:
+            for fformat, img in images.items():
+                zf.writestr(fformat, img)
+            if embedded is not None:
+                zf.writestr('embedded.png', embedded)
+        os.rename(tmp_fn, cache_fn)
+    except (IOError, OSError) as e:
+        logger.debug("Could not save flat plot to cache: {}".format(e))
+        if tmp_fn is not None and os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+
+def trim_cache():
+    """ Delete the least recently used plots once the cache is larger than config.plot_cache_max_size """
+    cache_dir = os.path.join(search_cache.get_cache_dir(), 'plot_images')
+    max_size = config.plot_cache_max_size * 1024 * 1024
+    if not os.path.isdir(cache_dir):
+        return
+    try:
+        entries = list()
+        for fn in os.listdir(cache_dir):
+            if fn.endswith('.zip'):
+                fstat = os.stat(os.path.join(cache_dir, fn))
+                entries.append((fstat.st_mtime, fstat.st_size, fn))
+        total_size = sum(e[1] for e in entries)
+        removed = 0
+        for mtime, size, fn in sorted(entries):
+            if total_size <= max_size:
+                break
+            os.remove(os.path.join(cache_dir, fn))
+            total_size -= size
+            removed += 1
+        if removed > 0:
+            logger.debug("Removed {} old flat plots from cache: {}".format(removed, cache_dir))
+    except (IOError, OSError) as e:
+        logger.debug("Could not trim flat plot cache: {}".format(e))
+
+def _img_src(img):
+    return 'data:image/png;base64,{}'.format(base64.b64encode(img).decode('utf8'))
+
+def plot_image(pid, figure_fn, args, base64_plots=True):
+    """
+    Render a flat plot, save it to the plots directory if export is requested
+    and return the src for its <img> tag. figure_fn must be a module-level
+    function so that it can be called in a worker process. With --plot-workers,
+    the src is a placeholder that is replaced by splice() once the plot is ready.
+    """
+    formats = list(config.export_plot_formats) if config.export_plots else list()
+    if base64_plots:
+        src = None
+    else:
+        src = os.path.join(config.plots_dir_name, 'png', '{}.png'.format(pid))
+    job = (figure_fn, args, formats, base64_plots)
+    key = None
+    if config.plot_cache:
+        key = cache_key(job)
+        cached = _cache_get(key) if key is not None else None
+        if cached is not None:
+            images, embedded = cached
+            _save_images(pid, images)
+            return src if src is not None else _img_src(embedded)
+    if _use_workers():
+        try:
+            # Pickle now so that later changes to the plot data can't affect the figure
+            payload = pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.debug("Rendering flat plot '{}' here as it can't be sent to a worker: {}".format(pid, e))
+        else:
+            token = next(_tokens)
+            _pending.append((token, pid, key, payload, _get_pool().apply_async(_render_pickled, (payload,))))
+            return src if src is not None else 'mqc_flat_plot_placeholder_{}'.format(token)
+    images, embedded = render_figure(*job)
+    _save_images(pid, images)
+    if key is not None:
+        _cache_set(key, images, embedded)
+    return src if src is not None else _img_src(embedded)
+
+def finish():
+    """ Wait for flat plots rendered in worker processes, save their images and tidy up the plot cache """
+    global _pool
+    if _pool is not None:
+        start = time.time()
+        logger.debug("Waiting for {} flat plots to render".format(len(_pending)))
+        _pool.close()
+        for token, pid, key, payload, result in _pending:
+            try:
+                images, embedded = result.get()
+            except Exception as e:
+                logger.debug("Flat plot '{}' failed in a worker process, rendering it here: {}".format(pid, e))
+                images, embedded = _render_pickled(payload)
+            _save_images(pid, images)
+            if key is not None:
+                _cache_set(key, images, embedded)
+            if embedded is not None:
+                _images[token] = _img_src(embedded)
+        _pool.join()
+        _pool = None
+        del _pending[:]
+        logger.debug("Finished rendering flat plots after {:.2f}s".format(time.time() - start))
+    if config.plot_cache:
+        logger.debug("Flat plot cache: {} hits, {} misses".format(report.runtimes['plot_cache_hits'], report.runtimes['plot_cache_misses']))
+        trim_cache()
+
+def splice(html):
+    """ Swap the flat plot placeholders in the report HTML for the rendered images """
+    if len(_images) == 0:
+        return html
+    return placeholder_re.sub(lambda m: _images.get(int(m.group(1)), m.group(0)), html)
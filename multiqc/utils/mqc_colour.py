@@ -21,6 +21,8 @@ class mqc_colour_scale(object):
 
         self.colours = self.get_colours(name)
         self.name = name
+        self.scale_domain = None
+        self.scale_rgb = None
 
         # Sanity checks
         minval = re.sub("[^0-9\.]", "", str(minval))
@@ -41,40 +43,86 @@ class mqc_colour_scale(object):
 
     def get_colour(self, val, colformat='hex'):
         """ Given a value, return a colour within the colour scale """
-        try:
-            # When we have non-numeric values (e.g. Male/Female, Yes/No, chromosome names, etc), and a qualitive
-            # scale (Set1, Set3, etc), we don't want to attempt to parse numbers, otherwise we will end up with all
-            # values assigned withthe same color. But instead we will geta has from a string to hope to assign
-            # a unique color for each possible enumeration value.
-            if self.name in mqc_colour_scale.qualitative_scales and isinstance(val, str):
-                return self.colours[hash(val) % len(self.colours)]
+        return self.get_colours_for([val], colformat)[0]
 
-            # When there is only 1 color in scale, spectra.scale() will crash with DevisionByZero
-            elif len(self.colours) == 1:
-                return self.colours[0]
+    def get_colours_for(self, vals, colformat='hex'):
+        """
+        Given a list of values, return a list of colours within the colour scale.
+        The scale is only built once, and all numeric values are interpolated
+        together with numpy. Gives the same colours as blending each value
+        with spectra.scale(), as MultiQC has always done.
+        """
+        # When there is only 1 color in scale, spectra.scale() will crash with DevisionByZero
+        if len(self.colours) == 1:
+            return [self.colours[0]] * len(vals)
+
+        colours = [''] * len(vals)
+        qualitative = self.name in mqc_colour_scale.qualitative_scales
+
+        # Columns of numbers are converted all at once
+        numeric_idx = None
+        if not (qualitative and any(isinstance(val, str) for val in vals)):
+            try:
+                numeric_vals = np.asarray(vals, dtype=float)
+                if numeric_vals.ndim == 1:
+                    numeric_idx = range(len(vals))
+            except (TypeError, ValueError, OverflowError):
+                pass
 
-            else:
-                # Sanity checks
-                val = re.sub("[^0-9\.]", "", str(val))
-                if val == '':
-                    val = self.minval
-                val = float(val)
-                val = max(val, self.minval)
-                val = min(val, self.maxval)
+        if numeric_idx is None:
+            numeric_idx = list()
+            numeric_vals = list()
+            for i, val in enumerate(vals):
+                # When we have non-numeric values (e.g. Male/Female, Yes/No, chromosome names, etc), and a qualitive
+                # scale (Set1, Set3, etc), we don't want to attempt to parse numbers, otherwise we will end up with all
+                # values assigned withthe same color. But instead we will geta has from a string to hope to assign
+                # a unique color for each possible enumeration value.
+                if qualitative and isinstance(val, str):
+                    colours[i] = self.colours[hash(val) % len(self.colours)]
+                    continue
+                try:
+                    val = float(val)
+                except (TypeError, ValueError, OverflowError):
+                    # Sanity checks - strip units, thousands separators etc.
+                    val = re.sub("[^0-9\.]", "", str(val))
+                    try:
+                        val = float(val) if val != '' else self.minval
+                    except ValueError:
+                        # Shouldn't crash all of MultiQC just for colours
+                        continue
+                numeric_idx.append(i)
+                numeric_vals.append(val)
+            numeric_vals = np.array(numeric_vals, dtype=float)
 
-                domain_nums = list( np.linspace(self.minval, self.maxval, len(self.colours)) )
-                my_scale = spectra.scale(self.colours).domain(domain_nums)
+        if len(numeric_vals) > 0:
+            numeric_vals[np.isnan(numeric_vals)] = self.minval
+            numeric_vals = np.clip(numeric_vals, self.minval, self.maxval)
+            try:
+                for i, hexcode in zip(numeric_idx, self._interpolate_hex(numeric_vals)):
+                    colours[i] = hexcode
+            except:
+                pass
+        return colours
 
-                # Weird, I know. I ported this from the original JavaScript for continuity
-                # Seems to work better than adjusting brightness / saturation / luminosity
-                rgb_converter = lambda x: max(0, min(1, 1+((x-1)*0.3)))
-                thecolour = spectra.rgb( *[rgb_converter(v) for v in my_scale(val).rgb] )
+    def _interpolate_hex(self, vals):
+        """ Blend the scale colours for values within the domain and return hex codes """
+        if self.scale_domain is None:
+            self.scale_domain = np.linspace(self.minval, self.maxval, len(self.colours))
+            self.scale_rgb = np.array([ spectra.html(c).rgb for c in self.colours ])
+        vals = np.array(vals, dtype=float)
 
-                return thecolour.hexcode
+        # Find the first segment of the domain that contains each value
+        seg = np.clip(np.searchsorted(self.scale_domain, vals, side='left') - 1, 0, len(self.scale_domain) - 2)
+        x0 = self.scale_domain[seg]
+        x1 = self.scale_domain[seg + 1]
+        ratio = ((vals - x0) / (x1 - x0))[:, np.newaxis]
+        rgb = (self.scale_rgb[seg] * (1.0 - ratio)) + (self.scale_rgb[seg + 1] * ratio)
 
-        except:
-            # Shouldn't crash all of MultiQC just for colours
-            return ''
+        # Weird, I know. I ported this from the original JavaScript for continuity
+        # Seems to work better than adjusting brightness / saturation / luminosity
+        rgb = np.clip(1 + ((rgb - 1) * 0.3), 0, 1)
+        rgb = np.floor(0.5 + rgb * 255).astype(int)
+        return [ '#{:02x}{:02x}{:02x}'.format(*c) for c in rgb ]
 
 
     def get_colours(self, name='GnBu'):
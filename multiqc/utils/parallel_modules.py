@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+""" MultiQC code to run modules in parallel worker processes (--module-workers) """
+
+from __future__ import print_function
+from distutils.dir_util import copy_tree
+import importlib
+import io
+import marshal
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import sys
+import time
+import traceback
+import types
+
+from multiqc import config
+from multiqc.utils import report, parse_cache
+logger = config.logger
+
+def load_and_run(mod_dict):
+    """ Load a module from its entry point and run it. Returns a list of module objects """
+    this_module = list(mod_dict.keys())[0]
+    mod_cust_config = list(mod_dict.values())[0]
+    mod = config.avail_modules[this_module].load()
+    mod.mod_cust_config = mod_cust_config # feels bad doing this, but seems to work
+    output = mod()
+    if type(output) != list:
+        output = [output]
+    return output
+
+
+class ModuleResult(object):
+    """ What a module did to the shared report variables when run in a worker process """
+
+    def __init__(self, status, runtime=0, state=None, data_dir=None, plots_dir=None, message=None):
+        self.status = status
+        self.runtime = runtime
+        self.state = state
+        self.data_dir = data_dir
+        self.plots_dir = plots_dir
+        self.message = message
+
+
+def _make_function(code, module, name, defaults, kwdefaults, closure):
+    """ Rebuild a function that was pickled by _FunctionPickler """
+    globs = importlib.import_module(module).__dict__ if module else {'__builtins__': __builtins__}
+    cells = None
+    if closure is not None:
+        cells = tuple(types.CellType(c) for c in closure)
+    func = types.FunctionType(marshal.loads(code), globs, name, defaults, cells)
+    func.__kwdefaults__ = kwdefaults
+    return func
+
+class _FunctionPickler(pickle.Pickler):
+    """
+    Modules often use lambda functions, for example in general statistics headers
+    (`'modify': lambda x: x * 100`). These can't be pickled by reference, so send
+    their byte code instead. Both processes run the same Python, so this is safe.
+    """
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, types.FunctionType):
+            return NotImplemented
+        # Functions that can be imported by name are pickled as normal
+        try:
+            found = sys.modules[obj.__module__]
+            for part in obj.__qualname__.split('.'):
+                found = getattr(found, part)
+            if found is obj:
+                return NotImplemented
+        except (AttributeError, KeyError, TypeError):
+            pass
+        closure = None
+        if obj.__closure__ is not None:
+            closure = tuple(c.cell_contents for c in obj.__closure__)
+        return (_make_function, (marshal.dumps(obj.__code__), obj.__module__, obj.__name__, obj.__defaults__, obj.__kwdefaults__, closure))
+
+def _run_in_worker(mod_idx, mod_dict, worker_dir):
+    """ Run a single module in a worker process and return what it did as a ModuleResult """
+    # Workers are forked, so would all generate the same 'random' plot IDs
+    random.seed()
+
+    # Write data files and plots to a private directory, to be merged in later
+    data_dir = plots_dir = None
+    if config.data_dir is not None:
+        data_dir = config.data_dir = os.path.join(worker_dir, 'multiqc_data')
+        os.makedirs(data_dir)
+    if config.plots_dir is not None:
+        plots_dir = config.plots_dir = os.path.join(worker_dir, 'multiqc_plots')
+        os.makedirs(plots_dir)
+
+    base_parse_cache = set((fp, path) for fp in parse_cache.current for path in parse_cache.current[fp])
+    base_plot_cache = (report.runtimes['plot_cache_hits'], report.runtimes['plot_cache_misses'])
+    start = time.time()
+    # Modules can add to the report (eg. General Stats) even if they then say that they found nothing
+    status = 'ok'
+    output = list()
+    with report.scoped_state() as module_state:
+        try:
+            output = load_and_run(mod_dict)
+        except UserWarning:
+            status = 'no_samples'
+        except Exception:
+            return ModuleResult('error', message=traceback.format_exc())
+    runtime = time.time() - start
+
+    state = {
+        'modules_output': output,
+        'report_state': module_state,
+        'parse_cache': [(fp, path, entry) for fp in parse_cache.current for path, entry in parse_cache.current[fp].items() if (fp, path) not in base_parse_cache],
+        'plot_cache': (report.runtimes['plot_cache_hits'] - base_plot_cache[0], report.runtimes['plot_cache_misses'] - base_plot_cache[1])
+    }
+
+    # Pickle here rather than leaving it to multiprocessing, so that we can send lambda functions
+    try:
+        fh = io.BytesIO()
+        _FunctionPickler(fh, pickle.HIGHEST_PROTOCOL).dump(state)
+    except Exception as e:
+        return ModuleResult('unpicklable', message='{}: {}'.format(type(e).__name__, e))
+    return ModuleResult(status, runtime, fh.getvalue(), data_dir, plots_dir)
+
+def has_files(mod_name):
+    """
+    Whether the search found any files for a module. Modules are assumed to find
+    their files with search pattern keys starting with their name (eg. fastqc/zip).
+    Modules without any such keys, and custom content, could use anything so are
+    always counted as having files.
+    """
+    if mod_name == 'custom_content':
+        return True
+    prefix = mod_name.lower() + '/'
+    sp_keys = [ k for k in config.sp if k.lower() == mod_name.lower() or k.lower().startswith(prefix) ]
+    if len(sp_keys) == 0:
+        return True
+    return any(len(report.files.get(k, [])) > 0 for k in sp_keys)
+
+def run_in_workers(run_modules, num_workers, tmp_dir):
+    """
+    Run all modules in a pool of worker processes. Each module runs in a freshly
+    forked process, starting from the report state as it is before any module has
+    run. Nothing is merged here, so that the parent doesn't change whilst workers
+    are still being forked - use merge() for each result in the module order.
+    Returns a list of ModuleResults, or None if worker processes are not available.
+    """
+    if sys.version_info < (3, 8):
+        logger.warning("--module-workers needs Python 3.8 or later, running modules one at a time")
+        return None
+    try:
+        ctx = multiprocessing.get_context('fork')
+    except ValueError:
+        logger.warning("--module-workers is not supported on this platform, running modules one at a time")
+        return None
+
+    # Modules that found no files are quicker to run here than to fork a process for
+    worker_modules = [ mod_idx for mod_idx, mod_dict in enumerate(run_modules) if has_files(list(mod_dict.keys())[0]) ]
+    logger.info("Running {} modules using {} worker processes".format(len(worker_modules), num_workers))
+    pool = ctx.Pool(num_workers, maxtasksperchild=1)
+    try:
+        jobs = dict()
+        for mod_idx in worker_modules:
+            worker_dir = os.path.join(tmp_dir, 'module_workers', str(mod_idx))
+            jobs[mod_idx] = pool.apply_async(_run_in_worker, (mod_idx, run_modules[mod_idx], worker_dir))
+        results = list()
+        for mod_idx in range(len(run_modules)):
+            if mod_idx not in jobs:
+                results.append(ModuleResult('not_run', message='no files found'))
+                continue
+            try:
+                results.append(jobs[mod_idx].get())
+            except Exception as e:
+                results.append(ModuleResult('error', message=str(e)))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def merge(result, mod_dict):
+    """
+    Merge the result of a module run in a worker into the shared report variables.
+    Returns the list of module objects, or None if the module needs to be run again
+    in the main process - because it failed, couldn't be sent back, or because its
+    HTML IDs or data filenames clash with an earlier module (in a serial run these
+    would have been renamed). Raises UserWarning if the module found no samples.
+    """
+    this_module = list(mod_dict.keys())[0]
+    if result.status == 'not_run':
+        return None
+    if result.status not in ('ok', 'no_samples'):
+        logger.debug("Module {} did not run in a worker ({}), running it again: {}".format(this_module, result.status, result.message))
+        return None
+
+    state = pickle.loads(result.state)
+    try:
+        report.get_state().merge(state['report_state'])
+    except report.ReportStateClash as e:
+        logger.debug("Module {} IDs clash with an earlier module, running it again: {}".format(this_module, ', '.join(e.clashes)))
+        return None
+    for fp, path, entry in state['parse_cache']:
+        parse_cache.current.setdefault(fp, dict())[path] = entry
+    report.runtimes['plot_cache_hits'] += state['plot_cache'][0]
+    report.runtimes['plot_cache_misses'] += state['plot_cache'][1]
+
+    # Copy over files written by the module
+    if result.data_dir is not None and config.data_dir is not None:
+        copy_tree(result.data_dir, config.data_dir)
+    if result.plots_dir is not None and config.plots_dir is not None:
+        copy_tree(result.plots_dir, config.plots_dir)
+
+    # The module class has the custom config set on it in a serial run
+    mod = config.avail_modules[this_module].load()
+    mod.mod_cust_config = list(mod_dict.values())[0]
+
+    if result.status == 'no_samples':
+        raise UserWarning
+    return state['modules_output']
+
+def cleanup(tmp_dir):
+    """ Remove the private directories used by the worker processes """
+    shutil.rmtree(os.path.join(tmp_dir, 'module_workers'), ignore_errors=True)
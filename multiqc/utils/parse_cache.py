@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+""" MultiQC code to reuse parsed module data from a previous run (--incremental) """
+
+from __future__ import print_function
+import gzip
+import hashlib
+import io
+import json
+import os
+
+from multiqc import config
+logger = config.logger
+
+parse_cache_fn = 'multiqc_parse_cache.json.gz'
+
+# Parsed results from the previous run, and those used in this run
+previous = dict()
+current = dict()
+
+def fingerprint(module, sp_key, mod_cust_config=None):
+    """ Hash of everything that can change how a module parses its files """
+    # Module config is under <module>_config, named after the search pattern key (eg. fastqc/zip)
+    mod_config = getattr(config, '{}_config'.format(sp_key.split('/')[0]), None)
+    fp = json.dumps([config.version, module, sp_key, mod_config, mod_cust_config], sort_keys=True, default=str)
+    return hashlib.sha1(fp.encode('utf-8')).hexdigest()
+
+def file_key(f):
+    """ Identify a file by its absolute path, size and modification time """
+    path = os.path.join(f['root'], f['fn'])
+    fstat = os.stat(path)
+    return os.path.abspath(path), fstat.st_size, fstat.st_mtime
+
+def load(data_dir):
+    """ Load the parse cache saved in a previous MultiQC data directory """
+    global previous
+    previous = dict()
+    cache_fn = os.path.join(data_dir, parse_cache_fn)
+    if not os.path.isfile(cache_fn):
+        logger.warning("No parsed data found in '{}', all files will be parsed".format(data_dir))
+        return
+    try:
+        with gzip.open(cache_fn, 'rb') as fh:
+            cache = json.loads(fh.read().decode('utf-8'))
+        if cache.get('version') != config.version:
+            logger.info("Parsed data in '{}' is from a different version of MultiQC, all files will be parsed".format(data_dir))
+            return
+        previous = cache['modules']
+        logger.info("Reusing parsed data from: {}".format(data_dir))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logger.warning("Could not load parsed data from '{}', all files will be parsed: {}".format(cache_fn, e))
+
+def get_parsed(fp, f):
+    """ Return the parsed data for a file if it hasn't changed since the previous run """
+    try:
+        path, size, mtime = file_key(f)
+    except (IOError, OSError, ValueError):
+        return None
+    cached = previous.get(fp, {}).get(path)
+    if cached is not None and cached['size'] == size and cached['mtime'] == mtime:
+        current.setdefault(fp, dict())[path] = cached
+        return _copy(cached['data'])
+    return None
+
+def add_parsed(fp, f, data):
+    """ Remember the parsed data for a file, to be saved for the next run """
+    try:
+        path, size, mtime = file_key(f)
+    except (IOError, OSError, ValueError):
+        return
+    try:
+        data = _copy(data)
+    except (TypeError, ValueError) as e:
+        logger.debug("Not saving parsed data for {}, it can't be saved as JSON: {}".format(path, e))
+        return
+    current.setdefault(fp, dict())[path] = {'size': size, 'mtime': mtime, 'data': data}
+
+def _copy(data):
+    """ Copy of parsed data, so that modules can't change what is saved. Much quicker than deepcopy for big data. """
+    return json.loads(json.dumps(data))
+
+def save(data_dir):
+    """ Save the parsed data used in this run to the MultiQC data directory """
+    cache = {
+        'version': config.version,
+        'modules': current
+    }
+    try:
+        with io.BufferedWriter(gzip.open(os.path.join(data_dir, parse_cache_fn), 'wb', compresslevel=1)) as fh:
+            fh.write(json.dumps(cache).encode('utf-8'))
+    except (IOError, OSError, TypeError, ValueError) as e:
+        logger.warning("Could not save parsed data for --incremental: {}".format(e))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+""" MultiQC code to decide how each plot should be shown in the report """
+
+from __future__ import print_function
+import logging
+
+from multiqc.utils import config
+
+logger = logging.getLogger(__name__)
+
+# What each plot type can fall back to when it has too much data to be fully interactive
+fallbacks = {
+    'bargraph': ['flat'],
+    'linegraph': ['downsampled', 'aggregate', 'flat'],
+    'heatmap': ['flat'],
+    'scatter': ['downsampled'],
+}
+
+def choose(plot_type, n_series, n_points, n_datasets=1, pconfig=None):
+    """
+    Pick how to show a plot: 'interactive', 'downsampled', 'aggregate' or 'flat'.
+    :param plot_type: Key in plot_strategy.fallbacks
+    :param n_series: Number of samples in the plot (bars / lines), or None if the
+                     plot doesn't draw one series per sample
+    :param n_points: Largest number of data points in one series
+    :param n_datasets: Number of datasets that can be switched between
+    :param pconfig: Plot config, used for the plot ID in log messages
+    :return: Name of the strategy
+    """
+    can_use = fallbacks[plot_type]
+
+    # Without plots_auto_strategy, bar graphs and line graphs switch to flat
+    # plots when they have lots of samples and everything else is interactive
+    if not config.plots_auto_strategy:
+        if n_series is not None and 'flat' in can_use:
+            if config.plots_force_flat or (not config.plots_force_interactive and n_series > config.plots_flat_numseries):
+                return 'flat'
+        return 'interactive'
+
+    if config.plots_force_flat and 'flat' in can_use:
+        return 'flat'
+    if config.plots_force_interactive:
+        return 'interactive'
+
+    strategy = 'interactive'
+    cost = (n_series or 1) * n_points * n_datasets
+    if n_series is not None and n_series > config.plots_flat_numseries:
+        # Too many samples to tell apart - summarise them, or draw an image
+        strategy = next((s for s in ['aggregate', 'flat'] if s in can_use), strategy)
+    elif cost > config.plots_auto_max_points:
+        # Few enough samples, but too much data for the browser - thin it out, or draw an image
+        strategy = next((s for s in ['downsampled', 'flat'] if s in can_use), strategy)
+
+    if strategy != 'interactive':
+        plot_id = (pconfig or {}).get('id', plot_type)
+        logger.debug("Plot '{}' has {} samples x {} points x {} datasets, using a {} plot".format(
+            plot_id, n_series or 1, n_points, n_datasets, strategy))
+    return strategy
@@ -7,7 +7,7 @@ from collections import OrderedDict
 import logging
 import re
 
-from multiqc.utils import report
+from multiqc.utils import report, config
 from multiqc.plots import bargraph
 from multiqc.modules.base_module import BaseMultiqcModule
 
@@ -37,6 +37,9 @@ class MultiqcModule(BaseMultiqcModule):
 
         self.search_pattern_times_section()
 
+        if config.search_cache or config.plot_cache:
+            self.cache_stats_section()
+
 
     def file_search_stats_section(self):
         """ Count of all files iterated through by MultiQC, by category """
@@ -103,7 +106,14 @@ class MultiqcModule(BaseMultiqcModule):
             description = '''
                 Time spent running each search pattern to find files for MultiQC modules.
                 **Total file search time: {:.2f} seconds**.
-            '''.format(report.runtimes['total_sp']),
+
+                File contents were read {} times ({} lines), and shared by search patterns
+                that would otherwise have re-read them {} times ({} lines).
+            '''.format(
+                report.runtimes['total_sp'],
+                report.runtimes['sp_file_reads'], report.runtimes['sp_lines_read'],
+                report.runtimes['sp_file_reads_saved'], report.runtimes['sp_lines_saved']
+            ),
             helptext = '''
                 **NOTE: Usually, MultiQC run time is fairly insignificant - in the order of seconds.
                 Unless you are running MultiQC on many thousands of analysis files, optimising this process
@@ -114,6 +124,7 @@ class MultiqcModule(BaseMultiqcModule):
                 defined in `multiqc/utils/search_patterns.yaml`.
                 These work by matching either file names or file contents. Generally speaking, matching
                 filenames is super fast and matching file contents is slower.
+                Each file is only read once, however many search patterns look at its contents.
 
                 Please see the [MultiQC Documentation](https://multiqc.info/docs/#optimising-run-time)
                 for information on how to optimise MultiQC to speed this process up.
@@ -122,3 +133,51 @@ class MultiqcModule(BaseMultiqcModule):
             ''',
             plot = bargraph.plot(pdata, None, pconfig)
         )
+
+    def cache_stats_section(self):
+        """ Section with a bar plot showing hits and misses for the search and flat plot caches """
+
+        pdata = OrderedDict()
+        descriptions = []
+        if config.search_cache:
+            pdata['File search cache'] = {
+                'hits': report.runtimes['sp_cache_hits'],
+                'misses': report.runtimes['sp_cache_misses']
+            }
+            descriptions.append('**{} files found in search cache, {} searched.**'.format(
+                report.runtimes['sp_cache_hits'], report.runtimes['sp_cache_misses']))
+        if config.plot_cache:
+            pdata['Flat plot cache'] = {
+                'hits': report.runtimes['plot_cache_hits'],
+                'misses': report.runtimes['plot_cache_misses']
+            }
+            descriptions.append('**{} flat plots found in plot cache, {} rendered.**'.format(
+                report.runtimes['plot_cache_hits'], report.runtimes['plot_cache_misses']))
+
+        pcats = OrderedDict()
+        pcats['hits'] = { 'name': 'Hits', 'color': '#7cb5ec' }
+        pcats['misses'] = { 'name': 'Misses', 'color': '#999999' }
+
+        pconfig = {
+            'id': 'multiqc_runtime_caches_plot',
+            'title': 'MultiQC: Cache hits and misses',
+            'ylab': 'Count',
+            'cpswitch_counts_label': 'Count'
+        }
+
+        self.add_section(
+            name = 'Caches',
+            anchor = 'multiqc_runtime_caches',
+            description = '''
+                Number of lookups that were found in the MultiQC caches (hits) and that had to be
+                done from scratch (misses). {}
+            '''.format(' '.join(descriptions)),
+            helptext = '''
+                * `File search cache` - Files whose search pattern matches were re-used from a previous run (see `--search-cache`)
+                * `Flat plot cache` - Flat plot images that were re-used from a previous run instead of being rendered (see `--plot-cache`)
+
+                Both caches are stored in `config.cache_dir`. Flat plots in this run time report are
+                rendered after the counts are taken, so are not included.
+            ''',
+            plot = bargraph.plot(pdata, pcats, pconfig)
+        )
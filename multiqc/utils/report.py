@@ -5,20 +5,29 @@ module. Is available to subsequent modules. Contains
 helper functions to generate markup for report. """
 
 from __future__ import print_function
+import base64
 from collections import defaultdict, OrderedDict
 import click
+import contextlib
 import fnmatch
 import io
 import json
 import inspect
+import linecache
 import lzstring
 import mimetypes
 import os
+import sys
+import threading
 import time
+import types
 import re
+import simplejson
 import yaml
+import zlib
 
 from multiqc import config
+from multiqc.utils import util_functions
 logger = config.logger
 
 # Treat defaultdict and OrderedDict as normal dicts for YAML output
@@ -30,23 +39,214 @@ try:
 except NameError:
     pass # Python 3
 
+class ReportStateClash(Exception):
+    """ Raised when merging report state that used the same HTML IDs or data filenames """
+
+    def __init__(self, clashes):
+        self.clashes = sorted(clashes)
+        super(ReportStateClash, self).__init__("Clashing IDs: {}".format(", ".join(self.clashes)))
+
+
+class HtmlIdRegistry(object):
+    """
+    The HTML IDs used in the report, in the order that they were added. Behaves
+    like the list that was used before, but lookups are against a set. A registry
+    made for a scoped ReportState also knows about the IDs in its parent, but only
+    iterates over (and pickles) its own.
+    """
+
+    def __init__(self, ids=None, parent=None):
+        self.ids = list()
+        self.id_set = set()
+        self.next_suffix = dict()
+        self.parent = parent
+        self.extend(ids or [])
+
+    def __contains__(self, html_id):
+        return html_id in self.id_set or (self.parent is not None and html_id in self.parent)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, idx):
+        return self.ids[idx]
+
+    def __getstate__(self):
+        return {'ids': self.ids, 'id_set': self.id_set, 'next_suffix': self.next_suffix, 'parent': None}
+
+    def append(self, html_id):
+        self.ids.append(html_id)
+        self.id_set.add(html_id)
+
+    def extend(self, html_ids):
+        for html_id in html_ids:
+            self.append(html_id)
+
+    def _next_suffix(self, html_id):
+        if html_id in self.next_suffix:
+            return self.next_suffix[html_id]
+        if self.parent is not None:
+            return self.parent._next_suffix(html_id)
+        return 1
+
+    def add_unique(self, html_id):
+        """
+        Add an ID, appending -1, -2 etc. if it's already taken. Returns the ID added.
+        Remembers the next suffix to try for each base ID, so this doesn't get slower
+        as more duplicates are added (IDs are never removed, so all lower suffixes are taken)
+        """
+        if html_id in self:
+            i = self._next_suffix(html_id)
+            while '{}-{}'.format(html_id, i) in self:
+                i += 1
+            self.next_suffix[html_id] = i + 1
+            html_id = '{}-{}'.format(html_id, i)
+        self.append(html_id)
+        return html_id
+
+
+class ReportState(object):
+    """
+    Everything that modules add to the report. The module-level variables in this
+    file (report.general_stats_data, report.plot_data etc.) are aliases for the
+    attributes of the current ReportState.
+
+    Use scoped() (or the scoped_state() context manager) to give a single module
+    its own state. This starts empty, but knows about the HTML IDs and data
+    filenames already used so that new ones are still unique. It can be built
+    in another thread or process (it pickles without its parent) and then added
+    back with merge(), in the same order that the modules would run in.
+    """
+
+    state_vars = ['general_stats_data', 'general_stats_headers', 'data_sources', 'plot_data', 'table_data',
+                  'html_ids', 'lint_errors', 'num_hc_plots', 'num_mpl_plots', 'saved_raw_data', 'last_found_file']
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.general_stats_data = list()
+        self.general_stats_headers = list()
+        self.data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
+        self.plot_data = dict()
+        self.table_data = dict()
+        self.html_ids = HtmlIdRegistry(parent=parent.html_ids if parent is not None else None)
+        self.lint_errors = list()
+        self.num_hc_plots = 0
+        self.num_mpl_plots = 0
+        self.saved_raw_data = dict()
+        self.last_found_file = None
+
+    def __setattr__(self, name, value):
+        # Keep HTML ID lookups fast, even if someone sets a plain list
+        if name == 'html_ids' and not isinstance(value, HtmlIdRegistry):
+            value = HtmlIdRegistry(value)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['parent'] = None
+        state['data_sources'] = {m: {s: dict(d) for s, d in secs.items()} for m, secs in self.data_sources.items()}
+        return state
+
+    def __setstate__(self, state):
+        data_sources = state.pop('data_sources')
+        self.__dict__.update(state)
+        self.data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
+        for module, sections in data_sources.items():
+            for section, sources in sections.items():
+                self.data_sources[module][section].update(sources)
+
+    def scoped(self):
+        """ Return a new, empty ReportState for one module, based on this one """
+        return ReportState(parent=self)
+
+    def saved_raw_data_exists(self, fn):
+        """ Check if a raw data filename has been used, here or in a parent state """
+        return fn in self.saved_raw_data or (self.parent is not None and self.parent.saved_raw_data_exists(fn))
+
+    def merge(self, other):
+        """
+        Add everything from another ReportState (usually made with scoped()) to this one.
+        Lists are appended, dicts are updated and plot counts are added together.
+        Raises ReportStateClash and changes nothing if the other state used HTML IDs
+        or data filenames that are already taken here, as they would have been given
+        different names if the modules had been run one after the other.
+        """
+        clashes = set(html_id for html_id in other.html_ids if html_id in self.html_ids)
+        clashes.update(fn for fn in other.saved_raw_data if self.saved_raw_data_exists(fn))
+        if len(clashes) > 0:
+            raise ReportStateClash(clashes)
+
+        self.general_stats_data.extend(other.general_stats_data)
+        self.general_stats_headers.extend(other.general_stats_headers)
+        for module, sections in other.data_sources.items():
+            for section, sources in sections.items():
+                self.data_sources[module][section].update(sources)
+        self.plot_data.update(other.plot_data)
+        self.table_data.update(other.table_data)
+        self.html_ids.extend(other.html_ids)
+        self.lint_errors.extend(other.lint_errors)
+        self.num_hc_plots += other.num_hc_plots
+        self.num_mpl_plots += other.num_mpl_plots
+        self.saved_raw_data.update(other.saved_raw_data)
+        if other.last_found_file is not None:
+            self.last_found_file = other.last_found_file
+
+
+# The report state used by default, and any scoped states used by particular threads
+_root_state = ReportState()
+_local = threading.local()
+
+def get_state():
+    """ Return the ReportState currently in use by this thread """
+    return getattr(_local, 'state', None) or _root_state
+
+@contextlib.contextmanager
+def scoped_state():
+    """
+    Context manager to give this thread a scoped ReportState (see ReportState.scoped()).
+    Anything added to the report inside the block goes into the yielded state, which
+    can then be merged into the parent state with merge().
+    """
+    previous = getattr(_local, 'state', None)
+    scope = get_state().scoped()
+    _local.state = scope
+    try:
+        yield scope
+    finally:
+        _local.state = previous
+
+class _ReportModule(types.ModuleType):
+    """ Module class so that report.<state_var> reads and writes the current ReportState """
+
+    @property
+    def state(self):
+        return get_state()
+
+def _state_alias(name):
+    return property(lambda self: getattr(get_state(), name), lambda self, value: setattr(get_state(), name, value))
+
+for _name in ReportState.state_vars:
+    setattr(_ReportModule, _name, _state_alias(_name))
+sys.modules[__name__].__class__ = _ReportModule
+
 # Set up global variables shared across modules
-general_stats_data = list()
-general_stats_headers = list()
 general_stats_html = ''
-data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
-plot_data = dict()
-html_ids = list()
-lint_errors = list()
-num_hc_plots = 0
-num_mpl_plots = 0
-saved_raw_data = dict()
-last_found_file = None
 runtimes = {
     'total': 0,
     'total_sp': 0,
     'total_mods': 0,
     'total_compression': 0,
+    'sp_file_reads': 0,
+    'sp_file_reads_saved': 0,
+    'sp_lines_read': 0,
+    'sp_lines_saved': 0,
+    'sp_cache_hits': 0,
+    'sp_cache_misses': 0,
+    'plot_cache_hits': 0,
+    'plot_cache_misses': 0,
     'sp': defaultdict(),
     'mods': defaultdict()
 }
@@ -90,6 +290,7 @@ def get_filelist(run_module_names):
             'shared',
             'skip',
             'max_filesize',
+            'streamed',
             'exclude_fn',
             'exclude_fn_re',
             'exclude_contents',
@@ -122,62 +323,159 @@ def get_filelist(run_module_names):
         else:
             spatterns[0][key] = sps
 
+        # Tidy up the exclusion patterns now, so that they aren't modified during the search
+        for sp in sps:
+            prep_exclude_patterns(sp)
+
     if len(ignored_patterns) > 0:
         logger.debug("Ignored {} search patterns as didn't match running modules.".format(len(ignored_patterns)))
 
+    # Compile all filename patterns into a single matcher, so that each
+    # filename only has to be looked up once instead of once per pattern
+    fn_matcher = FilenameMatcher()
+    for n in config.fn_ignore_files:
+        fn_matcher.add_glob('fn_ignore_files', n)
+    for patterns in spatterns:
+        for key, sps in patterns.items():
+            for idx, sp in enumerate(sps):
+                if sp.get('fn') is not None:
+                    fn_matcher.add_glob((key, idx, 'fn'), sp['fn'])
+                if sp.get('fn_re') is not None:
+                    fn_matcher.add_regex((key, idx, 'fn'), sp['fn_re'])
+                for pat in sp.get('exclude_fn', []):
+                    fn_matcher.add_glob((key, idx, 'exclude_fn'), pat)
+                for pat in sp.get('exclude_fn_re', []):
+                    fn_matcher.add_regex((key, idx, 'exclude_fn'), pat)
+    fn_matcher.compile()
+    has_streamed_patterns = any([sp.get('streamed', False) for patterns in spatterns for sps in patterns.values() for sp in sps])
+
+    # Reuse search results from previous runs for files that haven't changed
+    search_cache = None
+    if config.search_cache:
+        from multiqc.utils import search_cache as sc
+        search_cache = sc.SearchCache(
+            os.path.join(sc.get_cache_dir(), 'search_cache.sqlite'),
+            sc.fingerprint(spatterns, config.fn_ignore_files, config.fn_ignore_dirs, config.fn_ignore_paths,
+                config.log_filesize_limit, config.log_filesize_limit_streamed, config.log_filesize_limit_streamed_lines,
+                config.ignore_images, config.ignore_symlinks)
+        )
+
     def add_file(fn, root):
         """
         Function applied to each file found when walking the analysis
-        directories. Runs through all search patterns and returns True
-        if a match is found.
+        directories. Runs through all search patterns and returns a dict
+        describing what was found. Does not touch any shared state, so that
+        files can be searched in parallel. Results are collected by add_file_result().
         """
-        f = {'fn': fn, 'root': root}
+        result = {
+            'f': {'fn': fn, 'root': root},
+            'file_matched': False,
+            'matched_keys': list(),
+            'skipped_key': None,
+            'sp_times': dict(),
+            'io_stats': None,
+            'cache_hit': False,
+            'cache_key': None
+        }
+        f = result['f']
 
         # Check that this is a file and not a pipe or anything weird
         if not os.path.isfile(os.path.join(root, fn)):
-            file_search_stats['skipped_not_a_file'] += 1
-            return False
+            result['skipped_key'] = 'skipped_not_a_file'
+            return result
 
         # Check that we don't want to ignore this file
-        i_matches = [n for n in config.fn_ignore_files if fnmatch.fnmatch(fn, n)]
-        if len(i_matches) > 0:
+        fn_matches = fn_matcher.match(fn)
+        if 'fn_ignore_files' in fn_matches:
             logger.debug("Ignoring file as matched an ignore pattern: {}".format(fn))
-            file_search_stats['skipped_ignore_pattern'] += 1
-            return False
+            result['skipped_key'] = 'skipped_ignore_pattern'
+            return result
 
         # Limit search to small files, to avoid 30GB FastQ files etc.
+        # Larger files can still be found by modules that stream them instead of reading them all at once
+        large_file = False
         try:
             f['filesize'] = os.path.getsize(os.path.join(root,fn))
         except (IOError, OSError, ValueError, UnicodeDecodeError):
             logger.debug("Couldn't read file when checking filesize: {}".format(fn))
         else:
             if f['filesize'] > config.log_filesize_limit:
-                file_search_stats['skipped_filesize_limit'] += 1
-                return False
+                if not has_streamed_patterns or f['filesize'] > config.log_filesize_limit_streamed:
+                    result['skipped_key'] = 'skipped_filesize_limit'
+                    return result
+                large_file = True
+
+        # Check if we already know the result from a previous run
+        if search_cache is not None:
+            try:
+                fstat = os.stat(os.path.join(root, fn))
+                result['cache_key'] = (os.path.abspath(os.path.join(root, fn)), fstat.st_size, fstat.st_mtime)
+            except (IOError, OSError, ValueError):
+                pass
+            else:
+                cached = search_cache.get(*result['cache_key'])
+                if cached is not None:
+                    result['file_matched'], result['matched_keys'] = cached
+                    result['cache_hit'] = True
+                    return result
 
         # Test file for each search pattern
-        file_matched = False
-        for patterns in spatterns:
-            for key, sps in patterns.items():
-                start = time.time()
-                for sp in sps:
-                    if search_file (sp, f, key):
-                        # Check that we shouldn't exclude this file
-                        if not exclude_file(sp, f):
-                            # Looks good! Remember this file
-                            files[key].append(f)
-                            file_search_stats[key] = file_search_stats.get(key, 0) + 1
-                            file_matched = True
-                        # Don't keep searching this file for other modules
-                        if not sp.get('shared', False):
-                            runtimes['sp'][key] = runtimes['sp'].get(key, 0) + (time.time() - start)
-                            return True
-                        # Don't look at other patterns for this module
-                        else:
-                            break
-                runtimes['sp'][key] = runtimes['sp'].get(key, 0) + (time.time() - start)
-
-        return file_matched
+        # File contents are read once and shared by all search patterns
+        contents = SearchFileContents(os.path.join(root, fn), config.log_filesize_limit_streamed_lines if large_file else None)
+        try:
+            for patterns in spatterns:
+                for key, sps in patterns.items():
+                    start = time.time()
+                    for idx, sp in enumerate(sps):
+                        if large_file and not sp.get('streamed', False):
+                            continue
+                        if search_file (sp, f, key, contents, fn_matched=(key, idx, 'fn') in fn_matches):
+                            # Check that we shouldn't exclude this file
+                            if not exclude_file(sp, f, contents, fn_excluded=(key, idx, 'exclude_fn') in fn_matches):
+                                # Looks good! Remember this file
+                                result['matched_keys'].append(key)
+                                result['file_matched'] = True
+                            # Don't keep searching this file for other modules
+                            if not sp.get('shared', False):
+                                result['file_matched'] = True
+                                result['sp_times'][key] = result['sp_times'].get(key, 0) + (time.time() - start)
+                                return result
+                            # Don't look at other patterns for this module
+                            else:
+                                break
+                    result['sp_times'][key] = result['sp_times'].get(key, 0) + (time.time() - start)
+        finally:
+            contents.close()
+            result['io_stats'] = contents.io_stats()
+
+        if large_file and not result['file_matched']:
+            result['skipped_key'] = 'skipped_filesize_limit'
+        return result
+
+    def add_file_result(result):
+        """
+        Collect the result of add_file() into the shared report variables.
+        Always called in the original file order, so that the report is
+        the same no matter how many search workers are used.
+        """
+        if result['skipped_key'] is not None:
+            file_search_stats[result['skipped_key']] += 1
+        for key in result['matched_keys']:
+            files[key].append(result['f'])
+            file_search_stats[key] = file_search_stats.get(key, 0) + 1
+        for key, sp_time in result['sp_times'].items():
+            runtimes['sp'][key] = runtimes['sp'].get(key, 0) + sp_time
+        if result['io_stats'] is not None:
+            for key, count in result['io_stats'].items():
+                runtimes[key] += count
+        if search_cache is not None and result['cache_key'] is not None:
+            if result['cache_hit']:
+                runtimes['sp_cache_hits'] += 1
+            else:
+                runtimes['sp_cache_misses'] += 1
+                search_cache.set(*result['cache_key'], file_matched=result['file_matched'], matched_keys=result['matched_keys'])
+        if not result['file_matched']:
+            file_search_stats['skipped_no_match'] += 1
 
     # Go through the analysis directories and get file list
     multiqc_installation_dir_files = ['LICENSE', 'CHANGELOG.md', 'Dockerfile', 'MANIFEST.in', '.gitmodules', 'README.md', 'CSP.txt', 'setup.py', '.gitignore']
@@ -229,28 +527,222 @@ def get_filelist(run_module_names):
                     searchfiles.append([fn, root])
 
     # Search through collected files
-    with click.progressbar(searchfiles, label="Searching {} files..".format(len(searchfiles))) as sfiles:
-        for sf in sfiles:
-            if not add_file(sf[0], sf[1]):
-                file_search_stats['skipped_no_match'] += 1
+    search_workers = max(1, int(getattr(config, 'search_workers', 1) or 1))
+    if search_workers > 1 and len(searchfiles) > 1:
+        try:
+            import concurrent.futures
+        except ImportError:
+            # Python 2 without the futures backport
+            logger.warning("Searching files one at a time, --search-workers needs the 'futures' package with Python 2")
+            search_workers = 1
+    if search_workers > 1 and len(searchfiles) > 1:
+        logger.debug("Searching files using {} worker threads".format(search_workers))
+        # Initialise mimetypes up front, so that the workers don't race to do it
+        mimetypes.init()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=search_workers) as pool:
+            # Submit files in batches so that we don't hold a future for every file in memory
+            batch_size = search_workers * 256
+            def search_results():
+                for i in range(0, len(searchfiles), batch_size):
+                    for result in pool.map(lambda sf: add_file(sf[0], sf[1]), searchfiles[i:i+batch_size]):
+                        yield result
+            with click.progressbar(search_results(), length=len(searchfiles), label="Searching {} files..".format(len(searchfiles))) as results:
+                for result in results:
+                    add_file_result(result)
+    else:
+        with click.progressbar(searchfiles, label="Searching {} files..".format(len(searchfiles))) as sfiles:
+            for sf in sfiles:
+                add_file_result(add_file(sf[0], sf[1]))
+
+    if search_cache is not None:
+        search_cache.close()
+        logger.debug("File search cache: {} hits, {} misses".format(runtimes['sp_cache_hits'], runtimes['sp_cache_misses']))
 
     runtimes['total_sp'] = time.time() - total_sp_starttime
 
-def search_file (pattern, f, module_key):
+class FilenameMatcher(object):
+    """
+    Classifies a filename against many glob and regex patterns at once.
+    Patterns are added with an ID (several patterns can share an ID), then
+    compiled once. match() returns the set of IDs with a matching pattern,
+    giving exactly the same result as calling fnmatch.fnmatch() / re.match()
+    for every pattern in turn.
+
+    Simple globs are looked up in dicts: exact filenames, `*suffix` and
+    `prefix*`. All other globs are combined into one regex (and all regexes
+    into another), where each pattern is an optional lookahead with its own
+    named group.
+    """
+
+    def __init__(self):
+        self.exact = defaultdict(set)
+        self.suffixes = defaultdict(lambda: defaultdict(set))
+        self.prefixes = defaultdict(lambda: defaultdict(set))
+        self.regexes = list()
+        self.combined_res = list()
+        self.combined_ids = dict()
+        self.separate_res = list()
+
+    def add_glob(self, pid, pattern):
+        """ Add a glob pattern, as used by fnmatch.fnmatch() """
+        pattern = os.path.normcase(pattern)
+        is_magic = lambda x: any(c in x for c in '*?[')
+        if not is_magic(pattern):
+            self.exact[pattern].add(pid)
+        elif pattern.startswith('*') and not is_magic(pattern[1:]):
+            self.suffixes[len(pattern) - 1][pattern[1:]].add(pid)
+        elif pattern.endswith('*') and not is_magic(pattern[:-1]):
+            self.prefixes[len(pattern) - 1][pattern[:-1]].add(pid)
+        else:
+            self.regexes.append((pid, fnmatch.translate(pattern), True))
+
+    def add_regex(self, pid, pattern):
+        """ Add a regex pattern, as used by re.match() """
+        self.regexes.append((pid, pattern, False))
+
+    def compile(self):
+        """ Combine the regex patterns into a compiled regex for globs and one for regexes """
+        parts = {True: list(), False: list()}
+        self.combined_ids = dict()
+        self.separate_res = list()
+        for pid, pattern, is_glob in self.regexes:
+            # Back-references, conditionals and named groups don't survive being combined
+            group_name = 'p{}'.format(len(self.combined_ids))
+            wrapped = '(?:(?=(?P<{}>{}))|)'.format(group_name, pattern)
+            can_combine = re.search(r'\\\d|\(\?P=|\(\?P<|\(\?\(', pattern) is None
+            if can_combine:
+                try:
+                    re.compile(wrapped)
+                except re.error:
+                    can_combine = False
+            if can_combine:
+                parts[is_glob].append(wrapped)
+                self.combined_ids[group_name] = pid
+            else:
+                self.separate_res.append((pid, re.compile(pattern), is_glob))
+        self.combined_res = [(re.compile(''.join(parts[is_glob])), is_glob) for is_glob in parts if len(parts[is_glob]) > 0]
+
+    def match(self, fn):
+        """ Return the set of pattern IDs that match this filename """
+        # Globs are matched case-normalised, as with fnmatch.fnmatch()
+        nfn = os.path.normcase(fn)
+        matches = set(self.exact.get(nfn, ()))
+        for length, suffixes in self.suffixes.items():
+            if len(nfn) >= length:
+                matches.update(suffixes.get(nfn[len(nfn) - length:], ()))
+        for length, prefixes in self.prefixes.items():
+            matches.update(prefixes.get(nfn[:length], ()))
+        for combined_re, is_glob in self.combined_res:
+            for group_name, value in combined_re.match(nfn if is_glob else fn).groupdict().items():
+                if value is not None:
+                    matches.add(self.combined_ids[group_name])
+        for pid, pattern, is_glob in self.separate_res:
+            if pattern.match(nfn if is_glob else fn):
+                matches.add(pid)
+        return matches
+
+
+class SearchFileContents(object):
+    """
+    Lazily reads the lines of a file that is being searched and keeps
+    them in memory, so that every content search pattern (and exclusion
+    pattern) can be tested without opening the file again. Lines are only
+    read as far into the file as the search patterns need to look.
+    If max_lines is set, the file is treated as if it ends after that many lines.
+    """
+
+    def __init__(self, path, max_lines=None):
+        self.path = path
+        self.max_lines = max_lines
+        self.lines = list()
+        self.fh = None
+        self.finished = False
+        self.error = None
+        self.binary = None
+        self.num_reads = 0
+        self.num_lines_saved = 0
+
+    def iterlines(self):
+        """ Iterate over the lines of the file, reading more only when needed.
+        Read errors are raised again every time the failed line is reached """
+        self.num_reads += 1
+        i = 0
+        while True:
+            if i < len(self.lines):
+                self.num_lines_saved += 1
+                yield self.lines[i]
+                i += 1
+            elif self.finished or (self.max_lines is not None and i >= self.max_lines):
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                self._readline()
+
+    def _readline(self):
+        try:
+            if self.fh is None:
+                self.fh = io.open (self.path, "r", encoding='utf-8')
+            line = self.fh.readline()
+        except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+            self.error = e
+            self.close()
+        else:
+            if line == '':
+                self.close()
+            else:
+                self.lines.append(line)
+
+    def is_binary(self):
+        """ Use mimetypes to guess whether this is a binary file that we should
+        skip. Only worked out once per file, as it doesn't depend on the search pattern """
+        if self.binary is None:
+            self.binary = False
+            if not re.match(r'.+_mqc\.(png|jpg|jpeg)', os.path.basename(self.path)) and config.ignore_images:
+                (ftype, encoding) = mimetypes.guess_type(self.path)
+                if encoding is not None:
+                    self.binary = True
+                if ftype is not None and ftype.startswith('image'):
+                    self.binary = True
+        return self.binary
+
+    def close(self):
+        self.finished = True
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def io_stats(self):
+        """ Return a count of what was read, and what re-reading was saved by caching """
+        return {
+            'sp_file_reads': min(self.num_reads, 1),
+            'sp_file_reads_saved': max(self.num_reads - 1, 0),
+            'sp_lines_read': len(self.lines),
+            'sp_lines_saved': self.num_lines_saved - len(self.lines)
+        }
+
+
+def search_file (pattern, f, module_key, contents=None, fn_matched=None):
     """
     Function to searach a single file for a single search pattern.
+    :param contents: Optional SearchFileContents to share read lines between calls
+    :param fn_matched: Optional result of the fn / fn_re patterns, if already
+                       worked out by a FilenameMatcher
     """
+    if contents is None:
+        contents = SearchFileContents(os.path.join(f['root'], f['fn']))
+        try:
+            return search_file(pattern, f, module_key, contents, fn_matched)
+        finally:
+            contents.close()
 
-    fn_matched = False
+    has_fn_pattern = pattern.get('fn') is not None or pattern.get('fn_re') is not None
+    has_contents_pattern = pattern.get('contents') is not None or pattern.get('contents_re') is not None
     contents_matched = False
 
     # Use mimetypes to exclude binary files where possible
-    if not re.match(r'.+_mqc\.(png|jpg|jpeg)', f['fn']) and config.ignore_images:
-        (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
-        if encoding is not None:
-            return False
-        if ftype is not None and ftype.startswith('image'):
-            return False
+    if contents.is_binary():
+        return False
 
     # Search pattern specific filesize limit
     if pattern.get('max_filesize') is not None and 'filesize' in f:
@@ -258,115 +750,116 @@ def search_file (pattern, f, module_key):
             logger.debug("File ignored by {} because it exceeded search pattern filesize limit: {}".format(module_key, f['fn']))
             return False
 
-    # Search by file name (glob)
-    if pattern.get('fn') is not None:
-        if fnmatch.fnmatch(f['fn'], pattern['fn']):
+    # Search by file name (glob / regex)
+    if fn_matched is None:
+        fn_matched = False
+        if pattern.get('fn') is not None and fnmatch.fnmatch(f['fn'], pattern['fn']):
             fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
-
-    # Search by file name (regex)
-    if pattern.get('fn_re') is not None:
-        if re.match( pattern['fn_re'], f['fn']):
+        if pattern.get('fn_re') is not None and re.match( pattern['fn_re'], f['fn']):
             fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
+    if fn_matched and not has_contents_pattern:
+        return True
+
+    # No need to read the file if the filename was also required and didn't match
+    if has_fn_pattern and not fn_matched:
+        return False
 
     # Search by file contents
-    if pattern.get('contents') is not None or pattern.get('contents_re') is not None:
+    if has_contents_pattern:
         if pattern.get('contents_re') is not None:
             repattern = re.compile(pattern['contents_re'])
         try:
-            with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as f:
-                l = 1
-                for line in f:
-                    # Search by file contents (string)
-                    if pattern.get('contents') is not None:
-                        if pattern['contents'] in line:
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Search by file contents (regex)
-                    elif pattern.get('contents_re') is not None:
-                        if re.search(repattern, line):
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Break if we've searched enough lines for this pattern
-                    if pattern.get('num_lines') and l >= pattern.get('num_lines'):
+            l = 1
+            for line in contents.iterlines():
+                # Search by file contents (string)
+                if pattern.get('contents') is not None:
+                    if pattern['contents'] in line:
+                        contents_matched = True
                         break
-                    l += 1
+                # Search by file contents (regex)
+                elif pattern.get('contents_re') is not None:
+                    if re.search(repattern, line):
+                        contents_matched = True
+                        break
+                # Break if we've searched enough lines for this pattern
+                if pattern.get('num_lines') and l >= pattern.get('num_lines'):
+                    break
+                l += 1
         except (IOError, OSError, ValueError, UnicodeDecodeError):
             if config.report_readerrors:
                 logger.debug("Couldn't read file when looking for output: {}".format(f['fn']))
                 return False
 
-    return fn_matched and contents_matched
+    return contents_matched
 
-def exclude_file(sp, f):
+def prep_exclude_patterns(sp):
+    """
+    Make sure that the special exclude_ search pattern keys are all
+    lists, and compile any regexes.
+    """
+    for k in ['exclude_fn', 'exclude_fn_re', 'exclude_contents', 'exclude_contents_re']:
+        if k in sp and not isinstance(sp[k], list):
+            sp[k] = [sp[k]]
+    if 'exclude_contents_re' in sp:
+        sp['exclude_contents_re'] = [re.compile(pat) for pat in sp['exclude_contents_re']]
+
+def exclude_file(sp, f, contents=None, fn_excluded=None):
     """
     Exclude discovered files if they match the special exclude_
-    search pattern keys
+    search pattern keys. Expects search patterns to have been
+    prepared with prep_exclude_patterns()
+    :param contents: Optional SearchFileContents to share read lines with search_file()
+    :param fn_excluded: Optional result of the exclude_fn / exclude_fn_re patterns,
+                        if already worked out by a FilenameMatcher
     """
-    # Make everything a list if it isn't already
-    for k in sp:
-        if k in ['exclude_fn', 'exclude_fn_re' 'exclude_contents', 'exclude_contents_re']:
-            if not isinstance(sp[k], list):
-                sp[k] = [sp[k]]
-
-    # Search by file name (glob)
-    if 'exclude_fn' in sp:
-        for pat in sp['exclude_fn']:
+    if fn_excluded is None:
+        fn_excluded = False
+        # Search by file name (glob)
+        for pat in sp.get('exclude_fn', []):
             if fnmatch.fnmatch(f['fn'], pat):
-                return True
-
-    # Search by file name (regex)
-    if 'exclude_fn_re' in sp:
-        for pat in sp['exclude_fn_re']:
+                fn_excluded = True
+        # Search by file name (regex)
+        for pat in sp.get('exclude_fn_re', []):
             if re.match( pat, f['fn']):
-                return True
+                fn_excluded = True
+    if fn_excluded:
+        return True
 
     # Search the contents of the file
     if 'exclude_contents' in sp or 'exclude_contents_re' in sp:
-        # Compile regex patterns if we have any
-        if 'exclude_contents_re' in sp:
-            sp['exclude_contents_re'] = [re.compile(pat) for pat in sp['exclude_contents_re']]
-        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
-            for line in fh:
-                if 'exclude_contents' in sp:
-                    for pat in sp['exclude_contents']:
-                        if pat in line:
-                            return True
-                if 'exclude_contents_re' in sp:
-                    for pat in sp['exclude_contents_re']:
-                        if re.search(pat, line):
-                            return True
+        if contents is None:
+            contents = SearchFileContents(os.path.join(f['root'], f['fn']))
+        for line in contents.iterlines():
+            if 'exclude_contents' in sp:
+                for pat in sp['exclude_contents']:
+                    if pat in line:
+                        return True
+            if 'exclude_contents_re' in sp:
+                for pat in sp['exclude_contents_re']:
+                    if re.search(pat, line):
+                        return True
     return False
 
 def data_sources_tofile ():
-    fn = 'multiqc_sources.{}'.format(config.data_format_extensions[config.data_format])
-    with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
-        if config.data_format == 'json':
-            jsonstr = json.dumps(data_sources, indent=4, ensure_ascii=False)
-            print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
-        elif config.data_format == 'yaml':
-            yaml.dump(data_sources, f, default_flow_style=False)
-        else:
-            lines = [['Module', 'Section', 'Sample Name', 'Source']]
-            for mod in data_sources:
-                for sec in data_sources[mod]:
-                    for s_name, source in data_sources[mod][sec].items():
-                        lines.append([mod, sec, s_name, source])
-            body = '\n'.join(["\t".join(l) for l in lines])
-            print( body.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+    data_sources = get_state().data_sources
+    if config.data_format in ['json', 'yaml']:
+        fn = 'multiqc_sources.{}'.format(config.data_format_extensions[config.data_format])
+        with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+            if config.data_format == 'json':
+                jsonstr = json.dumps(data_sources, indent=4, ensure_ascii=False)
+                print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+            else:
+                yaml.dump(data_sources, f, default_flow_style=False)
+    else:
+        rows = ( [mod, sec, s_name, source] for mod in data_sources for sec in data_sources[mod] for s_name, source in data_sources[mod][sec].items() )
+        util_functions.write_data_table(['Module', 'Section', 'Sample Name', 'Source'], rows, 'multiqc_sources')
 
 def save_htmlid(html_id, skiplint=False):
     """ Take a HTML ID, sanitise for HTML, check for duplicates and save.
     Returns sanitised, unique ID """
-    global html_ids
-    global lint_errors
+    html_ids = get_state().html_ids
+    lint_errors = get_state().lint_errors
+    lint = config.lint and not skiplint
 
     # Trailing whitespace
     html_id_clean = html_id.strip()
@@ -382,55 +875,84 @@ def save_htmlid(html_id, skiplint=False):
     html_id_clean = re.sub('[^a-zA-Z0-9_-]+', '_', html_id_clean)
 
     # Validate if linting
-    if config.lint and not skiplint:
-        modname = ''
-        codeline = ''
-        callstack = inspect.stack()
-        for n in callstack:
-            if 'multiqc/modules/' in n[1] and 'base_module.py' not in n[1]:
-                callpath = n[1].split('multiqc/modules/',1)[-1]
-                modname = '>{}< '.format(callpath)
-                codeline = n[4][0].strip()
-                break
-    if config.lint and not skiplint and html_id != html_id_clean:
+    if lint and html_id != html_id_clean:
+        modname, codeline = lint_callsite()
         errmsg = "LINT: {}HTML ID was not clean ('{}' -> '{}') ## {}".format(modname, html_id, html_id_clean, codeline)
         logger.error(errmsg)
         lint_errors.append(errmsg)
 
-    # Check for duplicates
-    i = 1
-    html_id_base = html_id_clean
-    while html_id_clean in html_ids:
-        html_id_clean = '{}-{}'.format(html_id_base, i)
-        i += 1
-        if config.lint and not skiplint:
-            errmsg = "LINT: {}HTML ID was a duplicate ({}) ## {}".format(modname, html_id_clean, codeline)
-            logger.error(errmsg)
-            lint_errors.append(errmsg)
-
-    # Remember and return
-    html_ids.append(html_id_clean)
-    return html_id_clean
+    # Check for duplicates, then remember and return
+    html_id_unique = html_ids.add_unique(html_id_clean)
+    if lint and html_id_unique != html_id_clean:
+        modname, codeline = lint_callsite()
+        errmsg = "LINT: {}HTML ID was a duplicate ({}) ## {}".format(modname, html_id_unique, codeline)
+        logger.error(errmsg)
+        lint_errors.append(errmsg)
+    return html_id_unique
+
+def lint_callsite():
+    """ Find the module file and line of code that called us, for lint error messages.
+    Only used when there is an error to report, as walking the stack is slow """
+    frame = inspect.currentframe()
+    while frame is not None:
+        fn = frame.f_code.co_filename
+        if 'multiqc/modules/' in fn and 'base_module.py' not in fn:
+            callpath = fn.split('multiqc/modules/',1)[-1]
+            codeline = linecache.getline(fn, frame.f_lineno).strip()
+            return '>{}< '.format(callpath), codeline
+        frame = frame.f_back
+    return '', ''
 
 
 def compress_json(data):
-    """ Take a Python data object. Convert to JSON and compress using lzstring """
-    json_string = json.dumps(data).encode('utf-8', 'ignore').decode('utf-8')
-    json_string = sanitise_json(json_string)
-    x = lzstring.LZString()
-    return x.compressToBase64(json_string)
+    """ Take a Python data object. Convert to JSON and compress using config.data_compression """
+    return compress_string(dump_json(data))
 
-def sanitise_json(json_string):
+def compress_plot_data(plot_data):
+    """
+    Compress the plot data for the report. Returns the compressed JSON for all plots,
+    plus a dict of plot ID: compressed JSON for plots that are compressed on their own.
+    Once the plot data is larger than config.plot_data_chunk_min_size, every plot is
+    compressed separately so that the browser only decompresses plots as they are shown.
     """
-    The Python json module uses a bunch of values which are valid JavaScript
-    but invalid JSON. These crash the browser when parsing the JSON.
-    Nothing in the MultiQC front-end uses these values, so instead we just
-    do a find-and-replace for them and switch them with `null`, which works fine.
-
-    Side effect: Any string values that include the word "Infinity"
-    (case-sensitive) will have it switched for "null". Hopefully that doesn't happen
-    a lot, otherwise we'll have to do this in a more complicated manner.
+    plot_json = OrderedDict((pid, dump_json(pdata)) for pid, pdata in plot_data.items())
+    min_size = config.plot_data_chunk_min_size
+    if min_size is None or sum(len(j) for j in plot_json.values()) < min_size:
+        # Same JSON as dumping the whole dict at once
+        json_string = '{' + ', '.join('{}: {}'.format(dump_json(pid), j) for pid, j in plot_json.items()) + '}'
+        return compress_string(json_string), OrderedDict()
+    logger.debug("Compressing data for {} plots separately".format(len(plot_json)))
+    return compress_string('{}'), OrderedDict((pid, compress_string(j)) for pid, j in plot_json.items())
+
+def compress_string(json_string):
+    """ Compress a JSON string using config.data_compression """
+    codec = compression_codecs.get(config.data_compression)
+    if codec is None:
+        logger.warning("Unknown data_compression '{}', using lzstring".format(config.data_compression))
+        config.data_compression = 'lzstring'
+        codec = compression_codecs['lzstring']
+    return codec(json_string)
+
+def dump_json(data):
     """
-    json_string = re.sub(r'\bNaN\b', 'null', json_string)
-    json_string = re.sub(r'\b-?Infinity\b', 'null', json_string)
-    return json_string
+    Convert a Python data object to JSON in a single pass. NaN and Infinity are valid
+    JavaScript but invalid JSON, so they are written as `null` instead.
+    """
+    json_string = simplejson.dumps(data, ignore_nan=True, namedtuple_as_object=False)
+    return json_string.encode('utf-8', 'ignore').decode('utf-8')
+
+def compress_lzstring(json_string):
+    """ Compress a string with lzstring, decompressed with LZString.decompressFromBase64() in the report """
+    x = lzstring.LZString()
+    return x.compressToBase64(json_string)
+
+def compress_zlib(json_string):
+    """ Compress a string with zlib (deflate), decompressed with mqc_inflate() in the report """
+    return base64.b64encode(zlib.compress(json_string.encode('utf-8'))).decode('ascii')
+
+# Ways to compress the plot and table data embedded in the report (config.data_compression).
+# Each needs a matching decoder in mqc_decompress_json() in the report JavaScript.
+compression_codecs = {
+    'lzstring': compress_lzstring,
+    'zlib': compress_zlib,
+}
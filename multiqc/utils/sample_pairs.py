@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+""" MultiQC helper for modules that report metrics for pairs of samples, such as relatedness """
+
+from __future__ import print_function
+from collections import OrderedDict
+import io
+import json
+import logging
+import numpy as np
+import os
+import yaml
+
+from multiqc.plots import scatter
+from multiqc.utils import config, util_functions
+
+logger = logging.getLogger(__name__)
+
+class SamplePairs(object):
+    """
+    Metrics for every pair of samples, kept in NumPy arrays rather than in a dict
+    for each pair. Each sample name is stored once and each pair as two indices
+    into the list of samples, so cohorts with thousands of samples (and millions
+    of pairs) stay small.
+
+    Add blocks of rows with add_rows() while reading the files, then call finish().
+    After that, the pairs are in the `a` and `b` arrays of sample indices, the
+    metrics are in `columns` and plots / tables can be made with matrix(),
+    per_sample() and scatter_data().
+    """
+
+    # Number of lines for modules to read from a file before calling add_rows()
+    block_size = 100000
+
+    def __init__(self):
+        self.samples = list()
+        self.a = None
+        self.b = None
+        self.columns = OrderedDict()
+        self._sample_idx = dict()
+        self._blocks = list()
+
+    def __len__(self):
+        if self.a is None:
+            return sum(len(block[0]) for block in self._blocks)
+        return len(self.a)
+
+    def sample_index(self, s_name):
+        """ Index of a sample name in self.samples, adding it if it's new """
+        try:
+            return self._sample_idx[s_name]
+        except KeyError:
+            self._sample_idx[s_name] = len(self.samples)
+            self.samples.append(s_name)
+            return self._sample_idx[s_name]
+
+    def add_rows(self, s_a, s_b, columns):
+        """
+        Add a block of pairs of samples.
+        :param s_a: List with the name of the first sample of each pair
+        :param s_b: List with the name of the second sample of each pair
+        :param columns: Dict of metric name: list or array with a value for each
+                        pair. Metrics that aren't numbers are kept as they are.
+        """
+        a = np.array([self.sample_index(s_name) for s_name in s_a], dtype=np.int64)
+        b = np.array([self.sample_index(s_name) for s_name in s_b], dtype=np.int64)
+        block_columns = dict()
+        for k, values in columns.items():
+            try:
+                block_columns[k] = np.asarray(values, dtype=float)
+            except (TypeError, ValueError):
+                block_columns[k] = np.asarray(values, dtype=object)
+            if k not in self.columns:
+                self.columns[k] = None
+        self._blocks.append((a, b, block_columns))
+
+    def finish(self, is_ignore_sample=None):
+        """
+        Join the blocks of pairs once all files have been read. If a pair of
+        samples was added more than once, the last one is kept.
+        :param is_ignore_sample: Optional function to call with each sample name.
+                                 Pairs with a sample that it returns True for are removed.
+        """
+        a = np.concatenate([block[0] for block in self._blocks] or [np.zeros(0, dtype=np.int64)])
+        b = np.concatenate([block[1] for block in self._blocks] or [np.zeros(0, dtype=np.int64)])
+        keep = np.ones(len(a), dtype=bool)
+        if is_ignore_sample is not None and len(self.samples) > 0:
+            ignored = np.array([is_ignore_sample(s_name) for s_name in self.samples], dtype=bool)
+            keep &= ~(ignored[a] | ignored[b])
+        rows = np.flatnonzero(keep)
+
+        # Pairs are the same either way round. Find the last row for each pair.
+        pair_keys = np.minimum(a[rows], b[rows]) * len(self.samples) + np.maximum(a[rows], b[rows])
+        last = np.unique(pair_keys[::-1], return_index=True)[1]
+        rows = np.sort(rows[len(rows) - 1 - last])
+        if len(rows) < len(a):
+            logger.debug("Removed {} ignored or duplicate sample pairs".format(len(a) - len(rows)))
+
+        self.a = a[rows]
+        self.b = b[rows]
+        for k in self.columns:
+            values = [ block[2].get(k) for block in self._blocks ]
+            numeric = all(v is None or v.dtype != object for v in values)
+            for i, block in enumerate(self._blocks):
+                if values[i] is None:
+                    # Metric missing from this block
+                    values[i] = np.full(len(block[0]), np.nan if numeric else None, dtype=float if numeric else object)
+            self.columns[k] = np.concatenate(values).astype(float if numeric else object)[rows]
+        self._blocks = None
+        self._sample_idx = None
+
+    def column(self, k):
+        """ Array of the values of one metric for each pair, or None if no pairs have it """
+        return self.columns.get(k)
+
+    def pair_names(self, sep):
+        """ Generator with the name of each pair: the two sample names joined by sep """
+        for i, j in zip(self.a.tolist(), self.b.tolist()):
+            yield '{}{}{}'.format(self.samples[i], sep, self.samples[j])
+
+    def matrix(self, k, fill=np.nan, diagonal=np.nan):
+        """
+        Square matrix of one metric for every pair of samples, for a heatmap.
+        :param k: Metric name
+        :param fill: Value for pairs of samples that have no data
+        :param diagonal: Value for each sample paired with itself
+        :return: Alphabetically sorted sample names, and a 2D NumPy array
+        """
+        used = np.unique(np.concatenate([self.a, self.b]))
+        order = used[np.argsort([self.samples[i] for i in used], kind='stable')]
+        pos = np.zeros(len(self.samples), dtype=np.int64)
+        pos[order] = np.arange(len(order))
+        values = np.full((len(order), len(order)), fill, dtype=float)
+        values[pos[self.a], pos[self.b]] = self.columns[k].astype(float)
+        values[pos[self.b], pos[self.a]] = self.columns[k].astype(float)
+        values[np.diag_indices(len(order))] = diagonal
+        return [self.samples[i] for i in order], values
+
+    def per_sample(self, k, func=np.fmax, ignore=None):
+        """
+        Summarise one metric over all of the pairs that each sample is in.
+        :param k: Metric name
+        :param func: NumPy ufunc to reduce the values with. Default: np.fmax (highest value)
+        :param ignore: Optional value to skip, eg. a placeholder for missing data
+        :return: Dict with sample names as keys
+        """
+        values = self.columns[k].astype(float)
+        if ignore is not None:
+            values = np.where(values == ignore, np.nan, values)
+        result = np.full(len(self.samples), np.nan)
+        func.at(result, self.a, values)
+        func.at(result, self.b, values)
+        return { self.samples[i]: float(result[i]) for i in np.flatnonzero(~np.isnan(result)) }
+
+    def scatter_data(self, x, y, sep, colours=None, max_points=None):
+        """
+        Data for scatter.plot() with a point for each pair of samples. Once there
+        are more than max_points pairs, the points are thinned out with
+        scatter.grid_thin_indices() before any dicts are made for them.
+        :param x: Metric name for the x axis
+        :param y: Metric name for the y axis
+        :param sep: String to join the sample names of each pair with
+        :param colours: Optional array with a colour for each pair
+        :param max_points: Default: config.sample_pairs_max_points
+        :return: Dict of pair name: {'x', 'y', 'color'}
+        """
+        if max_points is None:
+            max_points = config.sample_pairs_max_points
+        rows = np.arange(len(self.a))
+        if max_points is not None and len(rows) > max_points:
+            groups = None
+            if colours is not None:
+                groups = np.unique(colours.astype(str), return_inverse=True)[1]
+            rows = scatter.grid_thin_indices(self.columns[x], self.columns[y], max_points, groups)
+            logger.debug("Showing {} of {} sample pairs in scatter plot".format(len(rows), len(self.a)))
+        data = OrderedDict()
+        xvals = self.columns[x][rows].tolist()
+        yvals = self.columns[y][rows].tolist()
+        for n, i in enumerate(rows.tolist()):
+            name = '{}{}{}'.format(self.samples[self.a[i]], sep, self.samples[self.b[i]])
+            data[name] = { 'x': xvals[n], 'y': yvals[n] }
+            if colours is not None:
+                data[name]['color'] = colours[i]
+        return data
+
+    def write_data_file(self, fn, sep):
+        """
+        Write the pairs to a file in the multiqc_data directory, with a row for each
+        pair. Like util_functions.write_data_file(), but written one pair at a time
+        rather than from a dict of every pair. Does nothing if config.data_dir is not set.
+        :param fn: Desired filename. Directory and extension are added automatically.
+        :param sep: String to join the sample names of each pair with
+        """
+        if config.data_dir is None:
+            return
+        columns = [ (k, col.tolist()) for k, col in self.columns.items() ]
+
+        if config.data_format not in ['json', 'yaml']:
+            # Convert a column at a time, with None for missing values
+            columns = [ [None if v is None or v != v else v for v in col] for k, col in columns ]
+            header = ['Sample'] + list(self.columns.keys())
+            util_functions.write_data_table(header, zip(self.pair_names(sep), *columns), fn)
+            return
+
+        def rows():
+            for n, name in enumerate(self.pair_names(sep)):
+                yield name, OrderedDict([ (k, col[n]) for k, col in columns if col[n] is not None and col[n] == col[n] ])
+
+        fn = '{}.{}'.format(fn, config.data_format_extensions[config.data_format])
+        with io.open(os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+            if config.data_format == 'json':
+                f.write('{')
+                for n, (name, row) in enumerate(rows()):
+                    f.write('{}\n    {}: {}'.format(',' if n > 0 else '', json.dumps(name, ensure_ascii=False), json.dumps(row, ensure_ascii=False)))
+                f.write('\n}\n')
+            else:
+                for name, row in rows():
+                    yaml.dump({ name: dict(row) }, f, default_flow_style=False)
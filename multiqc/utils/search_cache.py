@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+""" MultiQC code to cache file search results between runs """
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import sqlite3
+
+from multiqc import config
+logger = config.logger
+
+def get_cache_dir():
+    """ Directory for files cached between MultiQC runs """
+    if config.cache_dir is not None:
+        return config.cache_dir
+    return os.path.join(config.output_dir, 'multiqc_cache')
+
+def fingerprint(*args):
+    """ Hash of everything that can change the result of a file search """
+    fp = json.dumps([config.version] + list(args), default=str)
+    return hashlib.sha1(fp.encode('utf-8')).hexdigest()
+
+class SearchCache(object):
+    """
+    SQLite store of file search results, keyed on the path, size and
+    modification time of each file. All results are stored against a
+    fingerprint of the search patterns and ignore settings - if that
+    changes, the cache is emptied and every file is searched again.
+
+    The whole cache is loaded up front, so that get() can be called from
+    search worker threads. set() and close() must only be called from
+    the main thread.
+    """
+
+    def __init__(self, cache_fn, fp):
+        self.cache_fn = cache_fn
+        self.fp = fp
+        self.files = dict()
+        self.new_files = list()
+        self.conn = None
+        try:
+            cache_dir = os.path.dirname(cache_fn)
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            self.conn = sqlite3.connect(cache_fn, timeout=30)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, file_matched INTEGER, matched_keys TEXT)')
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != fp:
+                if row is not None:
+                    logger.debug("Search patterns have changed, clearing file search cache: {}".format(cache_fn))
+                with self.conn:
+                    self.conn.execute('DELETE FROM files')
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fp,))
+            for path, size, mtime, file_matched, matched_keys in self.conn.execute('SELECT * FROM files'):
+                self.files[path] = (size, mtime, bool(file_matched), json.loads(matched_keys))
+            logger.debug("Loaded {} file search results from cache: {}".format(len(self.files), cache_fn))
+        except (sqlite3.Error, OSError, IOError, ValueError) as e:
+            logger.warning("Could not use file search cache, searching all files: {}".format(e))
+            self.close()
+            self.files = dict()
+
+    def get(self, path, size, mtime):
+        """ Return (file_matched, matched_keys) if we have a result for this file as it is now """
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == size and cached[1] == mtime:
+            return cached[2], list(cached[3])
+        return None
+
+    def set(self, path, size, mtime, file_matched, matched_keys):
+        """ Remember the search result for a file, saved when the cache is closed """
+        if self.conn is not None:
+            self.new_files.append((path, size, mtime, int(file_matched), json.dumps(matched_keys)))
+
+    def close(self):
+        """ Write new results to disk and close the database """
+        if self.conn is None:
+            return
+        try:
+            if len(self.new_files) > 0:
+                with self.conn:
+                    self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', self.new_files)
+                logger.debug("Saved {} new file search results to cache".format(len(self.new_files)))
+        except sqlite3.Error as e:
+            logger.warning("Could not save file search cache: {}".format(e))
+        finally:
+            self.conn.close()
+            self.conn = None
+            self.new_files = list()
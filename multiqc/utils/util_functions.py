@@ -3,6 +3,8 @@
 """ MultiQC Utility functions, used in a variety of places. """
 
 from __future__ import print_function
+from collections import OrderedDict
+import gzip
 import io
 import json
 import os
@@ -37,6 +39,16 @@ def robust_rmtree(path, logger=None, max_retries=10):
     shutil.rmtree(path)
 
 
+# JSON encoder class to handle lambda functions
+class MQCJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if callable(obj):
+            try:
+                return obj(1)
+            except:
+                return None
+        return json.JSONEncoder.default(self, obj)
+
 def write_data_file(data, fn, sort_cols=False, data_format=None):
     """ Write a data file to the report directory. Will not do anything
     if config.data_dir is not set.
@@ -49,51 +61,87 @@ def write_data_file(data, fn, sort_cols=False, data_format=None):
 
     if config.data_dir is not None:
 
-        # Add relevant file extension to filename
         if data_format is None:
             data_format = config.data_format
-        fn = '{}.{}'.format(fn, config.data_format_extensions[data_format])
-
-        # JSON encoder class to handle lambda functions
-        class MQCJSONEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if callable(obj):
-                    try:
-                        return obj(1)
-                    except:
-                        return None
-                return json.JSONEncoder.default(self, obj)
-
-        # Save file
-        with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
-            if data_format == 'json':
-                jsonstr = json.dumps(data, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
-                print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
-            elif data_format == 'yaml':
-                yaml.dump(data, f, default_flow_style=False)
-            else:
-                # Default - tab separated output
-                # Convert keys to strings
-                data = {str(k):v for k, v in data.items()}
-                # Get all headers
-                h = ['Sample']
-                for sn in sorted(data.keys()):
-                    for k in data[sn].keys():
-                        if type(data[sn][k]) is not dict and k not in h:
-                            h.append(str(k))
-                if sort_cols:
-                    h = sorted(h)
-
-                # Get the rows
-                rows = [ "\t".join(h) ]
-                for sn in sorted(data.keys()):
-                    # Make a list starting with the sample name, then each field in order of the header cols
-                    l = [str(sn)] + [ str(data[sn].get(k, '')) for k in h[1:] ]
-                    rows.append( "\t".join(l) )
-
-                body = '\n'.join(rows)
-
-                print( body.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+
+        if data_format in ['json', 'yaml']:
+            # Add relevant file extension to filename
+            fn = '{}.{}'.format(fn, config.data_format_extensions[data_format])
+            with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+                if data_format == 'json':
+                    jsonstr = json.dumps(data, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
+                    print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+                else:
+                    yaml.dump(data, f, default_flow_style=False)
+            return
+
+        # Table formats - a row for each sample
+        # Convert keys to strings
+        data = {str(k):v for k, v in data.items()}
+        samples = sorted(data.keys())
+        # Get all headers. Fields with a dict for a value are only kept in NDJSON.
+        keys = list()
+        seen = set()
+        for sn in samples:
+            for k, v in data[sn].items():
+                if k not in seen and (type(v) is not dict or data_format == 'ndjson'):
+                    seen.add(k)
+                    keys.append(k)
+        if sort_cols:
+            keys = sorted(keys, key=str)
+
+        if data_format == 'tsv':
+            # Keep values as they were, but missing ones empty
+            rows = ( [sn] + [ str(data[sn].get(k, '')) for k in keys ] for sn in samples )
+        else:
+            rows = ( [sn] + [ data[sn].get(k) for k in keys ] for sn in samples )
+        write_data_table(['Sample'] + [ str(k) for k in keys ], rows, fn, data_format)
+
+def write_data_table(header, rows, fn, data_format=None):
+    """ Write a table to the report directory, a row at a time.
+    Does not do anything if config.data_dir is not set.
+    :param: header - list of column names
+    :param: rows - iterable of lists of values, in the same order as header.
+            None is a missing value.
+    :param: fn - Desired filename. Directory and extension are added automatically.
+    :param: data_format - tsv, ndjson or parquet. Defaults to config.data_format.
+            json and yaml are written as NDJSON.
+    :return: None """
+
+    if config.data_dir is None:
+        return
+    if data_format is None:
+        data_format = config.data_format
+    if data_format not in ['tsv', 'ndjson', 'parquet']:
+        data_format = 'ndjson'
+    fn = os.path.join(config.data_dir, '{}.{}'.format(fn, config.data_format_extensions[data_format]))
+
+    if data_format == 'tsv':
+        with io.open (fn, 'w', encoding='utf-8', errors='ignore') as f:
+            f.write("\t".join(header) + "\n")
+            for row in rows:
+                f.write("\t".join([ '' if v is None else str(v) for v in row ]) + "\n")
+
+    elif data_format == 'ndjson':
+        # One JSON object per line, with fast gzip compression
+        with gzip.open (fn, 'wt', compresslevel=1, encoding='utf-8', errors='ignore') as f:
+            for row in rows:
+                record = OrderedDict([ (k, v) for k, v in zip(header, row) if v is not None ])
+                f.write(json.dumps(record, cls=MQCJSONEncoder, ensure_ascii=False) + "\n")
+
+    elif data_format == 'parquet':
+        # Optional dependency, checked for when MultiQC starts
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columns = list(zip(*rows)) or [ () for k in header ]
+        arrays = list()
+        for values in columns:
+            try:
+                arrays.append(pa.array(values))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+                # Mixed types - save as text
+                arrays.append(pa.array([ None if v is None else str(v) for v in values ], type=pa.string()))
+        pq.write_table(pa.Table.from_arrays(arrays, names=header), fn)
 
 def view_all_tags(ctx, param, value):
     """ List available tags and associated modules